@@ -12,18 +12,56 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-from typing import List
+from __future__ import annotations
+import importlib
+import time
+from typing import List, Literal
 from types import ModuleType
-from . import blank_chromium, calendar_chromium, calendar_firefox, calendar_native, chat_chromium, chat_firefox, chat_native, mail_chromium, mail_firefox, mail_native, blank_firefox
 from .lib import MEGABYTE, Context, TookLongTimeException
 from . import lib
 
+# Every gui-apps workload: a module experiments.<name> with get_version() and
+# run_experiment(ctx, do_baseline). They're only imported once a sweep runs them, since they
+# pull in pyautogui.
+WORKLOADS = [
+    "blank_chromium",
+    "blank_firefox",
+    "calendar_chromium",
+    "calendar_firefox",
+    "calendar_native",
+    "chat_chromium",
+    "chat_firefox",
+    "chat_native",
+    "mail_chromium",
+    "mail_firefox",
+    "mail_native",
+    "tabs_chromium",
+    "tabs_firefox",
+]
+
+def load_workload(name: str) -> ModuleType:
+    if name not in WORKLOADS:
+        raise Exception(f"no workload named {name}")
+    return importlib.import_module(f"{__name__}.{name}")
+
 class ExperimentParams:
-    def __init__(self, module: ModuleType, mems: List[int | None] = [None]) -> None:
-        self.module = module
+    """
+    workload: a name from WORKLOADS
+    mems: MemoryHigh values to sweep, loosest first
+    design: instead of mems, a list of lib.Constraints over several systemd properties, e.g.
+        lib.latin_hypercube([lib.Axis("MemoryHigh", MEMS), lib.Axis("MemorySwapMax", [None, 0]), lib.Axis("CPUQuota", [None, 100, 50])], 30)
+    """
+    def __init__(self, workload: str, mems: List[int | None] = [None], design: list[lib.Constraints] | None = None) -> None:
+        self.workload = workload
         self.mems = mems
+        self.design = design
+    @property
+    def module(self) -> ModuleType:
+        return load_workload(self.workload)
     def name(self) -> str:
-        return self.module.__name__.split('.')[-1]
+        return self.workload
+    def levels(self) -> list[lib.Constraints]:
+        return self.design if self.design is not None else [lib.Constraints(mem) for mem in self.mems]
 
 INIT_MEMORY = 2000 * MEGABYTE
 RATE = 0.9
@@ -33,38 +71,177 @@ MEMS = lib.decay(INIT_MEMORY, RATE, N)
 SAMPLES = 15
 # SAMPLES = 1
 DO_BASELINE=False
+# e.g. lib.SteadyState(tolerance=0.02, window=5, max_time=60) to end samples once memory is flat
+STEADY_STATE: lib.SteadyState | None = None
+# baselines measured by blank_* (and by DO_BASELINE samples) are kept here and reused by the other
+# browser workloads at the same level, e.g. lib.BaselineCache(revalidate_every=10); None: always
+# measure in-sample
+BASELINE_CACHE: lib.BaselineCache | None = None
+# break memory down by process role (browser, renderer, gpu, ...); see python -m experiments.analysis.roles
+PROCESS_ROLES = False
+# seconds between working set estimates (idle page tracking as root, workingset counters otherwise); None: off
+WORKING_SET_INTERVAL: float | None = None
+# "warm" or "cold" to start each browser sample on a fresh copy of a snapshot of the browser's profile
+# (kept in ~/.cache/experiments/profiles, copied to /dev/shm); None to use the profile in place
+PRISTINE_PROFILES: Literal["warm", "cold"] | None = None
+# "cold" to evict each app's binaries, libraries and profile from the page cache before it starts, "warm" to read
+# them all in first; startup_latency in results.json then measures that kind of start. None: leave the page cache alone
+START_MODE: lib.StartMode | None = None
+# serve a live view of the sweep on http://localhost:<port>/; None: off
+DASHBOARD_PORT: int | None = None
+# measure click-to-paint latency of the workloads' clicks (paint.ndjson, paint_latency_* in results.json)
+PAINT_LATENCY = False
+# the order run_all runs (experiment, level, sample) in, and how often it re-runs a reference cell to measure
+# drift over the night (see lib/schedule.py), e.g. lib.Schedule("blocked", seed=1, reference_every=20)
+SCHEDULE = lib.Schedule("sweep")
+# run the whole sweep once per swap backend, each into <output-dir>/swap-<backend>/ (needs passwordless sudo, see
+# lib/swap.py), e.g. [lib.Swapfile("/swap-experiments", 8 * lib.GIGABYTE), lib.Zram(8 * lib.GIGABYTE, "zstd"),
+# lib.Zswap(lib.Swapfile("/swap-experiments", 8 * lib.GIGABYTE), max_pool_percent=20)]; None: leave swap alone
+SWAP_BACKENDS: list[lib.SwapBackend] | None = None
+# run the harness (with its sampler and smaps-profiler) in its own slice with MemoryMin/MemoryLow/CPUWeight, with its
+# heap and hot libraries mlocked, and record its memory and pressure per sample (harness_* in results.json; see
+# lib/protect.py), e.g. lib.HarnessProtection(memory_min=256 * lib.MEBIBYTE, memory_low=lib.GIBIBYTE); None: off
+PROTECT_HARNESS: lib.HarnessProtection | None = None
 
 ALL_MEM: list[ExperimentParams] = [
-    ExperimentParams(blank_chromium, MEMS),
-    ExperimentParams(blank_firefox, MEMS),
-    ExperimentParams(calendar_chromium, MEMS),
-    ExperimentParams(calendar_firefox, MEMS),
-    ExperimentParams(calendar_native, MEMS),
-    ExperimentParams(chat_chromium, MEMS),
-    ExperimentParams(chat_firefox, MEMS),
-    ExperimentParams(chat_native, MEMS),
-    ExperimentParams(mail_chromium, MEMS),
-    ExperimentParams(mail_firefox, MEMS),
-    ExperimentParams(mail_native, MEMS),
+    ExperimentParams("blank_chromium", MEMS),
+    ExperimentParams("blank_firefox", MEMS),
+    ExperimentParams("calendar_chromium", MEMS),
+    ExperimentParams("calendar_firefox", MEMS),
+    ExperimentParams("calendar_native", MEMS),
+    ExperimentParams("chat_chromium", MEMS),
+    ExperimentParams("chat_firefox", MEMS),
+    ExperimentParams("chat_native", MEMS),
+    ExperimentParams("mail_chromium", MEMS),
+    ExperimentParams("mail_firefox", MEMS),
+    ExperimentParams("mail_native", MEMS),
 ]
 
-def run_all(experiments: list[ExperimentParams]=ALL_MEM) -> None:
-    with Context.from_module("classic") as top_ctx, top_ctx.get_child("out") as out_ctx:
-        for params in experiments:
-            with out_ctx.get_child(params.name()) as ex_ctx:
-                with ex_ctx.open("version", 'w') as f:
-                    f.write(params.module.get_version())
-                for (i, mem) in enumerate(params.mems):
-                    took_long_time = False
-                    with ex_ctx.get_child_with_mem(i, mem) as mem_ctx:
-                        for j in range(SAMPLES):
-                            with mem_ctx.get_child_with_sample(j) as sample_ctx:
-                                try:
-                                    params.module.run_experiment(sample_ctx, do_baseline=DO_BASELINE)
-                                except TookLongTimeException as e:
-                                    sample_ctx.logger.warning(f"Application took longer than {e.warn_time} seconds to exit. Refusing to reduce memory any more for this workload.")
-                                    took_long_time = True
-                                except Exception as e:
-                                    sample_ctx.logger.exception(e)
-                            if took_long_time:
-                                break
+# how memory scales with the number of open tabs (see lib/tabs.py for the tab counts and pages);
+# these take much longer than the others, so they aren't part of ALL_MEM
+TABS: list[ExperimentParams] = [
+    ExperimentParams("tabs_chromium", MEMS),
+    ExperimentParams("tabs_firefox", MEMS),
+]
+
+def configure(settings: lib.Settings) -> None:
+    """
+    Applies this module's tunables to a sweep's settings.
+    """
+    settings.steady_state = STEADY_STATE
+    settings.baselines = BASELINE_CACHE
+    settings.process_roles = PROCESS_ROLES
+    settings.working_set_interval = WORKING_SET_INTERVAL
+    if PRISTINE_PROFILES is not None:
+        settings.use_pristine_profiles(["chromium", "firefox"], PRISTINE_PROFILES)
+    settings.start_mode = START_MODE
+    settings.paint_latency = PAINT_LATENCY
+    if DASHBOARD_PORT is not None:
+        lib.serve_dashboard(DASHBOARD_PORT)
+
+def run_sample(params: ExperimentParams, sample_ctx: Context) -> bool:
+    """
+    Runs one sample. Returns True if the application took too long to exit, i.e. the workload
+    shouldn't be constrained any further.
+    """
+    try:
+        params.module.run_experiment(sample_ctx, do_baseline=DO_BASELINE)
+    except TookLongTimeException as e:
+        sample_ctx.logger.warning(f"Application took longer than {e.warn_time} seconds to exit. Refusing to reduce memory any more for this workload.")
+        return True
+    except Exception as e:
+        sample_ctx.logger.exception(e)
+    return False
+
+def run_cell(parent_ctx: Context, params: ExperimentParams, level: int, sample: int) -> bool:
+    """
+    Runs one sample of one level into parent_ctx/<experiment>/<level>/<sample>. Returns what
+    run_sample returns.
+    """
+    constraints = params.levels()[level]
+    with parent_ctx.get_child(params.name()) as ex_ctx:
+        if not ex_ctx.joinpath("version").exists():
+            with ex_ctx.open("version", 'w') as f:
+                f.write(params.module.get_version())
+        with ex_ctx.get_child_with_constraints(level, constraints) as mem_ctx:
+            with mem_ctx.get_child_with_sample(sample) as sample_ctx:
+                return run_sample(params, sample_ctx)
+
+def run_sweep(root_ctx: Context, experiments: list[ExperimentParams], schedule: lib.Schedule) -> None:
+    """
+    Runs every cell of the sweep into root_ctx/out, in the schedule's order.
+    """
+    with root_ctx.get_child("out") as out_ctx:
+        by_name = {params.name(): params for params in experiments}
+        levels = {name: len(params.levels()) for name, params in by_name.items()}
+        runs = schedule.runs(levels, SAMPLES)
+        references = lib.References(schedule, levels)
+        lib.metrics.plan({name: n * SAMPLES for name, n in levels.items()})
+        if references.cell is not None and schedule.reference_every is not None:
+            lib.metrics.plan({lib.DRIFT_DIR: len(runs) // schedule.reference_every + 2})
+        log = lib.ScheduleLog(root_ctx.base_path)
+        # runs not yet run or skipped, per experiment
+        remaining = {name: n * SAMPLES for name, n in levels.items()}
+        too_slow: dict[str, list[lib.Constraints]] = {name: [] for name in by_name}
+        skipped: set[tuple[str, int]] = set()
+
+        def run_reference(last: bool = False) -> None:
+            reference = references.due(last)
+            if reference is None:
+                return
+            lib.metrics.start_experiment(lib.DRIFT_DIR)
+            start = time.time()
+            with root_ctx.get_child(lib.DRIFT_DIR) as drift_ctx:
+                took_long_time = run_cell(drift_ctx, by_name[reference.experiment], reference.level, reference.sample)
+            log.write(reference, start, "too_slow" if took_long_time else "done")
+
+        for run in runs:
+            params = by_name[run.experiment]
+            constraints = params.levels()[run.level]
+            remaining[run.experiment] -= 1
+            if any(constraints.at_least_as_tight(c) for c in too_slow[run.experiment]):
+                if (run.experiment, run.level) not in skipped:
+                    skipped.add((run.experiment, run.level))
+                    with out_ctx.get_child(run.experiment) as ex_ctx:
+                        ex_ctx.logger.info(f"skipping {run.level:02d}: at least as constrained as a point where the application took too long to exit")
+            else:
+                run_reference()
+                lib.metrics.start_experiment(run.experiment)
+                start = time.time()
+                took_long_time = run_cell(out_ctx, params, run.level, run.sample)
+                log.write(run, start, "too_slow" if took_long_time else "done")
+                if took_long_time:
+                    too_slow[run.experiment].append(constraints)
+            if remaining[run.experiment] == 0:
+                lib.metrics.finish_experiment(run.experiment)
+        run_reference(last=True)
+        if references.cell is not None:
+            lib.metrics.finish_experiment(lib.DRIFT_DIR)
+
+def run_all(experiments: list[ExperimentParams]=ALL_MEM, schedule: lib.Schedule | None = None) -> None:
+    schedule = schedule if schedule is not None else SCHEDULE
+    if PROTECT_HARNESS is not None:
+        PROTECT_HARNESS.enter()
+    with Context.from_module("classic") as top_ctx:
+        configure(top_ctx.settings)
+        if PROTECT_HARNESS is not None:
+            # only here and in repair, where enter() ran; jobs aren't protected
+            top_ctx.settings.protection = PROTECT_HARNESS
+            PROTECT_HARNESS.write(top_ctx.joinpath("protection.json"))
+            for warning in PROTECT_HARNESS.warnings():
+                top_ctx.logger.warning(f"harness protection: {warning}")
+        if SWAP_BACKENDS is None:
+            run_sweep(top_ctx, experiments, schedule)
+            return
+        for backend in SWAP_BACKENDS:
+            with lib.ActiveSwap(backend) as swap, top_ctx.get_child(f"swap-{backend.name()}") as swap_ctx:
+                swap_ctx.logger.info(f"swap backend {backend.name()} set up")
+                swap.write(swap_ctx.joinpath("swap.json"))
+                top_ctx.settings.swap = swap
+                try:
+                    run_sweep(swap_ctx, experiments, schedule)
+                finally:
+                    top_ctx.settings.swap = None
+
+def run_tabs() -> None:
+    run_all(TABS)
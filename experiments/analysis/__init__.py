@@ -0,0 +1,237 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Reads a result tree written by gui-apps or browser-bench:
+
+    <output-dir>/out/<experiment>/<NN>_<mem>_<human mem>/<NN>/
+
+and summarizes each (experiment, memory level). Memory numbers come from the cgroup.ndjson
+the harness writes next to each app; if a sample has a baseline.json, the baseline is subtracted.
+
+The tree can also be a .pack written by python -m experiments.pack; everything here reads
+through TreePath, which is either a Path or a PackPath.
+"""
+
+import argparse
+import json
+import re
+import statistics
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+from ..pack import Pack, PackPath
+
+LEVEL_RE = re.compile(r"^(\d+)_(None|\d+)_")
+SAMPLE_RE = re.compile(r"^\d+$")
+
+TreePath = Path | PackPath
+
+def open_tree(path: str) -> TreePath:
+    """
+    The root of a result tree given on the command line: a directory, or a .pack file.
+    """
+    if Path(path).is_file():
+        return Pack(Path(path)).root()
+    return Path(path)
+
+def parse_level(name: str) -> tuple[int, int | None] | None:
+    m = LEVEL_RE.match(name)
+    if m is None:
+        return None
+    return int(m.group(1)), None if m.group(2) == "None" else int(m.group(2))
+
+def read_ndjson(path: TreePath) -> list[dict[str, Any]]:
+    ret: list[dict[str, Any]] = []
+    try:
+        with path.open('r') as f:
+            for line in f:
+                try:
+                    ret.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break # truncated last line
+    except OSError:
+        pass
+    return ret
+
+def read_json(path: TreePath) -> Any:
+    try:
+        with path.open('r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+class Sample:
+    def __init__(self, experiment: str, level: int, mem: int | None, index: int, path: TreePath):
+        self.experiment = experiment
+        self.level = level
+        self.mem = mem
+        self.index = index
+        self.path = path
+
+    def results(self) -> dict[str, Any]:
+        ret = read_json(self.path / "results.json")
+        return ret if isinstance(ret, dict) else {}
+
+    def memory_series(self) -> list[dict[str, Any]]:
+        """
+        The sample's cgroup.ndjson. browser_bench keeps one app open for a whole level, so its
+        series lives in the level dir, and each sample gets the part of it between the click on
+        Start and the results (clock.json); without a clock.json, samples of a level can't be
+        told apart and get nothing.
+        """
+        series = read_ndjson(self.path / "cgroup.ndjson")
+        if series:
+            return series
+        clock = read_json(self.path / "clock.json")
+        if not isinstance(clock, dict) or "start" not in clock or "end" not in clock:
+            return []
+        return [r for r in read_ndjson(self.path.parent / "cgroup.ndjson") if r.get("t") is not None and clock["start"] <= r["t"] <= clock["end"]]
+
+    def baseline(self) -> int | None:
+        baseline = read_json(self.path / "baseline.json")
+        if isinstance(baseline, dict) and "memory_current" in baseline:
+            return int(baseline["memory_current"])
+        return None
+
+    def speedometer_score(self) -> float | None:
+        benchmark = read_json(self.path / "benchmark.json")
+        if isinstance(benchmark, dict) and isinstance(benchmark.get("Score"), dict) and "mean" in benchmark["Score"]:
+            return float(benchmark["Score"]["mean"])
+        return None
+
+    def metrics(self) -> dict[str, float]:
+        """
+        Scalar metrics of this sample: everything numeric in results.json, plus peak and final
+        (median of the last 5 seconds) memory, each with a baseline-corrected version if there is
+        a baseline, and for browser_bench the Speedometer score and wall time.
+        """
+        ret: dict[str, float] = {k: float(v) for k, v in self.results().items() if isinstance(v, (int, float))}
+        score = self.speedometer_score()
+        if score is not None:
+            ret["speedometer_score"] = score
+        try:
+            ret["python_time_ms"] = float((self.path / "python_time_ms").read_text())
+        except (OSError, ValueError):
+            pass
+        series = [r for r in self.memory_series() if r.get("memory_current") is not None]
+        if series:
+            end = series[-1]["t"]
+            ret["peak_memory"] = max(r["memory_current"] for r in series)
+            ret["final_memory"] = statistics.median(r["memory_current"] for r in series if end - r["t"] <= 5)
+            baseline = self.baseline()
+            if baseline is not None:
+                ret["baseline_memory"] = baseline
+                ret["peak_memory_corrected"] = ret["peak_memory"] - baseline
+                ret["final_memory_corrected"] = ret["final_memory"] - baseline
+        return ret
+
+def experiments_dir(root: TreePath) -> TreePath:
+    return root / "out" if (root / "out").is_dir() else root
+
+def children(path: TreePath) -> list[TreePath]:
+    """
+    The entries of a directory, by name.
+    """
+    ret: list[TreePath] = list(path.iterdir())
+    return sorted(ret, key=lambda child: child.name)
+
+def walk(root: TreePath) -> Iterator[Sample]:
+    for ex_dir in children(experiments_dir(root)):
+        if not ex_dir.is_dir():
+            continue
+        for level_dir in children(ex_dir):
+            level = parse_level(level_dir.name)
+            if level is None or not level_dir.is_dir():
+                continue
+            for sample_dir in children(level_dir):
+                if SAMPLE_RE.match(sample_dir.name) and sample_dir.is_dir():
+                    yield Sample(ex_dir.name, level[0], level[1], int(sample_dir.name), sample_dir)
+
+def find_sample(root: TreePath, experiment: str, mem: int | None, sample: int) -> Sample | None:
+    """
+    Looks up one sample by (experiment, memory limit, sample number), without walking the tree.
+    """
+    ex_dir = experiments_dir(root) / experiment
+    if not ex_dir.is_dir():
+        return None
+    for level_dir in ex_dir.iterdir():
+        level = parse_level(level_dir.name)
+        if level is not None and level[1] == mem and (level_dir / f"{sample:02d}").is_dir():
+            return Sample(experiment, level[0], mem, sample, level_dir / f"{sample:02d}")
+    return None
+
+class LevelSummary:
+    def __init__(self, experiment: str, level: int, mem: int | None, samples: list[dict[str, float]], constraints: str = ""):
+        self.experiment = experiment
+        self.level = level
+        self.mem = mem
+        self.samples = samples
+        # the level's directory name without its index: the memory limit and any other properties
+        self.constraints = constraints
+
+    def values(self, metric: str) -> list[float]:
+        return [s[metric] for s in self.samples if metric in s]
+
+    def median(self, metric: str) -> float | None:
+        values = self.values(metric)
+        return statistics.median(values) if values else None
+
+def summarize(root: TreePath) -> list[LevelSummary]:
+    levels: dict[tuple[str, int], LevelSummary] = {}
+    for sample in walk(root):
+        key = (sample.experiment, sample.level)
+        if key not in levels:
+            levels[key] = LevelSummary(sample.experiment, sample.level, sample.mem, [], sample.path.parent.name.split("_", 1)[1])
+        levels[key].samples.append(sample.metrics())
+    return [levels[key] for key in sorted(levels)]
+
+COLUMNS = ["peak_memory", "final_memory", "peak_memory_corrected", "final_memory_corrected", "exit_time", "startup_latency"]
+# counters from lib.accounting, shown with --resources; CPU times are converted to seconds
+RESOURCE_COLUMNS = ["cpu_usage_usec", "cpu_system_usec", "cpu_throttled_usec", "io_rbytes", "io_wbytes", "pswpin", "pswpout", "pgscan", "pgsteal"]
+
+def format_resource(column: str, value: float) -> str:
+    return f"{value / 1e6:.3f}" if column.endswith("_usec") else f"{value:.0f}"
+
+def write_resources(levels: list[LevelSummary], out: Any) -> None:
+    """
+    Per level, the median per sample and the total over all samples of each resource counter.
+    """
+    header = ["experiment", "level", "mem", "n"]
+    for c in RESOURCE_COLUMNS:
+        name = c.replace("_usec", "_s")
+        header += [f"{name}_median", f"{name}_total"]
+    out.write("\t".join(header) + "\n")
+    for level in levels:
+        fields = [level.experiment, str(level.level), str(level.mem), str(len(level.samples))]
+        for c in RESOURCE_COLUMNS:
+            values = level.values(c)
+            fields += ["", ""] if not values else [format_resource(c, statistics.median(values)), format_resource(c, sum(values))]
+        out.write("\t".join(fields) + "\n")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.analysis", description="Summarize a result tree per experiment and memory level")
+    parser.add_argument('result_directory', metavar='result-directory', help="a result directory or a .pack of one")
+    parser.add_argument('--resources', action='store_true', help="show CPU time, I/O and swapping per level instead of memory")
+    ns = parser.parse_args()
+    out = sys.stdout
+    levels = summarize(open_tree(ns.result_directory))
+    if ns.resources:
+        write_resources(levels, out)
+        return
+    out.write("\t".join(["experiment", "level", "mem", "n"] + COLUMNS) + "\n")
+    for level in levels:
+        medians = [level.median(c) for c in COLUMNS]
+        out.write("\t".join([level.experiment, str(level.level), str(level.mem), str(len(level.samples))] + ["" if m is None else f"{m:.0f}" if "memory" in c else f"{m:.3f}" for c, m in zip(COLUMNS, medians)]) + "\n")
@@ -0,0 +1,216 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Compares two result trees of the same workloads (e.g. before and after a browser upgrade).
+Levels are matched by experiment and constraints (the memory limit and, for levels from a
+design, the other properties), as in their directory names. For every metric at every matched level we
+report the medians, the relative change, Cliff's delta (the effect size: -1 if every B sample is
+lower than every A sample, 1 if every one is higher), a bootstrap confidence interval of the
+difference of medians, and a Mann-Whitney U test p-value. Levels with q < alpha after
+Benjamini-Hochberg correction over all tests are flagged.
+
+Separately, for each experiment we report the knee of each latency-like metric in A and B: the
+loosest memory limit where its median got KNEE_FACTOR times worse than without a limit.
+"""
+
+from __future__ import annotations
+import argparse
+import math
+import sys
+from typing import TYPE_CHECKING, Any
+from . import LevelSummary, TreePath, experiments_dir, open_tree, summarize
+
+# metric -> whether a higher value is better
+METRICS: dict[str, bool] = {
+    "peak_memory": False,
+    "final_memory": False,
+    "peak_memory_corrected": False,
+    "final_memory_corrected": False,
+    "exit_time": False,
+    "startup_latency": False,
+    "python_time_ms": False,
+    "speedometer_score": True,
+    "cpu_usage_usec": False,
+    "cpu_system_usec": False,
+    "io_rbytes": False,
+    "io_wbytes": False,
+    "pswpout": False,
+    "paint_latency_max": False,
+}
+# metrics a knee is looked for in
+KNEE_METRICS = ["exit_time", "startup_latency", "python_time_ms", "speedometer_score", "paint_latency_max"]
+KNEE_FACTOR = 1.5
+BOOTSTRAP = 2000
+
+# numpy is imported in the functions that use it: it takes longer to import than `ex compare --help` may take
+if TYPE_CHECKING:
+    import numpy as np
+
+def ranks(x: np.ndarray) -> np.ndarray:
+    """
+    1-based ranks, ties getting the average of their ranks.
+    """
+    import numpy as np
+    order = np.argsort(x, kind="mergesort")
+    sorted_x = x[order]
+    # first index of each run of equal values, and its length
+    starts = np.flatnonzero(np.r_[True, sorted_x[1:] != sorted_x[:-1]])
+    lengths = np.diff(np.r_[starts, len(x)])
+    average = starts + (lengths + 1) / 2
+    ret = np.empty(len(x))
+    ret[order] = np.repeat(average, lengths)
+    return ret
+
+def mann_whitney(a: np.ndarray, b: np.ndarray) -> tuple[float, float]:
+    """
+    Two-sided Mann-Whitney U test with the normal approximation and tie correction.
+    Returns (U of b, p).
+    """
+    import numpy as np
+    n_a, n_b = len(a), len(b)
+    r = ranks(np.concatenate([a, b]))
+    u = float(r[n_a:].sum() - n_b * (n_b + 1) / 2)
+    n = n_a + n_b
+    _values, counts = np.unique(np.concatenate([a, b]), return_counts=True)
+    tie = float((counts ** 3 - counts).sum()) / (n * (n - 1)) if n > 1 else 0
+    sigma = math.sqrt(n_a * n_b / 12 * ((n + 1) - tie))
+    if sigma == 0:
+        return u, 1.0
+    z = (u - n_a * n_b / 2) / sigma
+    return u, math.erfc(abs(z) / math.sqrt(2))
+
+def bootstrap_median_diff(a: np.ndarray, b: np.ndarray, n: int = BOOTSTRAP, confidence: float = 0.95, seed: int = 0) -> tuple[float, float]:
+    """
+    Percentile bootstrap interval of median(b) - median(a), all resamples at once.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    diffs = np.median(b[rng.integers(0, len(b), (n, len(b)))], axis=1) - np.median(a[rng.integers(0, len(a), (n, len(a)))], axis=1)
+    lo, hi = np.quantile(diffs, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return float(lo), float(hi)
+
+def benjamini_hochberg(p: np.ndarray) -> np.ndarray:
+    import numpy as np
+    if len(p) == 0:
+        return p
+    order = np.argsort(p)
+    scaled = p[order] * len(p) / np.arange(1, len(p) + 1)
+    q = np.minimum.accumulate(scaled[::-1])[::-1]
+    ret = np.empty(len(p))
+    ret[order] = np.minimum(q, 1)
+    return ret
+
+def compare_level(a: LevelSummary, b: LevelSummary, metric: str) -> dict[str, Any] | None:
+    import numpy as np
+    x = np.array(a.values(metric), dtype=float)
+    y = np.array(b.values(metric), dtype=float)
+    if len(x) < 2 or len(y) < 2:
+        return None
+    u, p = mann_whitney(x, y)
+    lo, hi = bootstrap_median_diff(x, y)
+    median_a, median_b = float(np.median(x)), float(np.median(y))
+    return {
+        "experiment": a.experiment,
+        "mem": a.mem,
+        "constraints": a.constraints,
+        "metric": metric,
+        "n_a": len(x),
+        "n_b": len(y),
+        "median_a": median_a,
+        "median_b": median_b,
+        "change": (median_b - median_a) / median_a if median_a else math.nan,
+        "cliffs_delta": 2 * u / (len(x) * len(y)) - 1,
+        "ci_low": lo,
+        "ci_high": hi,
+        "p": p,
+    }
+
+def knee(levels: list[LevelSummary], metric: str, higher_is_better: bool) -> int | None:
+    """
+    The memory limit of the loosest level (in sweep order) whose median is KNEE_FACTOR times
+    worse than the first (unconstrained) level's, or None if there is no such level.
+    """
+    medians: list[tuple[int | None, float]] = []
+    for level in sorted(levels, key=lambda level: level.level):
+        m = level.median(metric)
+        if m is not None:
+            medians.append((level.mem, m))
+    if not medians or not medians[0][1]:
+        return None
+    reference = medians[0][1]
+    for mem, m in medians[1:]:
+        if (m < reference / KNEE_FACTOR) if higher_is_better else (m > reference * KNEE_FACTOR):
+            return mem
+    return None
+
+def compare(root_a: TreePath, root_b: TreePath) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Returns (one row per experiment, level and metric; one row per experiment and knee metric).
+    """
+    import numpy as np
+    # several levels of a design can share a memory limit, so match on all of the constraints
+    levels_a = {(level.experiment, level.constraints): level for level in summarize(root_a)}
+    levels_b = {(level.experiment, level.constraints): level for level in summarize(root_b)}
+    rows: list[dict[str, Any]] = []
+    for key in sorted(levels_a.keys() & levels_b.keys(), key=lambda k: (k[0], levels_a[k].level)):
+        for metric in METRICS:
+            row = compare_level(levels_a[key], levels_b[key], metric)
+            if row is not None:
+                rows.append(row)
+    q = benjamini_hochberg(np.array([row["p"] for row in rows]))
+    for row, q_value in zip(rows, q):
+        row["q"] = float(q_value)
+    knees: list[dict[str, Any]] = []
+    for experiment in sorted({e for (e, _c) in levels_a} & {e for (e, _c) in levels_b}):
+        a = [level for (e, _c), level in levels_a.items() if e == experiment]
+        b = [level for (e, _c), level in levels_b.items() if e == experiment]
+        for metric in KNEE_METRICS:
+            if not any(level.values(metric) for level in a + b):
+                continue
+            knee_a, knee_b = knee(a, metric, METRICS[metric]), knee(b, metric, METRICS[metric])
+            knees.append({"experiment": experiment, "metric": metric, "knee_a": knee_a, "knee_b": knee_b, "moved": knee_a != knee_b})
+    return rows, knees
+
+def version(root: TreePath, experiment: str) -> str:
+    try:
+        return (experiments_dir(root) / experiment / "version").read_text().strip()
+    except OSError:
+        return "?"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.analysis.compare", description="Compare two result trees level by level")
+    parser.add_argument('a', help="baseline result directory (or .pack)")
+    parser.add_argument('b', help="result directory (or .pack) to compare against it")
+    parser.add_argument('--alpha', type=float, default=0.05, help="flag levels with a q-value below this")
+    ns = parser.parse_args()
+    root_a, root_b = open_tree(ns.a), open_tree(ns.b)
+    rows, knees = compare(root_a, root_b)
+    out = sys.stdout
+    for experiment in sorted({row["experiment"] for row in rows}):
+        a, b = version(root_a, experiment), version(root_b, experiment)
+        if a != b:
+            out.write(f"# {experiment}: {a} -> {b}\n")
+    columns = ["experiment", "mem", "constraints", "metric", "n_a", "n_b", "median_a", "median_b", "change", "cliffs_delta", "ci_low", "ci_high", "p", "q"]
+    out.write("\t".join(columns + ["flag"]) + "\n")
+    for row in rows:
+        fields = [row["experiment"], str(row["mem"]), row["constraints"], row["metric"], str(row["n_a"]), str(row["n_b"])]
+        fields += [f"{row[c]:.4g}" for c in columns[6:]]
+        out.write("\t".join(fields + ["*" if row["q"] < ns.alpha else ""]) + "\n")
+    out.write("\n" + "\t".join(["experiment", "metric", "knee_a", "knee_b", "moved"]) + "\n")
+    for k in knees:
+        out.write("\t".join([k["experiment"], k["metric"], str(k["knee_a"]), str(k["knee_b"]), "*" if k["moved"] else ""]) + "\n")
+
+if __name__ == "__main__":
+    main()
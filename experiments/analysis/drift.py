@@ -0,0 +1,134 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+How much a sweep drifted over its run, from the reference cell it re-ran every few runs (see
+lib/schedule.py), and each level corrected for it.
+
+Without --correct, prints the reference samples in the order they ran, with their time since
+the start of the sweep, and a least-squares line through them (change per hour, absolute and
+relative to the mean). With --correct, prints per level the median of the metric as measured
+and with the drift at the time each sample ran subtracted. The drift at a time is the reference
+value then (interpolated between the two nearest reference runs, or the nearest one before the
+first or after the last) minus the first reference value.
+"""
+
+import argparse
+import bisect
+import statistics
+import sys
+from typing import Any
+from ..lib.schedule import DRIFT_DIR, SCHEDULE_FILE
+from . import TreePath, open_tree, read_ndjson, walk
+
+class Drift:
+    def __init__(self, points: list[tuple[float, float]]):
+        # (wall clock time, reference value), in time order
+        self.points = sorted(points)
+
+    def at(self, t: float) -> float:
+        times = [p[0] for p in self.points]
+        k = bisect.bisect_left(times, t)
+        if k == 0:
+            value = self.points[0][1]
+        elif k == len(self.points):
+            value = self.points[-1][1]
+        else:
+            (t0, v0), (t1, v1) = self.points[k - 1], self.points[k]
+            value = v0 if t1 == t0 else v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+        return value - self.points[0][1]
+
+    def slope(self) -> float | None:
+        """
+        Least-squares change of the reference value per hour.
+        """
+        if len(self.points) < 2:
+            return None
+        hours = [t / 3600 for t, _v in self.points]
+        values = [v for _t, v in self.points]
+        mean_h = statistics.fmean(hours)
+        mean_v = statistics.fmean(values)
+        var = sum((h - mean_h) ** 2 for h in hours)
+        if var == 0:
+            return None
+        return sum((h - mean_h) * (v - mean_v) for h, v in zip(hours, values)) / var
+
+def run_times(root: TreePath) -> dict[tuple[bool, str, int, int], float]:
+    """
+    (reference, experiment, level, sample) -> when the run started, from schedule.ndjson. A cell
+    that ran more than once (e.g. repaired) keeps its last start.
+    """
+    return {(line["reference"], line["experiment"], line["level"], line["sample"]): line["start"] for line in read_ndjson(root / SCHEDULE_FILE)}
+
+def reference_points(root: TreePath, metric: str, times: dict[tuple[bool, str, int, int], float]) -> list[tuple[float, float, int]]:
+    """
+    (start time, value, reference sample number) of every reference sample that has the metric.
+    """
+    drift_root = root / DRIFT_DIR
+    if not drift_root.is_dir():
+        return []
+    ret: list[tuple[float, float, int]] = []
+    for sample in walk(drift_root):
+        t = times.get((True, sample.experiment, sample.level, sample.index))
+        value = sample.metrics().get(metric)
+        if t is not None and value is not None:
+            ret.append((t, value, sample.index))
+    return sorted(ret)
+
+def write_references(points: list[tuple[float, float, int]], out: Any) -> None:
+    start = points[0][0]
+    out.write("\t".join(["reference", "hours", "value", "drift"]) + "\n")
+    for t, value, index in points:
+        out.write("\t".join([str(index), f"{(t - start) / 3600:.3f}", f"{value:.3f}", f"{value - points[0][1]:.3f}"]) + "\n")
+    drift = Drift([(t - start, v) for t, v, _i in points])
+    slope = drift.slope()
+    mean = statistics.fmean(v for _t, v, _i in points)
+    if slope is not None:
+        relative = f"{slope / mean:.2%}" if mean else "n/a"
+        out.write(f"# trend: {slope:.3f} per hour ({relative} of the mean per hour)\n")
+
+def write_corrected(root: TreePath, metric: str, drift: Drift, times: dict[tuple[bool, str, int, int], float], out: Any) -> None:
+    levels: dict[tuple[str, int], tuple[int | None, list[float], list[float]]] = {}
+    for sample in walk(root):
+        value = sample.metrics().get(metric)
+        t = times.get((False, sample.experiment, sample.level, sample.index))
+        if value is None:
+            continue
+        _mem, raw, corrected = levels.setdefault((sample.experiment, sample.level), (sample.mem, [], []))
+        raw.append(value)
+        if t is not None:
+            corrected.append(value - drift.at(t))
+    out.write("\t".join(["experiment", "level", "mem", "n", metric, f"{metric}_corrected"]) + "\n")
+    for (experiment, level), (mem, raw, corrected) in sorted(levels.items()):
+        fields = [experiment, str(level), str(mem), str(len(raw)), f"{statistics.median(raw):.3f}", f"{statistics.median(corrected):.3f}" if corrected else ""]
+        out.write("\t".join(fields) + "\n")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.analysis.drift", description="Drift of a sweep's reference cell over time, and levels corrected for it")
+    parser.add_argument('result_directory', metavar='result-directory', help="a result directory or a .pack of one")
+    parser.add_argument('--metric', default="peak_memory", help="a metric of Sample.metrics(), e.g. peak_memory, exit_time, cpu_usage_usec (default: peak_memory)")
+    parser.add_argument('--correct', action='store_true', help="print per-level medians with and without the drift subtracted")
+    ns = parser.parse_args()
+    root = open_tree(ns.result_directory)
+    times = run_times(root)
+    points = reference_points(root, ns.metric, times)
+    if not points:
+        sys.exit(f"no reference samples with {ns.metric} (was the sweep run with a Schedule with reference_every?)")
+    if ns.correct:
+        write_corrected(root, ns.metric, Drift([(t, v) for t, v, _i in points]), times, sys.stdout)
+    else:
+        write_references(points, sys.stdout)
+
+if __name__ == "__main__":
+    main()
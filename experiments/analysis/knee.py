@@ -0,0 +1,239 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+How low MemoryHigh can go before each workload degrades, as a model fitted to its samples rather
+than read off the graphs.
+
+For each experiment and metric (exit time, startup latency, Speedometer score, ...) we fit a
+hinge: the metric is flat (`plateau`) down to the knee, and below it changes linearly with how far
+the limit is below the knee:
+
+    value(mem) = plateau + slope * max(0, knee - mem)
+
+Unconstrained samples count as far above any knee. The knee is picked from the tested limits and
+the midpoints between them by least squares, and plateau and slope by least squares given the knee.
+Confidence intervals come from a bootstrap that resamples the samples within each level.
+
+From the fit we also report the least memory that keeps `fraction` (e.g. 0.9) of the plateau's
+performance: value <= plateau / fraction for latencies, value >= plateau * fraction for scores.
+A limit below the lowest one tested is an extrapolation and flagged as such; "never" means the
+fit keeps that fraction at any limit.
+
+`--export` writes the models to a JSON file; load_models() reads it back into HingeModels, e.g. to
+pick the levels of the next sweep around the knees.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any
+import numpy as np
+from . import LevelSummary, open_tree, summarize
+from .compare import KNEE_METRICS, METRICS
+
+BOOTSTRAP = 1000
+FRACTION = 0.9
+CONFIDENCE = 0.95
+MODEL_VERSION = 1
+
+class HingeModel:
+    """
+    value(mem) = plateau + slope * max(0, knee - mem), mem in bytes (None: no limit).
+    """
+    def __init__(self, experiment: str, metric: str, higher_is_better: bool, knee: float, plateau: float, slope: float, n: int, lowest: int, extra: dict[str, Any] = {}):
+        self.experiment = experiment
+        self.metric = metric
+        self.higher_is_better = higher_is_better
+        self.knee = knee
+        self.plateau = plateau
+        self.slope = slope
+        self.n = n
+        # the tightest limit tested; predictions below it are extrapolations
+        self.lowest = lowest
+        # confidence intervals and the like, exported as-is
+        self.extra = dict(extra)
+
+    def predict(self, mem: int | float | None) -> float:
+        if mem is None:
+            return self.plateau
+        return self.plateau + self.slope * max(0.0, self.knee - mem)
+
+    def degrades(self) -> bool:
+        """
+        Whether the fitted slope makes the metric worse below the knee at all.
+        """
+        return self.slope < 0 if self.higher_is_better else self.slope > 0
+
+    def memory_for(self, fraction: float) -> float | None:
+        """
+        The least memory at which the model keeps `fraction` of the plateau's performance. None if
+        it keeps that much with any limit (e.g. the metric doesn't degrade).
+        """
+        if not self.degrades() or self.plateau == 0:
+            return None
+        target = self.plateau * fraction if self.higher_is_better else self.plateau / fraction
+        memory = self.knee - (target - self.plateau) / self.slope
+        return memory if memory > 0 else None
+
+    def to_json(self) -> dict[str, Any]:
+        return dict({
+            "experiment": self.experiment,
+            "metric": self.metric,
+            "higher_is_better": self.higher_is_better,
+            "knee": self.knee,
+            "plateau": self.plateau,
+            "slope": self.slope,
+            "n": self.n,
+            "lowest": self.lowest,
+        }, **self.extra)
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "HingeModel":
+        keys = ["experiment", "metric", "higher_is_better", "knee", "plateau", "slope", "n", "lowest"]
+        return HingeModel(**{k: data[k] for k in keys}, extra={k: v for k, v in data.items() if k not in keys})
+
+def level_data(levels: list[LevelSummary], metric: str) -> tuple[list[np.ndarray], list[float]]:
+    """
+    The metric's values per level, and each level's limit (inf for no limit), levels without values left out.
+    """
+    values: list[np.ndarray] = []
+    mems: list[float] = []
+    for level in sorted(levels, key=lambda level: level.level):
+        v = level.values(metric)
+        if v:
+            values.append(np.array(v, dtype=float))
+            mems.append(np.inf if level.mem is None else float(level.mem))
+    return values, mems
+
+def candidates(mems: list[float]) -> np.ndarray:
+    """
+    Knees to try: every tested limit but the lowest, and the midpoints between neighbouring ones.
+    """
+    tested = np.unique([m for m in mems if np.isfinite(m)])
+    if len(tested) < 2:
+        return np.array([])
+    return np.unique(np.concatenate([tested[1:], (tested[1:] + tested[:-1]) / 2]))
+
+def fit(x: np.ndarray, y: np.ndarray, knees: np.ndarray) -> tuple[float, float, float] | None:
+    """
+    Least-squares hinge over all candidate knees at once. Returns (knee, plateau, slope).
+    """
+    # one row per candidate knee
+    f = np.maximum(0.0, knees[:, None] - x[None, :])
+    f = np.where(np.isfinite(f), f, 0.0)
+    n = len(y)
+    f_mean = f.mean(axis=1)
+    y_mean = y.mean()
+    var = ((f - f_mean[:, None]) ** 2).sum(axis=1)
+    cov = ((f - f_mean[:, None]) * (y - y_mean)[None, :]).sum(axis=1)
+    ok = var > 0
+    if n < 3 or not ok.any():
+        return None
+    slope = np.where(ok, cov / np.where(ok, var, 1), 0.0)
+    plateau = y_mean - slope * f_mean
+    sse = ((y[None, :] - plateau[:, None] - slope[:, None] * f) ** 2).sum(axis=1)
+    sse = np.where(ok, sse, np.inf)
+    best = int(np.argmin(sse))
+    return float(knees[best]), float(plateau[best]), float(slope[best])
+
+def fit_levels(experiment: str, metric: str, levels: list[LevelSummary], fraction: float = FRACTION, bootstrap: int = BOOTSTRAP, confidence: float = CONFIDENCE, seed: int = 0) -> HingeModel | None:
+    higher_is_better = METRICS.get(metric, False)
+    values, mems = level_data(levels, metric)
+    knees = candidates(mems)
+    if len(knees) == 0:
+        return None
+    x = np.concatenate([np.full(len(v), m) for v, m in zip(values, mems)])
+    y = np.concatenate(values)
+    best = fit(x, y, knees)
+    if best is None:
+        return None
+    lowest = int(min(m for m in mems if np.isfinite(m)))
+    model = HingeModel(experiment, metric, higher_is_better, *best, len(y), lowest)
+    # resample within each level, so every level keeps its number of samples
+    rng = np.random.default_rng(seed)
+    fits: list[tuple[float, float | None]] = []
+    for _ in range(bootstrap):
+        y_star = np.concatenate([v[rng.integers(0, len(v), len(v))] for v in values])
+        refit = fit(x, y_star, knees)
+        if refit is not None:
+            m = HingeModel(experiment, metric, higher_is_better, *refit, len(y), lowest)
+            fits.append((m.knee, m.memory_for(fraction)))
+    q = [(1 - confidence) / 2, (1 + confidence) / 2]
+    extra: dict[str, Any] = {"fraction": fraction, "confidence": confidence, "bootstrap": len(fits)}
+    if fits:
+        extra["knee_ci"] = [float(k) for k in np.quantile([k for k, _m in fits], q)]
+        needed = [m for _k, m in fits if m is not None]
+        # in the other resamples, any limit keeps the fraction
+        extra["degrades_share"] = len(needed) / len(fits)
+        if needed:
+            extra["memory_for_ci"] = [float(m) for m in np.quantile(needed, q)]
+    memory = model.memory_for(fraction)
+    extra["memory_for"] = memory
+    extra["extrapolated"] = memory is not None and memory < lowest
+    model.extra = extra
+    return model
+
+def fit_all(levels: list[LevelSummary], metrics: list[str], fraction: float = FRACTION, bootstrap: int = BOOTSTRAP) -> list[HingeModel]:
+    ret: list[HingeModel] = []
+    for experiment in sorted({level.experiment for level in levels}):
+        mine = [level for level in levels if level.experiment == experiment]
+        for metric in metrics:
+            model = fit_levels(experiment, metric, mine, fraction, bootstrap)
+            if model is not None:
+                ret.append(model)
+    return ret
+
+def export(models: list[HingeModel], path: Path) -> None:
+    with open(path, 'w') as f:
+        json.dump({"version": MODEL_VERSION, "model": "hinge", "models": [model.to_json() for model in models]}, f, indent=2)
+
+def load_models(path: Path) -> dict[tuple[str, str], HingeModel]:
+    """
+    The models written by --export, by (experiment, metric).
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get("version") != MODEL_VERSION:
+        raise Exception(f"{path}: unknown model file version {data.get('version')}")
+    return {(m["experiment"], m["metric"]): HingeModel.from_json(m) for m in data["models"]}
+
+def number(value: float | None) -> str:
+    return "" if value is None else f"{value:.4g}"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.analysis.knee", description="Fit a hinge (knee) model of each metric against the memory limit, per experiment")
+    parser.add_argument('result_directory', metavar='result-directory', help="a result directory or a .pack of one")
+    parser.add_argument('--metric', action='append', help=f"metric to fit (repeatable; default: {', '.join(KNEE_METRICS)})")
+    parser.add_argument('--fraction', type=float, default=FRACTION, help="report the memory that keeps this fraction of unconstrained performance")
+    parser.add_argument('--bootstrap', type=int, default=BOOTSTRAP, help="bootstrap resamples for the confidence intervals")
+    parser.add_argument('--export', type=Path, help="write the models to this JSON file")
+    ns = parser.parse_args()
+    models = fit_all(summarize(open_tree(ns.result_directory)), ns.metric or KNEE_METRICS, ns.fraction, ns.bootstrap)
+    out = sys.stdout
+    columns = ["experiment", "metric", "n", "knee", "knee_low", "knee_high", "plateau", "slope_per_mb", f"mem_for_{ns.fraction:g}", "low", "high", "flag"]
+    out.write("\t".join(columns) + "\n")
+    for model in models:
+        knee_ci = model.extra.get("knee_ci", [None, None])
+        memory_ci = model.extra.get("memory_for_ci", [None, None])
+        flag = "extrapolated" if model.extra["extrapolated"] else "" if model.extra["memory_for"] is not None else "never"
+        fields = [model.experiment, model.metric, str(model.n), number(model.knee), number(knee_ci[0]), number(knee_ci[1]), number(model.plateau), number(model.slope * 1e6)]
+        fields += [number(model.extra["memory_for"]), number(memory_ci[0]), number(memory_ci[1]), flag]
+        out.write("\t".join(fields) + "\n")
+    if ns.export is not None:
+        export(models, ns.export)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Memory per browser process role (browser, renderer/content, gpu, network, ...) for each
+experiment and memory level, from samples recorded with Settings.process_roles on. Shows which
+kind of process gives up memory as MemoryHigh tightens.
+"""
+
+import argparse
+import statistics
+import sys
+from ..lib.roles import reclassify
+from . import Sample, open_tree, read_json, walk
+
+def final_roles(sample: Sample, metric: str, window: float = 5) -> dict[str, float] | None:
+    """
+    Median of `metric` (pss, rss or swap) per role over the last `window` seconds of the sample.
+    """
+    cmdlines = read_json(sample.path / "cmdlines.json")
+    if not isinstance(cmdlines, dict):
+        # browser_bench writes it to the level dir, next to the level's cgroup.ndjson
+        cmdlines = read_json(sample.path.parent / "cmdlines.json")
+    if not isinstance(cmdlines, dict):
+        return None
+    series = reclassify(sample.memory_series(), cmdlines)
+    if not series:
+        return None
+    end = series[-1][0]
+    per_role: dict[str, list[float]] = {}
+    for t, roles in series:
+        if end - t > window:
+            continue
+        for role, totals in roles.items():
+            per_role.setdefault(role, []).append(totals[metric])
+    return {role: statistics.median(values) for role, values in per_role.items()}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.analysis.roles", description="Memory per process role for each experiment and memory level")
+    parser.add_argument('result_directory', metavar='result-directory', help="a result directory or a .pack of one")
+    parser.add_argument('--metric', choices=["pss", "rss", "swap"], default="pss")
+    ns = parser.parse_args()
+    levels: dict[tuple[str, int, int | None], list[dict[str, float]]] = {}
+    for sample in walk(open_tree(ns.result_directory)):
+        roles = final_roles(sample, ns.metric)
+        if roles is not None:
+            levels.setdefault((sample.experiment, sample.level, sample.mem), []).append(roles)
+    all_roles = sorted({role for samples in levels.values() for roles in samples for role in roles})
+    out = sys.stdout
+    out.write("\t".join(["experiment", "level", "mem", "n"] + all_roles) + "\n")
+    for (experiment, level, mem), samples in sorted(levels.items(), key=lambda item: item[0][:2]):
+        medians = [statistics.median(s.get(role, 0) for s in samples) for role in all_roles]
+        out.write("\t".join([experiment, str(level), str(mem), str(len(samples))] + [f"{m:.0f}" for m in medians]) + "\n")
+
+if __name__ == "__main__":
+    main()
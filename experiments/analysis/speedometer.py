@@ -0,0 +1,212 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Speedometer subtests on the memory timeline of a browser-bench tree: which subtests the memory
+peaks happen in, and which subtests slow down most as MemoryHigh drops.
+
+Speedometer's JSON only has durations: per iteration, how long each subtest ("Suite/Subtest",
+sync plus async time) took. browser-bench writes a clock.json per sample with the monotonic
+times of the click on Start and of the results showing up, on the same clock as the "t" of the
+level's cgroup.ndjson. The subtests of each iteration are laid out back to back from the click,
+in the order Speedometer runs them, and stretched to fill the time until the results showed up
+(the time between subtests is spread over them). The windows are only as exact as that
+stretching, which is usually off by a few percent.
+
+For each window we take from cgroup.ndjson the peak of memory.current, how much memory grew
+during it (the peak minus memory.current at its start) and the memory pressure stall time (PSI
+"some" and "full", interpolated between samples). The first table shows, per level and subtest,
+the median duration, the slowdown against the experiment's loosest level, the median peak memory
+and growth, and the stall time per second of subtest. The second shows, per level, the subtest
+the sample's memory grew most in most often. Near a tight MemoryHigh the peak is the limit in
+every subtest, so that is ranked by growth rather than by peak, and where growth ties (memory
+flat at the limit) by the stall time.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+from typing import Any
+import numpy as np
+from . import Sample, open_tree, read_json, walk
+
+CLOCK_FILE = "clock.json"
+# metrics in Speedometer's JSON that aren't suites
+NOT_SUITES = {"Score", "Geomean", "Total"}
+
+class Window:
+    def __init__(self, iteration: int, subtest: str, start: float, end: float, duration_ms: float):
+        self.iteration = iteration
+        self.subtest = subtest
+        # monotonic seconds, like cgroup.ndjson's t
+        self.start = start
+        self.end = end
+        # as Speedometer measured it
+        self.duration_ms = duration_ms
+
+def subtests(benchmark: dict[str, Any]) -> list[tuple[str, list[float]]]:
+    """
+    (Suite/Subtest, duration in ms per iteration) in the order Speedometer ran them.
+    """
+    suites = [name for name in benchmark if "/" not in name and name not in NOT_SUITES and not name.startswith("Iteration-")]
+    ret: list[tuple[str, list[float]]] = []
+    for suite in suites:
+        for name, metric in benchmark.items():
+            if name.startswith(f"{suite}/") and name.count("/") == 1 and isinstance(metric, dict) and isinstance(metric.get("values"), list):
+                ret.append((name, [float(v) for v in metric["values"]]))
+    return ret
+
+def windows(benchmark: dict[str, Any], clock: dict[str, Any]) -> list[Window]:
+    """
+    Every subtest of every iteration on the monotonic clock, stretched to fill clock's start to end.
+    """
+    tests = subtests(benchmark)
+    iterations = min((len(values) for _name, values in tests), default=0)
+    total = sum(sum(values[:iterations]) for _name, values in tests) / 1000
+    span = clock["end"] - clock["start"]
+    if iterations == 0 or total <= 0 or span <= 0:
+        return []
+    scale = span / total
+    t = clock["start"]
+    ret: list[Window] = []
+    for i in range(iterations):
+        for name, values in tests:
+            length = values[i] / 1000 * scale
+            ret.append(Window(i, name, t, t + length, values[i]))
+            t += length
+    return ret
+
+class Timeline:
+    """
+    A sample's cgroup.ndjson as arrays, for looking up windows.
+    """
+    def __init__(self, series: list[dict[str, Any]]):
+        rows = [r for r in series if r.get("memory_current") is not None and r.get("t") is not None]
+        self.t = np.array([r["t"] for r in rows], dtype=float)
+        self.memory = np.array([r["memory_current"] for r in rows], dtype=float)
+        # cumulative stall microseconds; NaN where the kernel has no PSI
+        self.some = np.array([r.get("pressure_some_total") if r.get("pressure_some_total") is not None else np.nan for r in rows], dtype=float)
+        self.full = np.array([r.get("pressure_full_total") if r.get("pressure_full_total") is not None else np.nan for r in rows], dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    def peak(self, start: float, end: float) -> float:
+        """
+        The highest memory.current in the window, counting the values interpolated at its ends.
+        """
+        inside = self.memory[(self.t >= start) & (self.t <= end)]
+        ends = np.interp([start, end], self.t, self.memory)
+        return float(max(inside.max(initial=0), ends.max()))
+
+    def growth(self, start: float, end: float) -> float:
+        """
+        How far memory.current rose in the window above where it was at its start.
+        """
+        return self.peak(start, end) - float(np.interp(start, self.t, self.memory))
+
+    def stall_ms(self, totals: np.ndarray, start: float, end: float) -> float | None:
+        ok = ~np.isnan(totals)
+        if ok.sum() < 2:
+            return None
+        before, after = np.interp([start, end], self.t[ok], totals[ok])
+        return float(after - before) / 1000
+
+class Row:
+    def __init__(self) -> None:
+        self.durations: list[float] = []
+        self.peaks: list[float] = []
+        self.growths: list[float] = []
+        # stall ms per second of subtest
+        self.some: list[float] = []
+        self.full: list[float] = []
+
+def analyze(samples: list[Sample]) -> tuple[dict[tuple[str, int, int | None, str], Row], dict[tuple[str, int, int | None], dict[str, int]]]:
+    """
+    Returns (rows by (experiment, level, mem, subtest); per (experiment, level, mem), how often
+    each subtest was the one the sample's memory grew most in).
+    """
+    rows: dict[tuple[str, int, int | None, str], Row] = {}
+    peaks: dict[tuple[str, int, int | None], dict[str, int]] = {}
+    for sample in samples:
+        benchmark = read_json(sample.path / "benchmark.json")
+        clock = read_json(sample.path / CLOCK_FILE)
+        if not isinstance(benchmark, dict) or not isinstance(clock, dict):
+            continue
+        timeline = Timeline(sample.memory_series())
+        spans = windows(benchmark, clock)
+        if not spans or len(timeline) < 2:
+            continue
+        # (growth, stall ms, subtest) of the window memory grew most in
+        best: tuple[float, float, str] | None = None
+        for window in spans:
+            row = rows.setdefault((sample.experiment, sample.level, sample.mem, window.subtest), Row())
+            seconds = window.end - window.start
+            growth = timeline.growth(window.start, window.end)
+            row.durations.append(window.duration_ms)
+            row.peaks.append(timeline.peak(window.start, window.end))
+            row.growths.append(growth)
+            for totals, values in [(timeline.some, row.some), (timeline.full, row.full)]:
+                stall = timeline.stall_ms(totals, window.start, window.end)
+                if stall is not None and seconds > 0:
+                    values.append(stall / seconds)
+            some = timeline.stall_ms(timeline.some, window.start, window.end)
+            candidate = (growth, some if some is not None else 0, window.subtest)
+            if best is None or candidate[:2] > best[:2]:
+                best = candidate
+        if best is not None:
+            counts = peaks.setdefault((sample.experiment, sample.level, sample.mem), {})
+            counts[best[2]] = counts.get(best[2], 0) + 1
+    return rows, peaks
+
+def median(values: list[float]) -> str:
+    return f"{statistics.median(values):.3f}" if values else ""
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.analysis.speedometer", description="Speedometer subtests on the memory timeline of a browser-bench tree")
+    parser.add_argument('result_directory', metavar='result-directory', help="a result directory or a .pack of one")
+    parser.add_argument('--json', action='store_true', help="print the windows of every sample as ndjson instead")
+    ns = parser.parse_args()
+    samples = list(walk(open_tree(ns.result_directory)))
+    out = sys.stdout
+    if ns.json:
+        for sample in samples:
+            benchmark = read_json(sample.path / "benchmark.json")
+            clock = read_json(sample.path / CLOCK_FILE)
+            if isinstance(benchmark, dict) and isinstance(clock, dict):
+                for w in windows(benchmark, clock):
+                    out.write(json.dumps({"experiment": sample.experiment, "level": sample.level, "mem": sample.mem, "sample": sample.index, "iteration": w.iteration, "subtest": w.subtest, "start": w.start, "end": w.end, "duration_ms": w.duration_ms}) + "\n")
+        return
+    rows, peaks = analyze(samples)
+    if not rows:
+        sys.exit(f"no samples with benchmark.json, {CLOCK_FILE} and cgroup.ndjson")
+    # each experiment's loosest level, to compute slowdowns against
+    reference: dict[tuple[str, str], float] = {}
+    for (experiment, level, _mem, subtest), row in sorted(rows.items(), key=lambda item: item[0][1]):
+        if (experiment, subtest) not in reference and row.durations:
+            reference[(experiment, subtest)] = statistics.median(row.durations)
+    out.write("\t".join(["experiment", "level", "mem", "subtest", "n", "duration_ms", "slowdown", "peak_memory", "growth", "some_ms_per_s", "full_ms_per_s"]) + "\n")
+    for (experiment, level, mem, subtest), row in sorted(rows.items(), key=lambda item: item[0][:2]):
+        ref = reference.get((experiment, subtest))
+        slowdown = f"{statistics.median(row.durations) / ref:.3f}" if ref else ""
+        fields = [experiment, str(level), str(mem), subtest, str(len(row.durations)), median(row.durations), slowdown, f"{statistics.median(row.peaks):.0f}", f"{statistics.median(row.growths):.0f}", median(row.some), median(row.full)]
+        out.write("\t".join(fields) + "\n")
+    out.write("\n" + "\t".join(["experiment", "level", "mem", "growth_subtest", "samples", "of"]) + "\n")
+    for (experiment, level, mem), counts in sorted(peaks.items(), key=lambda item: item[0][:2]):
+        subtest, n = max(counts.items(), key=lambda item: item[1])
+        out.write("\t".join([experiment, str(level), str(mem), subtest, str(n), str(sum(counts.values()))]) + "\n")
+
+if __name__ == "__main__":
+    main()
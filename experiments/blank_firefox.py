@@ -12,7 +12,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import time
 from .lib import Context
 import subprocess
 
@@ -20,9 +19,9 @@ def get_version() -> str:
     return str(subprocess.run(["firefox", "--version"], capture_output=True).stdout)
 
 def run_experiment(ctx: Context, do_baseline: bool) -> None:
-    with ctx.monitor("firefox"), ctx.start_app(["firefox", "-P", "Experiments", "about:blank"]):
-        # wait 30 on the blank page
-        time.sleep(30)
+    with ctx.monitor("firefox"), ctx.start_app(ctx.browser_command("firefox", "about:blank")):
+        # wait 30 on the blank page (this is exactly the baseline the other browser workloads need)
+        ctx.measure_baseline("firefox", get_version())
         ctx.screenshot("app.png")
 
 def main() -> None:
@@ -12,25 +12,22 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
+import json
 import shutil
 import time
-import pyperclip
-from ..lib import Context, MEGABYTE, TookLongTimeException
+from pathlib import Path
+from ..lib import Browser, Context, MEGABYTE, TookLongTimeException
 from .. import lib
-import pyautogui
-from pyautogui import ImageNotFoundException
 import subprocess
+from typing import Literal
+from collections.abc import Iterable
 
 class ExperimentParams:
-    def __init__(self, name: str, exe: str, args: list[str], mems: list[int | None]):
+    def __init__(self, name: Browser, exe: str, mems: list[int | None]):
         self.name = name
         self.exe = exe
-        self.args = args
         self.mems = mems
 
-    def command(self) -> list[str]:
-        return [self.exe] + self.args
-
 URL = "https://browserbench.org/Speedometer3.1/"
 
 INIT_MEMORY = 2000 * MEGABYTE
@@ -43,56 +40,145 @@ SAMPLES = 15
 # SAMPLES = 1
 
 EXPERIMENTS = [
-    ExperimentParams("chromium", "chromium-browser", ["--hide-crash-restore-bubble", "--no-sandbox", URL], MEMS),
-    ExperimentParams("firefox", "firefox", ["-P", "Experiments", URL], MEMS),
+    ExperimentParams("chromium", "chromium-browser", MEMS),
+    ExperimentParams("firefox", "firefox", MEMS),
 ]
 
+# "warm" or "cold" to start the browser on a fresh copy of a snapshot of its profile at each level
+PRISTINE_PROFILES: Literal["warm", "cold"] | None = None
+
+# "cold" or "warm" start for the browser at each level (see START_MODE in experiments/__init__.py)
+START_MODE: lib.StartMode | None = None
+
+# wait for the Start button after each launch and record the time as startup_latency (always done with a START_MODE)
+STARTUP_LATENCY = False
+
+# serve a live view of the sweep on http://localhost:<port>/; None: off
+DASHBOARD_PORT: int | None = None
+
+# run the harness in its own cgroup with MemoryMin/MemoryLow/CPUWeight and its hot memory locked, and record its
+# memory per sample (see PROTECT_HARNESS in experiments/__init__.py); None: off
+PROTECT_HARNESS: lib.HarnessProtection | None = None
+
+class Buttons:
+    def __init__(self, browser: Browser):
+        self.start = lib.get_resource(f"start_button_{browser}.png")
+        self.details = lib.get_resource(f"details_button_{browser}.png")
+        self.copy_json = lib.get_resource(f"copy_json_button_{browser}.png")
+
+def configure(settings: lib.Settings) -> None:
+    """
+    Applies this module's tunables to a sweep's settings.
+    """
+    if PRISTINE_PROFILES is not None:
+        settings.use_pristine_profiles([params.name for params in EXPERIMENTS], PRISTINE_PROFILES)
+    settings.start_mode = START_MODE
+    if DASHBOARD_PORT is not None:
+        lib.serve_dashboard(DASHBOARD_PORT)
+
+def first_sighting(image: Path, timeout: float) -> tuple[tuple[int, int], float]:
+    """
+    Polls the screen for image like lib.locate_center. Also returns the monotonic time of the
+    screenshot it was first seen in, which is up to one search earlier than when the search ends.
+    """
+    from ..lib.gui import ImageNotFoundException
+    start = time.monotonic()
+    while True:
+        shot = time.monotonic()
+        try:
+            return lib.locate_center(image), shot
+        except ImageNotFoundException:
+            if shot - start > lib.sim.scaled(timeout):
+                raise
+
+def run_sample(params: ExperimentParams, sample_ctx: Context, buttons: Buttons) -> None:
+    from ..lib.gui import ImageNotFoundException, paste, pyautogui
+    try:
+        point = lib.locate_center(buttons.start, timeout=10)
+        with sample_ctx.monitor(params.name, check_if_running=False):
+            # on the clock of cgroup.ndjson's "t", so the subtests can be put on the memory
+            # timeline (see python -m experiments.analysis.speedometer)
+            clock = {"wall": time.time(), "start": time.monotonic()}
+            start = time.time()
+            pyautogui.click(*point)
+            point, clock["end"] = first_sighting(buttons.details, timeout=10*60)
+            end = time.time()
+        pyautogui.click(*point)
+        point = lib.locate_center(buttons.copy_json, timeout=10)
+        pyautogui.click(*point)
+        with sample_ctx.open("benchmark.json", 'w') as f:
+            f.write(paste())
+        with sample_ctx.open("python_time_ms", 'w') as f:
+            f.write(str((end - start) * 1000))
+        with sample_ctx.open("clock.json", 'w') as f:
+            json.dump(clock, f, indent=2)
+        lib.reload_page(params.name)
+    except ImageNotFoundException:
+        # in this case, we just break to close the browser, because we
+        # are ordinarily leaving the browser open between runs so we're hopeless
+        # to get an accurate next measurement without waiting arbitrarily long.
+        sample_ctx.logger.error("Image not found, perhaps the application is too unresponsive. Refusing to reduce memory any more for this workload.", exc_info=True)
+        raise
+    except Exception as e:
+        sample_ctx.logger.exception(e)
+
+def run_level(params: ExperimentParams, mem_ctx: Context, samples: Iterable[int], buttons: Buttons) -> bool:
+    """
+    Runs the given samples in one browser session at mem_ctx's memory limit. Returns False if
+    the browser got too unresponsive to go any lower.
+    """
+    from ..lib.gui import ImageNotFoundException
+    try:
+        lib.assert_not_running(params.name)
+        with mem_ctx.start_app(mem_ctx.browser_command(params.name, URL)) as app:
+            out = mem_ctx.base_path
+            try:
+                if START_MODE is not None or STARTUP_LATENCY:
+                    try:
+                        lib.locate_center(buttons.start, timeout=60)
+                    except ImageNotFoundException:
+                        mem_ctx.logger.error("Start button not found after launch, perhaps the application is too unresponsive. Refusing to reduce memory any more for this workload.", exc_info=True)
+                        raise
+                    mem_ctx.mark_interactive()
+                for j in samples:
+                    with mem_ctx.get_child_with_sample(j) as sample_ctx:
+                        out = sample_ctx.base_path
+                        run_sample(params, sample_ctx, buttons)
+            except ImageNotFoundException:
+                # while the browser is still up, to see what it was stuck on
+                app.forensics("image_not_found", out)
+                raise
+    except TookLongTimeException as e:
+        mem_ctx.logger.warning(f"Application took longer than {e.warn_time} seconds to exit. Refusing to reduce memory any more for this workload.")
+        return False
+    except ImageNotFoundException:
+        # same as ImageNotFoundException in run_sample; we may be thrashing so just end the experimentation here
+        return False
+    except Exception as e:
+        mem_ctx.logger.exception(e)
+    return True
+
 def main() -> None:
+    if PROTECT_HARNESS is not None:
+        PROTECT_HARNESS.enter()
     with Context.from_module(__name__) as top_ctx, top_ctx.get_child("out") as out_ctx:
+        configure(top_ctx.settings)
+        if PROTECT_HARNESS is not None:
+            # only here and in repair, where enter() ran; jobs aren't protected
+            top_ctx.settings.protection = PROTECT_HARNESS
+            PROTECT_HARNESS.write(top_ctx.joinpath("protection.json"))
+            for warning in PROTECT_HARNESS.warnings():
+                top_ctx.logger.warning(f"harness protection: {warning}")
+        lib.metrics.plan({params.name: len(params.mems) * SAMPLES for params in EXPERIMENTS})
         for params in EXPERIMENTS:
-            assert params.name == "chromium" or params.name == "firefox"
-            start_button = lib.get_resource(f"start_button_{params.name}.png")
-            details_button = lib.get_resource(f"details_button_{params.name}.png")
-            copy_json_button = lib.get_resource(f"copy_json_button_{params.name}.png")
+            lib.metrics.start_experiment(params.name)
+            buttons = Buttons(params.name)
             with out_ctx.get_child(params.name) as browser_ctx:
                 with browser_ctx.open("version", 'w') as f:
                     f.write(str(subprocess.run([params.exe, "--version"], capture_output=True).stdout))
 
                 for (i, mem) in enumerate(params.mems):
                     with browser_ctx.get_child_with_mem(i, mem) as mem_ctx:
-                        try:
-                            lib.assert_not_running(params.name)
-                            with mem_ctx.start_app(params.command()):
-                                for j in range(SAMPLES):
-                                    with mem_ctx.get_child_with_sample(j) as sample_ctx:
-                                        try:
-                                            point = lib.locate_center(start_button, timeout=10)
-                                            with sample_ctx.monitor(params.name, check_if_running=False):
-                                                start = time.time()
-                                                pyautogui.click(*point)
-                                                point = lib.locate_center(details_button, timeout=10*60)
-                                                end = time.time()
-                                            pyautogui.click(*point)
-                                            point = lib.locate_center(copy_json_button, timeout=10)
-                                            pyautogui.click(*point)
-                                            with sample_ctx.open("benchmark.json", 'w') as f:
-                                                f.write(pyperclip.paste())
-                                            with sample_ctx.open("python_time_ms", 'w') as f:
-                                                f.write(str((end - start) * 1000))
-                                            lib.reload_page(params.name)
-                                        except ImageNotFoundException:
-                                            # in this case, we just break to close the browser, because we
-                                            # are ordinarily leaving the browser open between runs so we're hopeless
-                                            # to get an accurate next measurement without waiting arbitrarily long.
-                                            sample_ctx.logger.error("Image not found, perhaps the application is too unresponsive. Refusing to reduce memory any more for this workload.", exc_info=True)
-                                            raise
-                                        except Exception as e:
-                                            sample_ctx.logger.exception(e)
-                        except TookLongTimeException as e:
-                            mem_ctx.logger.warning(f"Application took longer than {e.warn_time} seconds to exit. Refusing to reduce memory any more for this workload.")
-                            break
-                        except ImageNotFoundException:
-                            # same as ImageNotFoundException above; we may be thrashing so just end the experimentation here
+                        if not run_level(params, mem_ctx, range(SAMPLES), buttons):
                             break
-                        except Exception as e:
-                            mem_ctx.logger.exception(e)
+            lib.metrics.finish_experiment(params.name)
@@ -12,7 +12,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import time
 from ..lib import Context
 from .. import lib
 import subprocess
@@ -21,16 +20,18 @@ def get_version() -> str:
     return str(subprocess.run(["chromium-browser", "--version"], capture_output=True).stdout)
 
 def run_experiment(ctx: Context, do_baseline: bool) -> None:
-    init_page = "about:blank" if do_baseline else "calendar.google.com"
-    with ctx.monitor("chromium"), ctx.start_app(["chromium-browser", "--hide-crash-restore-bubble", "--no-sandbox", init_page]):
-        if do_baseline:
+    version = get_version()
+    measure_baseline = ctx.needs_baseline("chromium", version, do_baseline)
+    init_page = "about:blank" if measure_baseline else "calendar.google.com"
+    with ctx.monitor("chromium"), ctx.start_app(ctx.browser_command("chromium", init_page)):
+        if measure_baseline:
             # wait 30 on the blank page
-            time.sleep(30)
+            ctx.measure_baseline("chromium", version)
             ctx.screenshot("blank.png")
             # navigate to google calendar
             lib.load_page("chromium", "calendar.google.com")
         # wait another 30
-        time.sleep(30)
+        ctx.settle(30)
         ctx.screenshot("app.png")
 
 def main() -> None:
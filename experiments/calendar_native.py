@@ -13,7 +13,6 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 #!/usr/bin/python3
-import time
 from .lib import Context
 import subprocess
 
@@ -23,7 +22,7 @@ def get_version() -> str:
 def run_experiment(ctx: Context, do_baseline: bool) -> None:
     with ctx.monitor("gnome-calendar"), ctx.start_app(["gnome-calendar"]):
         # Run experiment
-        time.sleep(30)
+        ctx.settle(30)
         ctx.screenshot("app.png")
 
 def main() -> None:
@@ -12,8 +12,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import time
-import pyautogui
 from ..lib import Context
 from .. import lib
 import subprocess
@@ -23,21 +21,26 @@ def get_version() -> str:
 
 def run_experiment(ctx: Context, do_baseline: bool) -> None:
     chat_button = lib.get_resource("open_hw_chat_button.png")
-    init_page = "about:blank" if do_baseline else "mov.im/chat"
-    with ctx.monitor("chromium"), ctx.start_app(["chromium-browser", "--hide-crash-restore-bubble", "--no-sandbox", init_page]):
-        if do_baseline:
+    version = get_version()
+    measure_baseline = ctx.needs_baseline("chromium", version, do_baseline)
+    init_page = "about:blank" if measure_baseline else "mov.im/chat"
+    with ctx.monitor("chromium"), ctx.start_app(ctx.browser_command("chromium", init_page)):
+        if measure_baseline:
             # wait 30 on the blank page
-            time.sleep(30)
+            ctx.measure_baseline("chromium", version)
             ctx.screenshot("blank.png")
             # navigate to mov.im/chat
             lib.load_page("chromium", 'mov.im/chat')
-        time_remaining = 30
+        time_remaining = 30.0
         # try to click Open Hardware Chat
         point, t = lib.locate_center_time(chat_button, time_remaining)
         time_remaining -= t
-        pyautogui.click(*point)
+        if not measure_baseline:
+            # otherwise the browser started long ago
+            ctx.mark_interactive()
+        time_remaining -= ctx.click(point, "chat")
         # sit for the remaining time out of 30 seconds since navigating to chat
-        time.sleep(time_remaining)
+        ctx.settle(time_remaining)
         ctx.screenshot("app.png")
 
 def main() -> None:
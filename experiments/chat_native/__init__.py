@@ -12,8 +12,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import time
-import pyautogui
 from ..lib import Context
 from .. import lib
 import subprocess
@@ -24,13 +22,14 @@ def get_version() -> str:
 def run_experiment(ctx: Context, do_baseline: bool) -> None:
     chat_icon = lib.get_resource("open_hw_chat_icon.png")
     with ctx.monitor("dino"), ctx.start_app(["dino"]):
-        time_remaining = 30
+        time_remaining = 30.0
         # try to click Open Hardware Chat
         point, t = lib.locate_center_time(chat_icon, time_remaining)
         time_remaining -= t
-        pyautogui.click(*point)
+        ctx.mark_interactive()
+        time_remaining -= ctx.click(point, "chat")
         # sit for the remaining time out of 30 seconds since navigating to chat
-        time.sleep(time_remaining)
+        ctx.settle(time_remaining)
         ctx.screenshot("app.png")
 
 def main() -> None:
@@ -0,0 +1,73 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+One entry point (`ex <command> ...`) for all the tools. A command's module is only imported
+once it has been picked, so the offline commands (index, analyze, compare, ...) never load
+pyautogui and don't need a display. Everything after the command name goes to that tool's
+own argument parser.
+"""
+
+import argparse
+import importlib
+import sys
+from collections.abc import Callable
+
+# command -> (module, function, description)
+COMMANDS: dict[str, tuple[str, str, str]] = {
+    "run": ("experiments", "run_all", "run the gui-apps sweep"),
+    "tabs": ("experiments", "run_tabs", "run the tab scaling sweep"),
+    "bench": ("experiments.browser_bench", "main", "run the Speedometer sweep"),
+    "overhead": ("experiments.overhead", "main", "measure the harness's own overhead"),
+    "jobs": ("experiments.jobs", "main", "run the gui-apps sweep from a job queue"),
+    "repair": ("experiments.repair", "main", "rerun missing or broken cells of a sweep"),
+    "workloads": ("experiments.cli", "workloads", "list the gui-apps workloads"),
+    "index": ("experiments.cli", "index", "list the levels and samples in a result tree"),
+    "analyze": ("experiments.analysis", "main", "summarize a result tree per level"),
+    "roles": ("experiments.analysis.roles", "main", "memory per process role per level"),
+    "compare": ("experiments.analysis.compare", "main", "compare two result trees level by level"),
+    "speedometer": ("experiments.analysis.speedometer", "main", "Speedometer subtests on the memory timeline"),
+    "knee": ("experiments.analysis.knee", "main", "fit a knee model of each metric against the memory limit"),
+    "drift": ("experiments.analysis.drift", "main", "drift of a sweep's reference cell, and levels corrected for it"),
+    "pack": ("experiments.pack", "main", "pack a result tree into one indexed file"),
+}
+
+def workloads() -> None:
+    from . import ALL_MEM, TABS, WORKLOADS
+    swept = {params.name(): "gui-apps" for params in ALL_MEM} | {params.name(): "tabs" for params in TABS}
+    for name in WORKLOADS:
+        print(f"{name}\t{swept.get(name, '')}")
+
+def index() -> None:
+    from .analysis import open_tree, walk
+    parser = argparse.ArgumentParser(prog="ex index", description="List the levels and samples in a result tree")
+    parser.add_argument('result_directory', metavar='result-directory', help="a result directory or a .pack of one")
+    ns = parser.parse_args()
+    levels: dict[tuple[str, int], tuple[int | None, list[int]]] = {}
+    for sample in walk(open_tree(ns.result_directory)):
+        levels.setdefault((sample.experiment, sample.level), (sample.mem, []))[1].append(sample.index)
+    print("\t".join(["experiment", "level", "mem", "n", "samples"]))
+    for (experiment, level), (mem, samples) in sorted(levels.items()):
+        print("\t".join([experiment, str(level), str(mem), str(len(samples)), ",".join(str(i) for i in samples)]))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="ex", description="Memory experiments", epilog="\n".join(f"  {name:<10} {description}" for name, (_m, _f, description) in COMMANDS.items()), formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=COMMANDS, metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="arguments for the command (see ex <command> --help)")
+    ns = parser.parse_args()
+    module, function, _description = COMMANDS[ns.command]
+    # the tools parse sys.argv themselves
+    sys.argv = [f"ex {ns.command}"] + ns.args
+    run: Callable[[], None] = getattr(importlib.import_module(module), function)
+    run()
@@ -0,0 +1,284 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The gui-apps sweep (experiment x level x sample) as jobs in a SQLite queue next to the results,
+so that several workers can drain one sweep: one per machine sharing the output directory, or
+several on one machine on separate displays as long as they run different apps (a Monitor
+refuses to start while another copy of its app is running).
+
+    python -m experiments.jobs init <output-dir>        # create the tree and the queue
+    python -m experiments.jobs worker <output-dir>      # run jobs until there are none left
+    python -m experiments.jobs status <output-dir>
+
+A worker claims a job with a lease and renews it while the job runs; a job whose lease ran out
+(its worker died) goes to the next worker that asks, up to MAX_ATTEMPTS times. When an app takes
+too long to exit, the pending jobs of that experiment at least as constrained as that one are
+cancelled, like run_all stops going lower.
+
+Jobs are claimed in the order they were queued (sweep order, or shuffled with `init --order`,
+see lib/schedule.py) unless given a priority. What a job runs is worked out from the current
+ExperimentParams by (experiment, level), so don't change ALL_MEM, MEMS etc. while a queue is
+being drained.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any
+from .. import lib
+from ..lib import Context, RelPath
+from .. import ALL_MEM, TABS, ExperimentParams, SAMPLES, configure, run_sample
+
+QUEUE_FILE = "jobs.sqlite"
+LEASE = 300
+MAX_ATTEMPTS = 3
+# how long an idle worker waits before asking again while other workers still hold jobs
+POLL = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    experiment TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    sample INTEGER NOT NULL,
+    constraints TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending', -- pending, running, done, too_slow, failed, cancelled
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL,
+    UNIQUE (experiment, level, sample)
+)
+"""
+
+class Job:
+    def __init__(self, id: int, experiment: str, level: int, sample: int, attempts: int):
+        self.id = id
+        self.experiment = experiment
+        self.level = level
+        self.sample = sample
+        # including this one
+        self.attempts = attempts
+
+class JobQueue:
+    """
+    A durable queue in one SQLite file. Every method is its own transaction, so any number of
+    processes can share a queue. (SQLite over NFS needs working POSIX locks; on a filesystem
+    without them, run the workers on one machine.)
+    """
+    def __init__(self, path: Path):
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute(SCHEMA)
+
+    def enqueue(self, experiments: list[ExperimentParams], samples: int, schedule: lib.Schedule = lib.Schedule()) -> int:
+        """
+        Adds every sample of the sweep, in the schedule's order (reference runs aside).
+        """
+        by_name = {params.name(): params for params in experiments}
+        self.db.execute("BEGIN IMMEDIATE")
+        n = 0
+        for run in schedule.runs({name: len(params.levels()) for name, params in by_name.items()}, samples):
+            constraints = by_name[run.experiment].levels()[run.level]
+            n += self.db.execute(
+                "INSERT OR IGNORE INTO jobs (experiment, level, sample, constraints, updated) VALUES (?, ?, ?, ?, ?)",
+                (run.experiment, run.level, run.sample, json.dumps(constraints.to_json()), time.time())).rowcount
+        self.db.execute("COMMIT")
+        return n
+
+    def claim(self, worker: str, lease: float = LEASE, experiments: list[str] | None = None) -> Job | None:
+        """
+        Takes the next pending job, or a running one whose lease has run out.
+        """
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # jobs that ran out of leases too often won't work any better next time
+            self.db.execute("UPDATE jobs SET state = 'failed', updated = ? WHERE state = 'running' AND lease_until < ? AND attempts >= ?", (now, now, MAX_ATTEMPTS))
+            query = "SELECT id, experiment, level, sample, attempts + 1 FROM jobs WHERE (state = 'pending' OR (state = 'running' AND lease_until < ?))"
+            args: list[Any] = [now]
+            if experiments is not None:
+                query += f" AND experiment IN ({', '.join('?' for _ in experiments)})"
+                args += experiments
+            # rowid order is the order they were queued in
+            row = self.db.execute(query + " ORDER BY priority DESC, id LIMIT 1", args).fetchone()
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+            self.db.execute("UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? WHERE id = ?", (worker, now + lease, now, row[0]))
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return Job(*row)
+
+    def renew(self, job: Job, worker: str, lease: float = LEASE) -> None:
+        self.db.execute("UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'running'", (time.time() + lease, job.id, worker))
+
+    def finish(self, job: Job, worker: str, state: str) -> None:
+        self.db.execute("UPDATE jobs SET state = ?, lease_until = NULL, updated = ? WHERE id = ? AND worker = ?", (state, time.time(), job.id, worker))
+
+    def cancel_tighter(self, params: ExperimentParams, than: lib.Constraints) -> list[int]:
+        """
+        Cancels the pending jobs of an experiment that are at least as constrained as `than`.
+        Returns the levels that lost jobs.
+        """
+        levels = params.levels()
+        tighter = [i for i, constraints in enumerate(levels) if constraints.at_least_as_tight(than)]
+        if not tighter:
+            return []
+        marks = ", ".join("?" for _ in tighter)
+        args: list[object] = [params.name(), *tighter]
+        self.db.execute("BEGIN IMMEDIATE")
+        cancelled = [row[0] for row in self.db.execute(f"SELECT DISTINCT level FROM jobs WHERE experiment = ? AND state = 'pending' AND level IN ({marks})", args)]
+        self.db.execute(f"UPDATE jobs SET state = 'cancelled', updated = ? WHERE experiment = ? AND state = 'pending' AND level IN ({marks})", [time.time(), *args])
+        self.db.execute("COMMIT")
+        return cancelled
+
+    def busy(self, experiments: list[str] | None = None) -> bool:
+        """
+        Whether any job (of these experiments) is still pending or running.
+        """
+        query = "SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'running')"
+        args: list[Any] = []
+        if experiments is not None:
+            query += f" AND experiment IN ({', '.join('?' for _ in experiments)})"
+            args += experiments
+        count: int = self.db.execute(query, args).fetchone()[0]
+        return count > 0
+
+    def counts(self) -> dict[str, dict[str, int]]:
+        ret: dict[str, dict[str, int]] = {}
+        for experiment, state, n in self.db.execute("SELECT experiment, state, COUNT(*) FROM jobs GROUP BY experiment, state ORDER BY MIN(id)"):
+            ret.setdefault(experiment, {})[state] = n
+        return ret
+
+class Lease(threading.Thread):
+    """
+    Renews a job's lease in the background while it runs.
+    """
+    def __init__(self, path: Path, job: Job, worker: str, lease: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.job = job
+        self.worker = worker
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        # sqlite connections can't be shared between threads
+        queue = JobQueue(self.path)
+        while not self.stopped.wait(self.lease / 3):
+            queue.renew(self.job, self.worker, self.lease)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+def find_params(name: str) -> ExperimentParams:
+    for params in ALL_MEM + TABS:
+        if params.name() == name:
+            return params
+    raise Exception(f"no experiment named {name} in ALL_MEM or TABS")
+
+def init(root: Path, experiments: list[ExperimentParams], samples: int, schedule: lib.Schedule = lib.Schedule()) -> None:
+    Context.create("jobs", root, None).cleanup()
+    n = JobQueue(root / QUEUE_FILE).enqueue(experiments, samples, schedule)
+    print(f"queued {n} jobs in {root / QUEUE_FILE}")
+
+def work(root: Path, worker: str, experiments: list[str] | None = None, lease: float = LEASE) -> None:
+    # imported here because repair imports browser_bench and with it pyautogui, which needs a
+    # display; the other jobs commands don't
+    from ..repair import Cell, set_aside
+    queue = JobQueue(root / QUEUE_FILE)
+    logger = lib.get_logger(f"worker.{worker}", root, RelPath(f"worker_{worker}_log.txt"))
+    logger.addHandler(lib.metrics)
+    with Context(f"worker.{worker}", root, logger, None) as top_ctx, top_ctx.get_child("out") as out_ctx:
+        configure(top_ctx.settings)
+        while True:
+            job = queue.claim(worker, lease, experiments)
+            if job is None:
+                if not queue.busy(experiments):
+                    break
+                # other workers still hold jobs whose leases may run out
+                time.sleep(POLL)
+                continue
+            params = find_params(job.experiment)
+            constraints = params.levels()[job.level]
+            lib.metrics.start_experiment(job.experiment)
+            renewer = Lease(root / QUEUE_FILE, job, worker, lease)
+            renewer.start()
+            state = "failed"
+            try:
+                with out_ctx.get_child(job.experiment) as ex_ctx:
+                    if not ex_ctx.joinpath("version").exists():
+                        with ex_ctx.open("version", 'w') as f:
+                            f.write(params.module.get_version())
+                    level_dir = ex_ctx.joinpath(lib.level_name(job.level, constraints))
+                    if job.attempts > 1:
+                        # whatever the worker that lost this job left behind
+                        set_aside(level_dir, Cell(job.experiment, job.level, constraints, job.sample, ["lease expired"]))
+                    with ex_ctx.get_child_with_constraints(job.level, constraints) as mem_ctx:
+                        with mem_ctx.get_child_with_sample(job.sample) as sample_ctx:
+                            took_long_time = run_sample(params, sample_ctx)
+                    if took_long_time:
+                        for level in queue.cancel_tighter(params, constraints):
+                            ex_ctx.logger.info(f"skipping {level:02d}: at least as constrained as a point where the application took too long to exit")
+                state = "too_slow" if took_long_time else "done"
+            except KeyboardInterrupt:
+                # leave it to another worker
+                state = "pending"
+                raise
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                renewer.stop()
+                queue.finish(job, worker, state)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.jobs", description="Run the gui-apps sweep from a job queue with one or more workers")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("init", help="create an output directory with a queue of every sample of the sweep")
+    p.add_argument('output_dir', metavar='output-dir')
+    p.add_argument('--experiments', help="comma-separated experiment names (default: everything in ALL_MEM)")
+    p.add_argument('--samples', type=int, default=SAMPLES)
+    p.add_argument('--order', choices=lib.schedule.ORDERS, default="sweep", help="order to queue the jobs in (see lib/schedule.py)")
+    p.add_argument('--seed', type=int, default=0, help="seed for --order random or blocked")
+    p = sub.add_parser("worker", help="run jobs until the queue is drained")
+    p.add_argument('output_dir', metavar='output-dir')
+    p.add_argument('--id', default=f"{socket.gethostname()}-{os.getpid()}", help="worker name (default: host-pid)")
+    p.add_argument('--experiments', help="only take jobs of these comma-separated experiments")
+    p.add_argument('--lease', type=float, default=LEASE, help="seconds a job stays claimed without renewal")
+    p = sub.add_parser("status", help="count jobs by state")
+    p.add_argument('output_dir', metavar='output-dir')
+    ns = parser.parse_args()
+    root = Path(ns.output_dir)
+    if ns.command == "init":
+        experiments = ALL_MEM if ns.experiments is None else [find_params(name) for name in ns.experiments.split(",")]
+        init(root, experiments, ns.samples, lib.Schedule(ns.order, ns.seed))
+    elif ns.command == "worker":
+        work(root, ns.id, None if ns.experiments is None else ns.experiments.split(","), ns.lease)
+    else:
+        states = ["pending", "running", "done", "too_slow", "failed", "cancelled"]
+        out = sys.stdout
+        out.write("\t".join(["experiment"] + states) + "\n")
+        for experiment, counts in JobQueue(root / QUEUE_FILE).counts().items():
+            out.write("\t".join([experiment] + [str(counts.get(state, 0)) for state in states]) + "\n")
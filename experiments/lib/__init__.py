@@ -12,30 +12,82 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import logging
+from __future__ import annotations
+import json
 from pathlib import Path
-import importlib.resources as res
-import inspect
-import shutil
-from typing import IO, Any, Callable, Literal
-import subprocess
-from subprocess import Popen
+from typing import IO, TYPE_CHECKING, Any, Callable, Literal
 from signal import SIGINT, SIGTERM, SIGABRT, SIGKILL
-from types import ModuleType, TracebackType
 from contextlib import AbstractContextManager
 import sys
 import os
-from humanize import naturalsize
-import argparse
-from logging import Logger
 import time
-from pathspec import PathSpec
-import pyautogui
-from pyautogui import ImageNotFoundException
-import uuid
-from collections.abc import Sequence
 
-pyautogui.useImageNotFoundException(True)
+# Everything below is imported where it's used, and the names re-exported from the submodules
+# only once they're looked up (see __getattr__): importing experiments.lib is on the path of
+# every command, and the offline ones (ex index, analyze, compare, ...) need none of it.
+if TYPE_CHECKING:
+    from logging import Logger
+    from subprocess import Popen
+    from types import ModuleType, TracebackType
+    from .sampler import Collector as Collector, Sampler as Sampler, SteadyState as SteadyState
+    from .accounting import AccountingCollector as AccountingCollector, usage_delta as usage_delta
+    from .baseline import BaselineCache as BaselineCache
+    from .profiles import Browser as Browser, ProfileManager as ProfileManager, profile_dir as profile_dir, profile_hash as profile_hash
+    from .design import Axis as Axis, Constraints as Constraints, grid as grid, latin_hypercube as latin_hypercube
+    from .schedule import DRIFT_DIR as DRIFT_DIR, Order as Order, References as References, Schedule as Schedule, ScheduleLog as ScheduleLog
+    from .dashboard import metrics as metrics
+    from .startup import MappedFiles as MappedFiles, StartMode as StartMode, mapped_files as mapped_files
+    from .swap import ActiveSwap as ActiveSwap, NoSwap as NoSwap, SwapBackend as SwapBackend, Swapfile as Swapfile, Zram as Zram, Zswap as Zswap
+    from .protect import HarnessProtection as HarnessProtection
+    from .paint import PaintProbe
+    from . import accounting as accounting, baseline as baseline, cgroup as cgroup, dashboard as dashboard, design as design, forensics as forensics, profiles as profiles, protect as protect, sampler as sampler, schedule as schedule, sim as sim, startup as startup, swap as swap
+    serve_dashboard = dashboard.serve
+
+# name -> (submodule, attribute of it, or None for the submodule itself)
+LAZY: dict[str, tuple[str, str | None]] = {
+    **{name: ("sampler", name) for name in ["Collector", "Sampler", "SteadyState"]},
+    **{name: ("accounting", name) for name in ["AccountingCollector", "usage_delta"]},
+    "BaselineCache": ("baseline", "BaselineCache"),
+    **{name: ("profiles", name) for name in ["Browser", "ProfileManager", "profile_dir", "profile_hash"]},
+    **{name: ("design", name) for name in ["Axis", "Constraints", "grid", "latin_hypercube"]},
+    **{name: ("schedule", name) for name in ["DRIFT_DIR", "Order", "References", "Schedule", "ScheduleLog"]},
+    "metrics": ("dashboard", "metrics"),
+    "serve_dashboard": ("dashboard", "serve"),
+    **{name: ("startup", name) for name in ["MappedFiles", "StartMode", "mapped_files"]},
+    **{name: ("swap", name) for name in ["ActiveSwap", "NoSwap", "SwapBackend", "Swapfile", "Zram", "Zswap"]},
+    "HarnessProtection": ("protect", "HarnessProtection"),
+    **{name: (name, None) for name in ["accounting", "baseline", "cgroup", "dashboard", "design", "forensics", "profiles", "protect", "sampler", "schedule", "sim", "startup", "swap"]},
+}
+
+def __getattr__(name: str) -> Any:
+    if name not in LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    module, attribute = LAZY[name]
+    ret = importlib.import_module(f"{__name__}.{module}")
+    return ret if attribute is None else getattr(ret, attribute)
+
+class HarnessComponents:
+    """
+    Switches for the parts of the harness that run alongside the workload. Everything is on for
+    real sweeps; the overhead benchmark (experiments.overhead) turns them off one at a time to
+    see what each of them costs.
+    """
+    def __init__(self) -> None:
+        self.monitor = True
+        self.screenshots = True
+        self.logging = True
+        self.sampler = True
+        self.forensics = True
+
+    def set_all(self, on: bool) -> None:
+        self.monitor = on
+        self.screenshots = on
+        self.logging = on
+        self.sampler = on
+        self.forensics = on
+
+harness = HarnessComponents()
 
 class RelPath(Path):
     pass
@@ -45,7 +97,9 @@ def project_root() -> Path:
 
 # ChatGPT gave me this wonderful function which I then heavily modified
 def copy_project(output_base_dir: Path, src_dir: RelPath) -> None:
+    import shutil
     os.makedirs(output_base_dir/src_dir)
+    from pathspec import PathSpec
     root = project_root()
     with open2(root/".gitignore", 'r') as f:
         spec = PathSpec.from_lines("gitwildmatch", f)
@@ -67,6 +121,7 @@ class AlreadyRunningException(Exception):
     pass
 
 def assert_not_running(regex: str) -> None:
+    import subprocess
     res = subprocess.run(["pgrep", "-f", regex])
     if res.returncode == 0:
         raise AlreadyRunningException(f"A process matching {regex} is already running")
@@ -77,20 +132,21 @@ def assert_not_running(regex: str) -> None:
     
 def get_module(stack_distance: int = 0) -> ModuleType:
     # https://stackoverflow.com/a/1095621/3882118
+    import inspect
     frame = inspect.stack()[1 + stack_distance]
     module = inspect.getmodule(frame[0])
     assert(module is not None)
     return module
 
 def get_resource(filename: str) -> Path:
+    import importlib.resources as res
     module = get_module(1)
     return res.as_file(res.files(module).joinpath(filename)).__enter__()
 
-GEN_INFO = get_resource("gen-info.sh")
-
 def gen_info(out: Path) -> None:
+    import subprocess
     ensure_dir_exists(out.parent)
-    subprocess.run(["bash", str(GEN_INFO), str(out)])
+    subprocess.run(["bash", str(get_resource("gen-info.sh")), str(out)])
 
 
 chromium_reload_button = None
@@ -108,6 +164,7 @@ def get_reload_button(browser: Literal["chromium", "firefox"]) -> Path:
         return firefox_reload_button
     
 def reload_page(browser: Literal["chromium", "firefox"]) -> None:
+    from .gui import pyautogui
     point = locate_center(get_reload_button(browser))
     assert point is not None
     pyautogui.click(*point)
@@ -116,6 +173,7 @@ def reload_page(browser: Literal["chromium", "firefox"]) -> None:
     # pyautogui.moveRel(-10, -10)
 
 def load_page(browser: Literal["chromium", "firefox"], url: str) -> None:
+    from .gui import pyautogui
     if browser == "chromium":
         point = locate_center(get_reload_button("chromium"), timeout=10)
         assert point is not None
@@ -128,7 +186,14 @@ def load_page(browser: Literal["chromium", "firefox"], url: str) -> None:
     pyautogui.write(url, interval=0.1) # 600 CPM
     pyautogui.press('enter')
 
+# how each browser is launched, before the profile and page arguments
+BROWSER_COMMANDS: dict[Browser, list[str]] = {
+    "chromium": ["chromium-browser", "--hide-crash-restore-bubble", "--no-sandbox"],
+    "firefox": ["firefox"],
+}
+
 def start_monitor(regex: str, graph_out: Path, stdout_to_file: Path, check_if_running: bool = True) -> Popen[bytes]:
+    import subprocess
     if check_if_running:
         assert_not_running(regex)
     with open2(stdout_to_file, 'w') as f:
@@ -145,6 +210,7 @@ def human_mem_str(mem: int | None) -> str:
     if mem is None:
         return "nolimit"
     else:
+        from humanize import naturalsize
         return naturalsize(mem, True).replace(" ", "")
 
 KIBIBYTE: int = 1024
@@ -184,13 +250,22 @@ def decay2(start: int, end: int, rate: float) -> list[int | None]:
     ret.append(cur)
     return ret
 
+def level_name(i: int, constraints: Constraints) -> str:
+    """
+    Directory name of the i-th memory level of an experiment.
+    """
+    name = f"{i:02d}_{constraints.mem}_{human_mem_str(constraints.mem)}"
+    if constraints.properties:
+        name += f"_{constraints.name()}"
+    return name
+
 class Args:
     def __init__(self, output_dir: Path, mem: int | None):
         self.output_dir = output_dir
         self.mem = mem
 
 # ChatGPT goated
-def get_prog():
+def get_prog() -> str:
     main_module = sys.modules["__main__"]
     package = getattr(main_module, "__package__", None)
     if package:
@@ -200,6 +275,7 @@ def get_prog():
 
 
 def parse_sysargs_with_mem() -> Args:
+    import argparse
     parser = argparse.ArgumentParser(prog=get_prog())
     parser.add_argument('output_directory', metavar="output-directory")
     parser.add_argument('-m', '--memory-limit', type=int, default=None)
@@ -207,6 +283,7 @@ def parse_sysargs_with_mem() -> Args:
     return Args(ns.output_directory, ns.memory_limit)
 
 def parse_sysargs() -> Path:
+    import argparse
     parser = argparse.ArgumentParser(prog=get_prog())
     parser.add_argument('output_directory', metavar='output-directory')
     ns = parser.parse_args()
@@ -218,6 +295,9 @@ def format_exception(e: BaseException) -> str:
 # Returns (point, time_took) if image found within timeout, otherwise raises ImageNotFoundException.
 # If image is list, tries to find any one of the images.
 def locate_center_time(image: str | Path | list[str | Path], timeout: float, confidence: float = 0.9) -> tuple[tuple[int, int], float]:
+    from .gui import ImageNotFoundException, pyautogui
+    from . import sim
+    timeout = sim.scaled(timeout)
     if isinstance(image, list):
         start = time.time()
         while True:
@@ -248,8 +328,18 @@ def ensure_dir_exists(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 def get_logger(name: str, base: Path, file: RelPath = RelPath("log.txt")) -> Logger:
+    import logging
     ensure_dir_exists(base)
     logger = logging.getLogger(name)
+    if not harness.logging:
+        logger.disabled = True
+        return logger
+    logger.disabled = False
+    # a context for the same directory can be opened more than once (jobs, shuffled schedules);
+    # without this every line would be written once per time it was opened
+    for handler in [h for h in logger.handlers if isinstance(h, logging.StreamHandler)]:
+        handler.close()
+        logger.removeHandler(handler)
     # inspired by default format for Rust env_logger
     formatter = logging.Formatter("[%(asctime)s %(levelname)s %(name)s] %(message)s")
     # https://stackoverflow.com/a/11582124/3882118
@@ -267,6 +357,7 @@ def open2(path: Path, mode: str) -> IO[Any]:
         return open(path, mode)
 
 def build_smaps_profiler():
+    import subprocess
     subprocess.run(["cargo", "build", "--release", "--manifest-path", project_root() / "smaps-profiler" / "Cargo.toml", ])
 
 def create_experiment_files(base_path: Path):
@@ -286,26 +377,118 @@ def create_experiment_files(base_path: Path):
         f.write(cmdline)
     copy_project(base_path, RelPath("src"))
 
+# how often (seconds) App.stop checks whether the app has exited
+EXIT_POLL = 0.05
+
 class ExitTimeouts:
     def __init__(self, warn: float, term: float, abrt: float):
         self.warn = warn
         self.term = term
         self.abrt = abrt
 
+class Settings:
+    """
+    Options for a whole sweep. Every Context in a tree shares the same Settings object, so set
+    them on the top-level context before creating children.
+    """
+    def __init__(self) -> None:
+        from .startup import MappedFiles
+        # sample the app's cgroup this often (seconds)
+        self.sample_interval: float = 0.5
+        # if set, Context.settle ends a sample once memory is flat instead of sleeping out the budget
+        self.steady_state: SteadyState | None = None
+        # if set, browser workloads only sit on about:blank when this has no baseline for them yet
+        self.baselines: BaselineCache | None = None
+        # record memory per process role (browser, renderer, gpu, ...) in cgroup.ndjson
+        self.process_roles: bool = False
+        # estimate the app's working set every this many seconds into working_set.ndjson (None: off)
+        self.working_set_interval: float | None = None
+        # if a browser has a ProfileManager here, every sample starts it with a fresh copy of its profile
+        self.profiles: dict[Browser, ProfileManager] = {}
+        # "cold": evict the app's files from the page cache before every start; "warm": read them in first
+        self.start_mode: StartMode | None = None
+        # which files each program maps, recorded when it stops (only with a start_mode)
+        self.mapped_files = MappedFiles()
+        # record the app's CPU time, I/O and swapping (cpu.stat, io.stat, memory.stat) in results.json
+        self.resource_accounting: bool = True
+        # measure click-to-paint latency of the clicks workloads make through Context.click (see paint.py)
+        self.paint_latency: bool = False
+        # the swap backend the runs are under, if the sweep set one up (see swap.py)
+        self.swap: ActiveSwap | None = None
+        # if set, the harness runs in its own protected cgroup and each sample records its memory (see protect.py)
+        self.protection: HarnessProtection | None = None
+
+    def use_pristine_profiles(self, browsers: list[Browser], cache: Literal["warm", "cold"]) -> None:
+        """
+        Snapshots each browser's profile (if there's no snapshot yet) and makes every sample
+        start from a fresh copy of it. The browsers must not be running.
+        """
+        from .profiles import ProfileManager
+        for browser in browsers:
+            assert_not_running(browser)
+            self.profiles[browser] = ProfileManager(browser, cache=cache)
+            self.profiles[browser].ensure_snapshot()
+
+    def collectors(self, out: Path) -> list[Collector]:
+        """
+        The optional collectors the sampler of an app writing to `out` should run.
+        """
+        # imported here because the working set estimate needs numpy
+        from .roles import RoleCollector
+        from .workingset import WorkingSetCollector
+        ret: list[Collector] = []
+        if self.process_roles:
+            ret.append(RoleCollector(out))
+        if self.working_set_interval is not None:
+            ret.append(WorkingSetCollector(out, self.working_set_interval))
+        return ret
+
 class App(AbstractContextManager["App", None]):
-    def __init__(self, command: list[str], base_path: Path, logger: Logger, mem: int | None, exit_timeouts: ExitTimeouts = ExitTimeouts(20, 30, 40), custom_term_routine: Callable[["App"], None] | None = None):
+    def __init__(self, command: list[str], base_path: Path, logger: Logger, mem: int | None, exit_timeouts: ExitTimeouts = ExitTimeouts(20, 30, 40), custom_term_routine: Callable[["App"], None] | None = None, settings: Settings | None = None, results: dict[str, Any] | None = None, properties: dict[str, str] | None = None):
+        import shutil
+        import uuid
+        from subprocess import Popen
+        from . import sim
+        from .accounting import AccountingCollector
+        from .dashboard import metrics
+        from .sampler import Sampler
+        settings = settings if settings is not None else Settings()
+        properties = properties if properties is not None else {}
         self.unit_name = str(uuid.uuid1())
         """
         --wait causes systemd-run to block until the service completes. This is useful so that we can just wait() on this process rather than continuously polling the service with `systemctl --user is-active {self.unit_name}`.
         ExitType=cgroup causes the service to complete only when all child processes of the application complete. https://www.freedesktop.org/software/systemd/man/latest/systemd.service.html#ExitType=
         --collect "unload[s] the transient service" after it completes, so that it won't appear still in list-units. https://www.freedesktop.org/software/systemd/man/latest/systemd.service.html#ExitType=
         We need a service rather than a scope here, and the reason is that we want to be able to send SIGTERM to just the main process to exit gracefully, but scopes don't have a main process. If SIGTERM takes too long, we still blast SIGKILL to every process, though.
+        Any other resource properties (MemoryMax, CPUQuota, ...) go through the same -p mechanism.
         """
-        self.systemd_proc = Popen(["systemd-run", "--user", f"--unit={self.unit_name}", "--collect", "--wait", "-p", "ExitType=cgroup", "-p", f"MemoryHigh={systemd_mem_str(mem)}"] + command)
+        if sim.enabled():
+            # the simulation's shims are only on our PATH, not the user manager's
+            command = [shutil.which(command[0]) or command[0]] + command[1:]
+            exit_timeouts = ExitTimeouts(sim.scaled(exit_timeouts.warn), sim.scaled(exit_timeouts.term), sim.scaled(exit_timeouts.abrt))
+        props: list[str] = []
+        for key, value in properties.items():
+            props += ["-p", f"{key}={value}"]
+        self.systemd_proc = Popen(["systemd-run", "--user", f"--unit={self.unit_name}", "--collect", "--wait", "-p", "ExitType=cgroup", "-p", f"MemoryHigh={systemd_mem_str(mem)}"] + props + command)
         self.base_path = base_path
         self.logger = logger
         self.exit_timeouts = exit_timeouts
         self.custom_term_routine = custom_term_routine
+        self.results = results if results is not None else {}
+        self.started = time.monotonic()
+        self.command = command
+        self.mapped_files = settings.mapped_files if settings.start_mode is not None else None
+        self.sampler: Sampler | None = None
+        self.accounting: AccountingCollector | None = None
+        if harness.sampler:
+            with_pss = settings.steady_state is not None and settings.steady_state.source == "pss"
+            collectors = settings.collectors(base_path)
+            if settings.resource_accounting:
+                self.accounting = AccountingCollector(self.results)
+                collectors.append(self.accounting)
+            self.sampler = Sampler(self.unit_name, base_path, settings.sample_interval, collectors, with_pss)
+            self.sampler.start()
+            metrics.sampler = self.sampler
 
     def __enter__(self) -> "App":
         return self
@@ -314,6 +497,7 @@ class App(AbstractContextManager["App", None]):
         """
         Rather than signalling self.systemd_proc itself, we want to send signals to processes in our transient service via systemctl. This is so that we can send a signal to and wait for every process in the application, not just the main one.
         """
+        import subprocess
         if self.is_running():
             subprocess.run(["systemctl", "--user", "kill", f"--kill-whom={whom}", f"--signal={signal}", self.unit_name])
 
@@ -332,30 +516,84 @@ class App(AbstractContextManager["App", None]):
     def wait(self):
         self.systemd_proc.wait()
 
+    def stop_sampler(self) -> None:
+        from .dashboard import metrics
+        if self.sampler is not None:
+            self.sampler.stop()
+            if self.sampler.errors:
+                self.logger.warning(f"{self.sampler.errors} readings of the app's cgroup failed")
+                self.results["sampler_errors"] = self.sampler.errors
+            # so the dashboard doesn't keep showing (and holding on to) this app's series
+            if metrics.sampler is self.sampler:
+                metrics.sampler = None
+
     def stop(self) -> float:
         if not self.is_running():
+            self.stop_sampler()
             return 0
-        abrt_sent = False
-        kill_sent = False
+        from . import cgroup
+        from .startup import mapped_files
+        if self.mapped_files is not None:
+            cg = cgroup.unit_cgroup(f"{self.unit_name}.service")
+            if cg is not None:
+                self.mapped_files.save(self.command, mapped_files(cgroup.procs(cg)))
         self.logger.info("sending SIGTERM")
+        start = time.monotonic()
         self.terminate()
-        start = time.time()
+        # imported here (like .gui) because asyncio alone takes longer to import than the analysis tools need to run
+        from .timeline import timeline
+        duration = timeline.run(self.wait_exit(start))
+        self.wait()
+        self.stop_sampler()
+        self.results["exit_time"] = duration
+        return duration
+
+    async def wait_exit(self, start: float) -> float:
+        """
+        Waits on the timeline for the app to exit after SIGTERM, escalating to SIGABRT and SIGKILL
+        after the exit timeouts. Returns seconds since `start`.
+        """
+        import asyncio
+        abrt_sent = False
+        kill_sent = False
         while True:
-            duration = time.time() - start
+            duration = time.monotonic() - start
             if not self.is_running():
-                self.wait()
                 return duration
             elif duration > self.exit_timeouts.abrt and not kill_sent:
-                pyautogui.screenshot(self.base_path.joinpath("error_abort_timeout.png"))
+                if harness.screenshots:
+                    from .gui import pyautogui
+                    await asyncio.to_thread(pyautogui.screenshot, self.base_path.joinpath("error_abort_timeout.png"))
+                await asyncio.to_thread(self.forensics, "abort_timeout")
                 self.logger.warning("sending SIGKILL")
                 self.kill()
                 kill_sent = True
             elif duration > self.exit_timeouts.term and not abrt_sent:
-                pyautogui.screenshot(self.base_path.joinpath("error_terminate_timeout.png"))
+                if harness.screenshots:
+                    from .gui import pyautogui
+                    await asyncio.to_thread(pyautogui.screenshot, self.base_path.joinpath("error_terminate_timeout.png"))
+                await asyncio.to_thread(self.forensics, "terminate_timeout")
                 self.logger.warning("sending SIGABRT")
                 self.send_signal(SIGABRT, "main")
                 abrt_sent = True
+            await asyncio.sleep(EXIT_POLL)
     
+    def forensics(self, reason: str, out: Path | None = None) -> None:
+        """
+        Snapshots the app's cgroup and processes into forensics_<reason>.txt.gz in `out` (the
+        app's directory by default), taking at most forensics.BUDGET seconds. See forensics.py.
+        """
+        from . import cgroup, forensics
+        if not harness.forensics:
+            return
+        cg = cgroup.unit_cgroup(f"{self.unit_name}.service")
+        if cg is None:
+            return
+        path = (out if out is not None else self.base_path).joinpath(f"forensics_{reason}.txt.gz")
+        stopped = forensics.capture(cg, path)
+        if stopped is not None:
+            self.logger.warning(f"forensic snapshot incomplete: {stopped}")
+
     def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> None:
         timeouts = self.exit_timeouts
         time_took = self.stop()
@@ -368,12 +606,14 @@ class Monitor(AbstractContextManager["Monitor", None]):
         self.logger = logger
         graph = base_path.joinpath(graph_out)
         stdout = base_path.joinpath(stdout_to_file)
-        self.proc = start_monitor(regex, graph, stdout, check_if_running)
+        self.proc = start_monitor(regex, graph, stdout, check_if_running) if harness.monitor else None
 
     def __enter__(self):
         return self
 
     def stop_monitor(self):
+        if self.proc is None:
+            return
         self.proc.send_signal(SIGINT)
         self.proc.wait()
 
@@ -387,31 +627,58 @@ class Context(AbstractContextManager["Context", None]):
     start with the right memory and save their output to the right directory) and creating
     subdirectories (and subloggers).
     """
-    def __init__(self, name: str, base_path: Path, logger: Logger, mem: int | None):
+    def __init__(self, name: str, base_path: Path, logger: Logger, mem: int | None, settings: Settings | None = None, constraints: Constraints | None = None):
+        from . import sim
+        from .design import Constraints
         self.name = name
         self.base_path = base_path
         self.logger = logger
         self.mem = mem
+        # limits besides MemoryHigh (which stays in self.mem)
+        self.constraints = constraints if constraints is not None else Constraints(mem)
+        if settings is None and sim.enabled():
+            # a top-level context: everything below it runs against the simulated desktop
+            sim.setup()
+            harness.monitor = False
+        self.settings = settings if settings is not None else Settings()
+        # scalar per-sample measurements, written to results.json when the context exits
+        self.results: dict[str, Any] = {}
+        self.app: App | None = None
+        # (manager, copy) of profiles restored for this context, removed on exit
+        self.restored_profiles: list[tuple[ProfileManager, Path]] = []
+        # set on sample contexts, so the dashboard can tell when a sample ends
+        self.sample: int | None = None
+        # profiles of the browsers started from this context, evicted or warmed with the app's files
+        self.profile_dirs: list[Path] = []
+        # (collector, reading) when this sample runs in an app started by a parent context
+        self.usage_start: tuple[AccountingCollector, dict[str, Any]] | None = None
+        # measures this context's clicks, once it has made one with settings.paint_latency on
+        self.paint: "PaintProbe | None" = None
+        # /proc/vmstat at the start of this sample, if a swap backend is set up
+        self.swap_start: dict[str, int] | None = None
+        # the harness cgroup's counters at the start of this sample, if the harness is protected
+        self.harness_start: dict[str, float] | None = None
 
     @classmethod
-    def from_module_with_mem(cls, name: str) -> "Context":
-        # parse system arguments
-        args = parse_sysargs_with_mem()
-
-        output_dir = Path(args.output_dir)
+    def create(cls, name: str, output_dir: Path, mem: int | None) -> "Context":
         # top-level experiment directory
         create_experiment_files(output_dir)
-
         # get logger
+        from .dashboard import metrics
         logger = get_logger(name, output_dir)
-        return Context(name, output_dir, logger, args.mem)
+        # warnings and errors anywhere in the tree count towards the dashboard's per-level outcomes
+        logger.addHandler(metrics)
+        return Context(name, output_dir, logger, mem)
+
+    @classmethod
+    def from_module_with_mem(cls, name: str) -> "Context":
+        # parse system arguments
+        args = parse_sysargs_with_mem()
+        return Context.create(name, Path(args.output_dir), args.mem)
 
     @classmethod
     def from_module(cls, name: str) -> "Context":
-        output_dir = parse_sysargs()
-        create_experiment_files(output_dir)
-        logger = get_logger(name, output_dir)
-        return Context(name, output_dir, logger, None)
+        return Context.create(name, parse_sysargs(), None)
 
     def _get_child_logger(self, name: str) -> Logger:
         logger_name = f"{self.logger.name}.{name}"
@@ -419,23 +686,190 @@ class Context(AbstractContextManager["Context", None]):
         return get_logger(logger_name, path)
  
     def get_child(self, name: str) -> "Context":
-       return Context(name, self.base_path.joinpath(name), self._get_child_logger(name), self.mem)
+       return Context(name, self.base_path.joinpath(name), self._get_child_logger(name), self.mem, self.settings, self.constraints)
     
     def get_child_with_mem(self, i: int, mem: int | None) -> "Context":
-        name = f"{i:02d}_{mem}_{human_mem_str(mem)}"
-        return Context(name, self.base_path.joinpath(name), self._get_child_logger(name), mem)
+        from .dashboard import metrics
+        from .design import Constraints
+        name = level_name(i, Constraints(mem))
+        metrics.start_level(name)
+        return Context(name, self.base_path.joinpath(name), self._get_child_logger(name), mem, self.settings)
+
+    def get_child_with_constraints(self, i: int, constraints: Constraints) -> "Context":
+        from .dashboard import metrics
+        name = level_name(i, constraints)
+        metrics.start_level(name)
+        ctx = Context(name, self.base_path.joinpath(name), self._get_child_logger(name), constraints.mem, self.settings, constraints)
+        with ctx.open("constraints.json", 'w') as f:
+            json.dump(constraints.to_json(), f, indent=2)
+        return ctx
 
     def get_child_with_sample(self, i: int) -> "Context":
-        return Context.get_child(self, f"{i:02d}")
+        from .dashboard import metrics
+        ctx = Context.get_child(self, f"{i:02d}")
+        ctx.sample = i
+        metrics.start_sample(i)
+        if self.app is not None and self.app.accounting is not None:
+            ctx.usage_start = (self.app.accounting, self.app.accounting.snapshot())
+        if self.settings.swap is not None:
+            ctx.swap_start = self.settings.swap.snapshot()
+        if self.settings.protection is not None:
+            ctx.harness_start = self.settings.protection.snapshot()
+        return ctx
 
     def start_app(self, command: list[str], exit_timeouts: ExitTimeouts = ExitTimeouts(20, 30, 40), custom_term_routine: Callable[[App], None] | None = None) -> App:
-        return App(command, self.base_path, self.logger, self.mem, exit_timeouts, custom_term_routine)
+        mode = self.settings.start_mode
+        if mode is not None:
+            from humanize import naturalsize
+            from . import startup
+            prepared = startup.prepare(mode, command, self.profile_dirs, self.settings.mapped_files)
+            self.logger.info(f"{mode} start: {prepared['start_files']} files, {naturalsize(prepared['start_bytes'], True)}")
+            self.results.update(prepared)
+        self.app = App(command, self.base_path, self.logger, self.mem, exit_timeouts, custom_term_routine, self.settings, self.results, self.constraints.systemd_properties())
+        return self.app
 
     def monitor(self, regex: str, graph_out: RelPath | str = "graph.svg", stdout_to_file: RelPath | str = "smaps_profiler.ndjson", check_if_running: bool = True):
         return Monitor(regex, self.base_path, self.logger, graph_out, stdout_to_file, check_if_running)
     
+    def settle(self, budget: float, key: str = "settle") -> None:
+        """
+        Sit for the rest of the workload's time budget (seconds). If steady-state detection is on,
+        end as soon as the app's memory has been flat for long enough instead, waiting at most
+        steady_state.max_time (or the budget, if that's None).
+        """
+        from . import sim
+        budget = sim.scaled(budget)
+        steady = self.settings.steady_state
+        sampler = self.app.sampler if self.app is not None else None
+        if steady is None or sampler is None:
+            time.sleep(max(budget, 0))
+            return
+        timeout = steady.max_time if steady.max_time is not None else max(budget, 0)
+        start = time.monotonic()
+        settled = sampler.wait_steady(steady, timeout)
+        waited = time.monotonic() - start
+        self.record(f"{key}_time", waited)
+        self.record(f"{key}_steady", settled)
+        if settled:
+            self.logger.info(f"memory steady after {waited:.1f}s")
+        else:
+            self.logger.info(f"memory not steady after {waited:.1f}s, moving on")
+
+    def browser_command(self, browser: Browser, *args: str) -> list[str]:
+        """
+        The command line to start a browser with, opening `args`. If the settings have a
+        ProfileManager for this browser, it runs on a fresh copy of the pristine profile, which
+        is thrown away when this context exits.
+        """
+        from .profiles import profile_dir
+        manager = self.settings.profiles.get(browser)
+        if manager is None:
+            profile = [] if browser == "chromium" else ["-P", "Experiments"]
+            try:
+                self.profile_dirs.append(profile_dir(browser))
+            except Exception:
+                pass
+        else:
+            path = manager.restore()
+            self.restored_profiles.append((manager, path))
+            self.profile_dirs.append(path)
+            profile = manager.args(path)
+        return BROWSER_COMMANDS[browser] + profile + list(args)
+
+    def profile_hash(self, browser: Browser) -> str:
+        from .profiles import profile_hash
+        manager = self.settings.profiles.get(browser)
+        return manager.hash() if manager is not None else profile_hash(browser)
+
+    def needs_baseline(self, browser: Browser, version: str, do_baseline: bool = True) -> bool:
+        """
+        Whether this sample has to sit on about:blank to measure the browser's baseline itself
+        (never if not `do_baseline`). If the baseline cache already has an entry for this browser,
+        version, memory limit and profile, the cached value goes to baseline.json (so analysis can
+        subtract it even from samples that never visit about:blank). Only samples that could
+        measure count as a use of the entry for revalidation.
+        """
+        cache = self.settings.baselines
+        if cache is None:
+            return do_baseline
+        entry = cache.entry(browser, version, self.mem, self.profile_hash(browser))
+        cached = cache.lookup(entry)
+        if cached is None:
+            return do_baseline
+        with self.open("baseline.json", 'w') as f:
+            json.dump(cached, f, indent=2)
+        if do_baseline and cache.due_for_revalidation(entry):
+            self.logger.info("re-measuring cached baseline")
+            return True
+        return False
+
+    def measure_baseline(self, browser: Browser, version: str, budget: float = 30) -> None:
+        """
+        Sits on about:blank for the budget (or until steady), then records the median memory of
+        the last few seconds as this sample's baseline, and adds it to the baseline cache.
+        """
+        import statistics
+        from humanize import naturalsize
+        self.settle(budget, "baseline")
+        sampler = self.app.sampler if self.app is not None else None
+        window = self.settings.steady_state.window if self.settings.steady_state is not None else 5
+        points = sampler.recent(window) if sampler is not None else []
+        if not points:
+            self.logger.warning("no memory samples to take a baseline from")
+            return
+        measurement: dict[str, Any] = {"memory_current": statistics.median(m for (_t, m, _p) in points)}
+        pss = [p for (_t, _m, p) in points if p is not None]
+        if pss:
+            measurement["pss"] = statistics.median(pss)
+        cache = self.settings.baselines
+        if cache is not None:
+            entry = cache.entry(browser, version, self.mem, self.profile_hash(browser))
+            cached = cache.lookup(entry)
+            if cached is not None:
+                self.logger.info(f"baseline {naturalsize(measurement['memory_current'], True)}, cached {naturalsize(cached['memory_current'], True)}")
+            cache.add(entry, measurement, version)
+        with self.open("baseline.json", 'w') as f:
+            json.dump(dict(measurement, source="measured"), f, indent=2)
+
+    def mark_interactive(self) -> None:
+        """
+        Call when the workload can first interact with the app (e.g. it found the first button).
+        Records the time since launch as startup_latency, once per app.
+        """
+        if self.app is not None and "startup_latency" not in self.results:
+            latency = time.monotonic() - self.app.started
+            self.record("startup_latency", latency)
+            self.logger.info(f"interactive after {latency:.2f}s")
+
+    def click(self, point: tuple[int, int], name: str, roi: tuple[int, int, int, int] | None = None) -> float:
+        """
+        Clicks at `point`. With settings.paint_latency on, also measures how long the app takes to
+        paint a response in `roi` (left, top, width, height; default: a box around the click) and
+        records it as paint_latency_<name>. Returns the seconds this took, for the workload to take
+        off its time budget.
+        """
+        start = time.monotonic()
+        if not self.settings.paint_latency:
+            from .gui import pyautogui
+            pyautogui.click(*point)
+        else:
+            if self.paint is None:
+                from .paint import PaintProbe
+                self.paint = PaintProbe(self.base_path, self.results)
+            record = self.paint.click(name, point, roi)
+            if record["painted"]:
+                self.logger.info(f"{name}: painted {record['latency'] * 1000:.1f}ms after the click")
+            else:
+                self.logger.info(f"{name}: nothing painted within {time.monotonic() - start:.1f}s of the click")
+        return time.monotonic() - start
+
+    def record(self, key: str, value: Any) -> None:
+        self.results[key] = value
+
     def screenshot(self, path: RelPath | str):
-        pyautogui.screenshot(self.base_path.joinpath(path))
+        if harness.screenshots:
+            from .gui import pyautogui
+            pyautogui.screenshot(self.base_path.joinpath(path))
 
     def joinpath(self, path: RelPath | str) -> Path:
         return self.base_path.joinpath(path)
@@ -455,6 +889,24 @@ class Context(AbstractContextManager["Context", None]):
             handler.close()
 
     def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> None:
+        from .accounting import usage_delta
+        from .dashboard import metrics
+        if self.usage_start is not None:
+            collector, before = self.usage_start
+            after = collector.snapshot()
+            if before and after:
+                self.results.update(usage_delta(before, after))
+        if self.swap_start is not None and self.settings.swap is not None:
+            self.results.update(self.settings.swap.sample_results(self.swap_start))
+        if self.harness_start is not None and self.settings.protection is not None:
+            self.results.update(self.settings.protection.sample_results(self.harness_start))
+        if self.results:
+            with self.open("results.json", 'w') as f:
+                json.dump(self.results, f, indent=2)
+        for manager, path in self.restored_profiles:
+            manager.discard(path)
+        if self.sample is not None:
+            metrics.end_sample()
         self.cleanup()
 
     def __del__(self) -> None:
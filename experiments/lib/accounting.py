@@ -0,0 +1,94 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+What running under a memory limit cost the app besides memory: CPU time (a lot of it spent in
+reclaim), disk and swap I/O, and pages swapped and scanned, read from the unit's cpu.stat,
+io.stat and memory.stat.
+
+A transient unit gets a new cgroup, so its counters start at zero and the last reading is the
+total for the app's whole life. The cgroup is gone as soon as the app exits (--collect), so the
+last reading is the sampler's last one, up to one sample interval before the end. Workloads
+that run several samples in one app (browser_bench) get per-sample differences instead (see
+Context.get_child_with_sample).
+"""
+
+from pathlib import Path
+from typing import Any
+from . import cgroup
+from .sampler import Collector
+
+CPU_KEYS = ["usage_usec", "user_usec", "system_usec", "nr_throttled", "throttled_usec"]
+IO_KEYS = ["rbytes", "wbytes", "rios", "wios"]
+MEMORY_KEYS = ["pswpin", "pswpout", "pgscan", "pgsteal"]
+
+def read_usage(cg: Path) -> dict[str, Any] | None:
+    """
+    The counters of a cgroup, flattened into results.json keys: cpu_<key>, io_<key> summed over
+    devices, the memory.stat events under their own names, and io_devices with io.stat per
+    device. None if the cgroup is gone.
+    """
+    cpu = cgroup.read_flat_keyed(cg / "cpu.stat")
+    if not cpu:
+        return None
+    io = cgroup.read_nested_keyed(cg / "io.stat")
+    memory = cgroup.read_flat_keyed(cg / "memory.stat")
+    usage: dict[str, Any] = {f"cpu_{k}": cpu[k] for k in CPU_KEYS if k in cpu}
+    for k in IO_KEYS:
+        usage[f"io_{k}"] = sum(fields.get(k, 0) for fields in io.values())
+    usage.update({k: memory[k] for k in MEMORY_KEYS if k in memory})
+    usage["io_devices"] = {device: {k: fields.get(k, 0) for k in IO_KEYS} for device, fields in io.items()}
+    return usage
+
+def usage_delta(before: dict[str, Any], after: dict[str, Any]) -> dict[str, Any]:
+    """
+    after - before, key by key (and device by device). A key missing from `before` counts as 0.
+    """
+    ret: dict[str, Any] = {k: v - before.get(k, 0) for k, v in after.items() if k != "io_devices"}
+    devices = before.get("io_devices", {})
+    ret["io_devices"] = {
+        device: {k: v - devices.get(device, {}).get(k, 0) for k, v in fields.items()}
+        for device, fields in after.get("io_devices", {}).items()
+    }
+    return ret
+
+class AccountingCollector(Collector):
+    """
+    Keeps the latest reading of the app's counters, and puts it into `results` (the app's
+    results.json) when the sampler stops.
+    """
+    def __init__(self, results: dict[str, Any]):
+        self.results = results
+        self.cg: Path | None = None
+        self.latest: dict[str, Any] = {}
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Reads the counters now if the app is still running, else returns the last reading.
+        """
+        if self.cg is not None:
+            usage = read_usage(self.cg)
+            if usage is not None:
+                self.latest = usage
+        return self.latest
+
+    def sample(self, cg: Path, t: float) -> dict[str, Any] | None:
+        self.cg = cg
+        self.snapshot()
+        return None
+
+    def finish(self, cg: Path | None) -> None:
+        usage = self.snapshot()
+        if usage:
+            self.results.update(usage)
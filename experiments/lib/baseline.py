@@ -0,0 +1,81 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any
+from .profiles import Browser
+
+def default_cache_dir() -> Path:
+    return Path.home() / ".cache" / "experiments" / "baselines"
+
+class BaselineCache:
+    """
+    about:blank memory measurements of a browser, shared across samples and sweeps. An entry is
+    keyed by (browser, browser version, memory limit, profile hash) and holds every measurement
+    taken for that key, one per line of measurements.ndjson; the cached baseline is their median.
+
+    root: default_cache_dir() if not given.
+    revalidate_every: if set, every n-th use of an entry measures the baseline again instead of
+    using the cached value, so that a drifting baseline shows up in the logs.
+    """
+    def __init__(self, root: Path | None = None, revalidate_every: int | None = None):
+        self.root = root if root is not None else default_cache_dir()
+        self.revalidate_every = revalidate_every
+
+    def entry(self, browser: Browser, version: str, mem: int | None, profile: str) -> Path:
+        version_hash = hashlib.sha256(version.encode()).hexdigest()[:12]
+        return self.root / browser / version_hash / profile / str(mem)
+
+    def measurements(self, entry: Path) -> list[dict[str, Any]]:
+        try:
+            with open(entry / "measurements.ndjson", 'r') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except OSError:
+            return []
+
+    def lookup(self, entry: Path) -> dict[str, Any] | None:
+        measurements = self.measurements(entry)
+        if not measurements:
+            return None
+        return {
+            "memory_current": statistics.median(m["memory_current"] for m in measurements),
+            "n": len(measurements),
+            "source": "cache",
+            "entry": str(entry),
+        }
+
+    def due_for_revalidation(self, entry: Path) -> bool:
+        """
+        Counts one use of the entry. Returns True if this use should measure instead.
+        """
+        if self.revalidate_every is None:
+            return False
+        uses_file = entry / "uses"
+        try:
+            uses = int(uses_file.read_text())
+        except (OSError, ValueError):
+            uses = 0
+        uses += 1
+        uses_file.write_text(str(uses))
+        return uses % self.revalidate_every == 0
+
+    def add(self, entry: Path, measurement: dict[str, Any], version: str) -> None:
+        entry.mkdir(parents=True, exist_ok=True)
+        (entry / "version").write_text(version)
+        with open(entry / "measurements.ndjson", 'a') as f:
+            f.write(json.dumps(dict(measurement, time=time.time())) + "\n")
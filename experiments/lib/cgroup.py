@@ -0,0 +1,136 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Small helpers for reading cgroup v2 interface files. Everything here returns
+empty/None values instead of raising when a file is missing, because units come
+and go underneath us (--collect removes the cgroup as soon as the app exits).
+"""
+
+import os
+import subprocess
+import sys
+import uuid
+from pathlib import Path
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+def own_cgroup() -> Path:
+    # /proc/self/cgroup on a unified hierarchy is a single line: "0::/user.slice/..."
+    with open("/proc/self/cgroup", 'r') as f:
+        for line in f:
+            hierarchy, _controllers, path = line.rstrip("\n").split(":", 2)
+            if hierarchy == "0":
+                return CGROUP_ROOT.joinpath(path.lstrip("/"))
+    raise Exception("not running on a cgroup v2 (unified) hierarchy")
+
+def unit_cgroup(unit: str) -> Path | None:
+    """
+    Returns the cgroup directory of a systemd user unit, or None if the unit isn't running (yet).
+    """
+    res = subprocess.run(["systemctl", "--user", "show", "-P", "ControlGroup", unit], capture_output=True, text=True)
+    path = res.stdout.strip()
+    if res.returncode != 0 or not path:
+        return None
+    return CGROUP_ROOT.joinpath(path.lstrip("/"))
+
+def read_int(path: Path) -> int | None:
+    try:
+        value = path.read_text().strip()
+    except OSError:
+        return None
+    if value == "max":
+        return None
+    return int(value)
+
+def read_flat_keyed(path: Path) -> dict[str, int]:
+    """
+    Parses files like cpu.stat and memory.stat ("key value" per line).
+    """
+    ret: dict[str, int] = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                key, value = line.split()
+                ret[key] = int(value)
+    except OSError:
+        pass
+    return ret
+
+def read_nested_keyed(path: Path) -> dict[str, dict[str, int]]:
+    """
+    Parses files like io.stat ("8:0 rbytes=1 wbytes=2 ...").
+    """
+    ret: dict[str, dict[str, int]] = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                device, *fields = line.split()
+                ret[device] = {k: int(v) for k, v in (field.split("=", 1) for field in fields)}
+    except OSError:
+        pass
+    return ret
+
+def read_pressure(path: Path) -> dict[str, dict[str, float]]:
+    """
+    Parses PSI files ("some avg10=0.00 avg60=0.00 avg300=0.00 total=0").
+    """
+    ret: dict[str, dict[str, float]] = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                kind, *fields = line.split()
+                ret[kind] = {k: float(v) for k, v in (field.split("=", 1) for field in fields)}
+    except OSError:
+        pass
+    return ret
+
+def procs(cgroup: Path) -> list[int]:
+    """
+    Every pid in the cgroup and its descendants.
+    """
+    pids: list[int] = []
+    for dirpath, _dirnames, filenames in os.walk(cgroup):
+        if "cgroup.procs" not in filenames:
+            continue
+        try:
+            with open(os.path.join(dirpath, "cgroup.procs"), 'r') as f:
+                pids.extend(int(line) for line in f if line.strip())
+        except OSError:
+            pass
+    return pids
+
+SCOPE_ENV = "EXPERIMENTS_HARNESS_SCOPE"
+
+def in_harness_scope() -> bool:
+    return os.environ.get(SCOPE_ENV) is not None
+
+def reexec_in_scope(name: str, properties: dict[str, str] | None = None, slice: str | None = None) -> None:
+    """
+    Replaces the current process with the same command line running inside its own transient
+    scope, so that everything the harness spawns (including smaps-profiler) gets accounted to one
+    cgroup that doesn't contain anything else. Does nothing if we were already re-executed.
+    A scope (unlike the services we start apps in) runs the command as a child of systemd-run,
+    so our environment and terminal come along.
+    """
+    if in_harness_scope():
+        return
+    os.environ[SCOPE_ENV] = "1"
+    command = ["systemd-run", "--user", "--scope", "--quiet", f"--unit={name}-{uuid.uuid1()}"]
+    if slice is not None:
+        command.append(f"--slice={slice}")
+    for key, value in (properties or {}).items():
+        command += ["-p", f"{key}={value}"]
+    command += [sys.executable] + sys.orig_argv[1:]
+    os.execvp(command[0], command)
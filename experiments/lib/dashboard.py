@@ -0,0 +1,218 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A live view of a running sweep on a small local web page: the current experiment, level and
+sample, the running app's memory, how each level went so far, and an ETA.
+
+The harness only updates the in-process `metrics` object (a few attribute assignments per
+sample; warnings and errors arrive through the logging tree). The memory curve is the running
+app's Sampler.series, which the sampler keeps anyway. Nothing is computed until a browser asks
+for /state, so the dashboard costs nothing while nobody is looking.
+"""
+
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any
+from .sampler import Sampler
+
+if TYPE_CHECKING:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STOP_MARKER = "Refusing to reduce memory"
+# at most this many points of the memory curve are sent
+CURVE_POINTS = 300
+
+class Metrics(logging.Handler):
+    """
+    Shared state of the running sweep. Attach it to the top-level logger (Context.create does) to
+    count warnings and errors per level.
+    """
+    def __init__(self) -> None:
+        super().__init__(logging.WARNING)
+        self.started = time.monotonic()
+        self.experiment: str | None = None
+        self.level_name: str | None = None
+        self.sample: int | None = None
+        self.sample_started: float | None = None
+        self.sampler: Sampler | None = None
+        # experiment -> samples it will run at most / has run
+        self.planned: dict[str, int] = {}
+        self.done: dict[str, int] = {}
+        self.durations: deque[float] = deque(maxlen=50)
+        # (experiment, level) -> counts of samples, warnings, errors, and whether the sweep stopped there
+        self.levels: dict[tuple[str, str], dict[str, Any]] = {}
+
+    def plan(self, planned: dict[str, int]) -> None:
+        self.planned.update(planned)
+
+    def start_experiment(self, name: str) -> None:
+        self.experiment = name
+        self.level_name = None
+        self.sample = None
+
+    def finish_experiment(self, name: str) -> None:
+        # anything not run by now was skipped
+        self.planned[name] = self.done.get(name, 0)
+
+    def start_level(self, name: str) -> None:
+        self.level_name = name
+        self.sample = None
+        self.levels.setdefault((self.experiment or "", name), {"samples": 0, "warnings": 0, "errors": 0, "stopped": False})
+
+    def start_sample(self, i: int) -> None:
+        self.sample = i
+        self.sample_started = time.monotonic()
+
+    def end_sample(self) -> None:
+        if self.sample_started is not None:
+            self.durations.append(time.monotonic() - self.sample_started)
+        self.sample_started = None
+        experiment = self.experiment or ""
+        self.done[experiment] = self.done.get(experiment, 0) + 1
+        level = self.levels.get((experiment, self.level_name or ""))
+        if level is not None:
+            level["samples"] += 1
+
+    def emit(self, record: logging.LogRecord) -> None:
+        level = self.levels.get((self.experiment or "", self.level_name or ""))
+        if level is None:
+            return
+        if record.levelno >= logging.ERROR:
+            level["errors"] += 1
+        else:
+            level["warnings"] += 1
+        if STOP_MARKER in record.getMessage():
+            level["stopped"] = True
+
+    def eta(self) -> float | None:
+        if not self.durations or not self.planned:
+            return None
+        remaining = sum(max(0, n - self.done.get(name, 0)) for name, n in self.planned.items())
+        return remaining * statistics.median(self.durations)
+
+    def state(self) -> dict[str, Any]:
+        curve: list[tuple[float, int]] = []
+        sampler = self.sampler
+        if sampler is not None:
+            series = sampler.points()
+            step = max(1, len(series) // CURVE_POINTS)
+            curve = [(t, m) for (t, m, _p) in series[::step]]
+        now = time.monotonic()
+        return {
+            "elapsed": now - self.started,
+            "experiment": self.experiment,
+            "level": self.level_name,
+            "sample": self.sample,
+            "sample_elapsed": None if self.sample_started is None else now - self.sample_started,
+            "eta": self.eta(),
+            "done": sum(self.done.values()),
+            "planned": sum(self.planned.values()),
+            "memory": [(t - now, m) for (t, m) in curve],
+            "levels": [dict(counts, experiment=experiment, level=level) for (experiment, level), counts in self.levels.items()],
+        }
+
+metrics = Metrics()
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>experiments</title>
+<style>
+body { font-family: monospace; margin: 1em; }
+table { border-collapse: collapse; }
+td, th { padding: 0 0.8em; text-align: left; }
+.stopped { color: #a60; } .errors { color: #c00; }
+</style></head>
+<body>
+<div id="status"></div>
+<svg id="memory" width="800" height="200" style="border: 1px solid #ccc"><polyline fill="none" stroke="#06c"/></svg>
+<div id="peak"></div>
+<table id="levels"></table>
+<script>
+function fmt(s) {
+  if (s === null) return "?";
+  s = Math.round(s);
+  return Math.floor(s / 3600) + "h" + String(Math.floor(s / 60) % 60).padStart(2, "0") + "m" + String(s % 60).padStart(2, "0") + "s";
+}
+function mib(b) { return (b / 1048576).toFixed(0) + " MiB"; }
+async function update() {
+  const s = await (await fetch("/state")).json();
+  document.getElementById("status").textContent =
+    `${s.experiment ?? "-"} / ${s.level ?? "-"} / sample ${s.sample ?? "-"} (${fmt(s.sample_elapsed)})` +
+    ` | ${s.done}/${s.planned} samples, elapsed ${fmt(s.elapsed)}, ETA ${fmt(s.eta)}`;
+  const points = s.memory;
+  const line = document.querySelector("#memory polyline");
+  if (points.length > 0) {
+    const t0 = points[0][0], span = Math.max(-t0, 1), high = Math.max(...points.map(p => p[1]), 1);
+    line.setAttribute("points", points.map(([t, m]) => `${(t - t0) / span * 800},${200 - m / high * 190}`).join(" "));
+    document.getElementById("peak").textContent = `now ${mib(points[points.length - 1][1])}, peak ${mib(high)} over the last ${fmt(span)}`;
+  } else {
+    line.setAttribute("points", "");
+    document.getElementById("peak").textContent = "no app running";
+  }
+  const rows = s.levels.slice(-40).reverse().map(l =>
+    `<tr class="${l.errors ? "errors" : l.stopped ? "stopped" : ""}"><td>${l.experiment}</td><td>${l.level}</td>` +
+    `<td>${l.samples}</td><td>${l.warnings}</td><td>${l.errors}</td><td>${l.stopped ? "stopped" : ""}</td></tr>`);
+  document.getElementById("levels").innerHTML =
+    "<tr><th>experiment</th><th>level</th><th>samples</th><th>warnings</th><th>errors</th><th></th></tr>" + rows.join("");
+}
+update();
+setInterval(update, 2000);
+</script></body></html>
+"""
+
+def handler() -> "type[BaseHTTPRequestHandler]":
+    # http.server is only imported once a dashboard is actually served
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path == "/state":
+                body = json.dumps(metrics.state()).encode()
+                content_type = "application/json"
+            elif self.path == "/":
+                body = PAGE.encode()
+                content_type = "text/html; charset=utf-8"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass # keep requests out of the sweep's output
+
+    return Handler
+
+server: "ThreadingHTTPServer | None" = None
+
+def serve(port: int) -> None:
+    """
+    Serves the dashboard on http://localhost:<port>/ from a background thread. Only the first
+    call starts a server.
+    """
+    from http.server import ThreadingHTTPServer
+    global server
+    if server is not None:
+        return
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler())
+    server.daemon_threads = True
+    # the poll interval only matters for shutdown(), which we never call
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 5}, daemon=True).start()
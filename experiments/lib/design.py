@@ -0,0 +1,146 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Sweeps over more than one systemd resource property. A design is just a list of Constraints;
+grid() gives the full cross product and latin_hypercube() a bounded number of points that still
+cover every axis evenly.
+"""
+
+import itertools
+import math
+import random
+from typing import Any
+from humanize import naturalsize
+
+Value = int | float | None
+
+# properties whose values are bytes; everything else is printed as-is
+MEMORY_PROPERTIES = {"MemoryHigh", "MemoryMax", "MemorySwapMax", "MemoryZSwapMax", "MemoryLow", "MemoryMin"}
+
+def systemd_value(prop: str, value: Value) -> str:
+    if prop == "CPUQuota":
+        # an empty assignment removes the quota
+        return "" if value is None else f"{value:g}%"
+    if value is None:
+        return "infinity"
+    return str(value)
+
+def loosest(value: Value) -> float:
+    """
+    The value to compare limits by: None (no limit) is looser than any number.
+    """
+    return value if value is not None else math.inf
+
+def human_value(prop: str, value: Value) -> str:
+    if value is None:
+        return "nolimit"
+    if prop in MEMORY_PROPERTIES:
+        return naturalsize(value, True).replace(" ", "")
+    if prop == "CPUQuota":
+        return f"{value:g}%"
+    return f"{value:g}"
+
+class Constraints:
+    """
+    Everything an App is limited by. `mem` is MemoryHigh, like everywhere else in the harness;
+    `properties` holds the other axes (MemoryMax, MemorySwapMax, MemoryZSwapMax, CPUQuota, ...).
+    None means unlimited.
+    """
+    def __init__(self, mem: int | None, properties: dict[str, Value] = {}):
+        self.mem = mem
+        self.properties = dict(properties)
+
+    def axes(self) -> dict[str, Value]:
+        return dict({"MemoryHigh": self.mem}, **self.properties)
+
+    def systemd_properties(self) -> dict[str, str]:
+        """
+        The properties besides MemoryHigh, formatted for `systemd-run -p`.
+        """
+        return {prop: systemd_value(prop, value) for prop, value in self.properties.items()}
+
+    def name(self) -> str:
+        return "_".join(f"{prop}-{human_value(prop, value)}" for prop, value in self.properties.items())
+
+    def at_least_as_tight(self, other: "Constraints") -> bool:
+        """
+        True if every axis is limited at least as much as in `other`. Used to skip points once a
+        looser one has already made the app too slow to exit.
+        """
+        mine = self.axes()
+        theirs = other.axes()
+        if mine.keys() != theirs.keys():
+            return False
+        return all(loosest(mine[k]) <= loosest(theirs[k]) for k in mine)
+
+    def to_json(self) -> dict[str, Any]:
+        return {"MemoryHigh": self.mem, "properties": self.properties}
+
+class Axis:
+    """
+    One property and the values it may take, e.g. Axis("MemoryMax", lib.decay(2000 * MEGABYTE, 0.8, 10))
+    or Axis("CPUQuota", [None, 200, 100, 50, 25]). Use the property name "MemoryHigh" for the
+    usual memory limit.
+    """
+    def __init__(self, prop: str, values: list[Value]):
+        assert values, "an axis needs at least one value"
+        self.prop = prop
+        self.values = values
+
+def _constraints(point: dict[str, Value]) -> Constraints:
+    mem = point.pop("MemoryHigh", None)
+    assert mem is None or isinstance(mem, int)
+    return Constraints(mem, point)
+
+def grid(axes: list[Axis]) -> list[Constraints]:
+    """
+    Every combination of values (the full cross product), first axis varying slowest.
+    """
+    return [_constraints({axis.prop: value for axis, value in zip(axes, values)}) for values in itertools.product(*(axis.values for axis in axes))]
+
+def _lhs_indices(sizes: list[int], n: int, rng: random.Random) -> list[list[int]]:
+    columns: list[list[int]] = []
+    for size in sizes:
+        # one point in each of n equal strata of the axis, in random order
+        column = [min(int((k + rng.random()) / n * size), size - 1) for k in range(n)]
+        rng.shuffle(column)
+        columns.append(column)
+    return [list(point) for point in zip(*columns)]
+
+def _min_distance(points: list[list[int]], sizes: list[int]) -> float:
+    best = math.inf
+    for a, b in itertools.combinations(points, 2):
+        best = min(best, math.dist([x / s for x, s in zip(a, sizes)], [y / s for y, s in zip(b, sizes)]))
+    return best
+
+def latin_hypercube(axes: list[Axis], n: int, seed: int = 0, tries: int = 20) -> list[Constraints]:
+    """
+    n points such that, on every axis, each of n equal slices of its value list holds exactly one
+    point. Of `tries` random designs, the one whose closest two points are farthest apart wins.
+    Points come back ordered from least to most constrained, so a sweep can skip points that are
+    tighter than one where the app already took too long to exit.
+    """
+    rng = random.Random(seed)
+    sizes = [len(axis.values) for axis in axes]
+    best: list[list[int]] = []
+    best_distance = -1.0
+    for _ in range(tries):
+        points = _lhs_indices(sizes, n, rng)
+        distance = _min_distance(points, sizes)
+        if distance > best_distance:
+            best, best_distance = points, distance
+    # values lists go from loose to tight (like lib.decay), so a bigger index sum is tighter
+    best.sort(key=lambda point: sum(i / s for i, s in zip(point, sizes)))
+    return [_constraints({axis.prop: axis.values[i] for axis, i in zip(axes, point)}) for point in best]
@@ -0,0 +1,88 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The fake app the simulated desktop's shims run in place of a real program (see sim.py). It
+allocates memory, draws its window onto the framebuffer once it's ready and, on SIGTERM, touches
+all of its memory once more, waits out its exit time and takes its window away.
+"""
+
+import argparse
+import json
+import signal
+import time
+from pathlib import Path
+from typing import Any
+from . import sim
+
+def memory_high() -> int | None:
+    """
+    memory.high of the cgroup we run in, or None if there's no limit.
+    """
+    with open("/proc/self/cgroup", 'r') as f:
+        path = f.read().strip().split("::", 1)[-1]
+    try:
+        value = (Path("/sys/fs/cgroup") / path.lstrip("/") / "memory.high").read_text().strip()
+    except OSError:
+        return None
+    return None if value == "max" else int(value)
+
+def touch(chunks: list[bytearray]) -> None:
+    for chunk in chunks:
+        chunk[::4096] = b"\x01" * len(range(0, len(chunk), 4096))
+
+def run(program: str) -> None:
+    behavior = sim.scenario().behavior(program)
+    slowdown = behavior.slowdown(memory_high())
+    stopping = False
+
+    def terminate(_signum: int, _frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, terminate)
+
+    start = time.monotonic()
+    ready_at = start + behavior.ready_after * slowdown
+    chunks: list[bytearray] = []
+    target = int(behavior.memory_mb)
+    drawn = False
+    while not stopping:
+        now = time.monotonic()
+        # allocate on schedule, then keep all of it in use
+        due = target if behavior.grow_seconds <= 0 else min(target, int(target * (now - start) / behavior.grow_seconds))
+        while len(chunks) < due:
+            chunks.append(bytearray(sim.MEGABYTE))
+        touch(chunks)
+        if not drawn and now >= ready_at:
+            # what browser_bench copies out of Speedometer
+            sim.clipboard_path().write_text(json.dumps({"Score": {"mean": 100 / slowdown}}))
+            sim.draw_screen()
+            drawn = True
+        time.sleep(0.1)
+    touch(chunks)
+    time.sleep(behavior.exit_seconds * slowdown)
+    sim.clear_screen()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.lib.fakeapp", description="A fake app for the simulated desktop")
+    parser.add_argument('program')
+    parser.add_argument('args', nargs=argparse.REMAINDER)
+    ns = parser.parse_args()
+    if "--version" in ns.args:
+        print(f"{ns.program} (simulated)")
+        return
+    run(ns.program)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A snapshot of a stuck app, taken right before App.stop escalates to SIGABRT or SIGKILL and when
+an ImageNotFoundException ends an app early, so thrashing and hangs can be looked into without
+re-running the level.
+
+It's one gzipped text file per occasion (forensics_<reason>.txt.gz next to the error_*.png
+screenshot), made of "=== <path> ===" sections: first the cgroup's memory.stat,
+memory.events and pressure files, then status and wchan of every process in the cgroup, and
+last the full smaps of every process, which is by far the biggest part. Writing stops at a size
+cap (of the compressed file) and at a time budget, whichever comes first, and says so at the
+end. Files are read a chunk at a time and both are checked between chunks. Reading smaps of a
+thrashing process can also block on its memory map lock, so the capture runs on a thread: once
+the budget is over, capture() closes the file off itself (with the note) and leaves the thread
+to its read; whatever it reads after that is dropped. Until that thread is done, further
+captures are skipped rather than piling up behind the same lock.
+"""
+
+import gzip
+import threading
+import time
+from pathlib import Path
+from typing import IO
+from . import cgroup
+
+CGROUP_FILES = ["memory.stat", "memory.events", "memory.pressure", "cpu.pressure", "io.pressure", "memory.current", "memory.swap.current", "memory.high", "memory.max"]
+PROCESS_FILES = ["cmdline", "status", "wchan"]
+# seconds a snapshot may take
+BUDGET = 5.0
+# bytes of compressed output at most
+CAP = 32 * 1000 * 1000
+# bytes read at a time, between checks of the budget and the cap
+CHUNK = 64 * 1024
+
+class Snapshot:
+    def __init__(self, cg: Path, out: Path, deadline: float, cap: int):
+        self.cg = cg
+        self.out = out
+        self.deadline = deadline
+        self.cap = cap
+        # why writing stopped early, if it did ("stopped at the time budget", ...)
+        self.stopped: str | None = None
+        self.raw: IO[bytes] = open(out, 'wb')
+        self.f: gzip.GzipFile | None = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=1)
+        # held while writing to or closing the file, which both threads do
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name="forensics", daemon=True)
+
+    def over(self) -> bool:
+        """
+        Whether the budget or the cap is used up (and if so, which goes in self.stopped).
+        """
+        if self.stopped is None and time.monotonic() > self.deadline:
+            self.stopped = "stopped at the time budget"
+        elif self.stopped is None and self.raw.tell() > self.cap:
+            self.stopped = "stopped at the size cap"
+        return self.stopped is not None
+
+    def write(self, data: bytes) -> bool:
+        """
+        Returns False if the file is already closed.
+        """
+        with self.lock:
+            if self.f is None:
+                return False
+            self.f.write(data)
+            return True
+
+    def close(self, where: str) -> None:
+        with self.lock:
+            if self.f is None:
+                return
+            if self.stopped is not None:
+                self.f.write(f"# {self.stopped} {where}\n".encode())
+            self.f.close()
+            self.raw.close()
+            self.f = None
+
+    def section(self, path: Path) -> bool:
+        """
+        Writes one file's section. Returns False once the budget or the cap is used up.
+        """
+        if self.over():
+            self.close(f"before {path}")
+            return False
+        if not self.write(f"=== {path} ===\n".encode()):
+            return False
+        last = b"\n"
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(CHUNK):
+                    if path.name == "cmdline":
+                        chunk = chunk.replace(b"\0", b" ")
+                    if not self.write(chunk):
+                        return False
+                    last = chunk[-1:]
+                    if self.over():
+                        self.close(f"in {path}")
+                        return False
+        except OSError as e:
+            last = f"({e.strerror})\n".encode()
+            self.write(last)
+        if last != b"\n":
+            self.write(b"\n")
+        return True
+
+    def run(self) -> None:
+        pids = cgroup.procs(self.cg)
+        self.write(f"# {len(pids)} processes in {self.cg}, {time.time():.3f}\n".encode())
+        paths = [self.cg / name for name in CGROUP_FILES]
+        paths += [Path(f"/proc/{pid}/{name}") for pid in pids for name in PROCESS_FILES]
+        paths += [Path(f"/proc/{pid}/smaps") for pid in pids]
+        for path in paths:
+            if not self.section(path):
+                return
+        self.close("")
+
+# the last snapshot, whose thread may still be blocked in a read
+last: Snapshot | None = None
+last_lock = threading.Lock()
+
+def capture(cg: Path, out: Path, budget: float = BUDGET, cap: int = CAP) -> str | None:
+    """
+    Writes a snapshot of cgroup `cg` to `out`, taking at most `budget` seconds. When it returns,
+    the file is a complete gzip and closed. Returns None if the whole snapshot got written,
+    otherwise where it stopped (or why it wasn't taken).
+    """
+    global last
+    with last_lock:
+        if last is not None and last.thread.is_alive():
+            return f"skipped, {last.out} is still being read"
+        try:
+            snapshot = Snapshot(cg, out, time.monotonic() + budget, cap)
+        except OSError as e:
+            return f"couldn't open {out} ({e.strerror})"
+        last = snapshot
+    snapshot.thread.start()
+    snapshot.thread.join(budget)
+    if snapshot.thread.is_alive():
+        snapshot.stopped = snapshot.stopped or "stopped at the time budget"
+        snapshot.close("while reading a file that blocked")
+    return snapshot.stopped
@@ -0,0 +1,35 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+pyautogui, set up the way the harness uses it, and the clipboard. Importing pyautogui loads
+Pillow and OpenCV and connects to the X display, so lib only imports this module inside the
+functions that drive the screen; everything that only reads results (analysis, pack, ...) never
+loads it and runs without a display. Workloads import pyautogui from here too, so that with
+EXPERIMENTS_SIM set they all get the simulated screen instead (see sim.py).
+"""
+
+from . import sim
+
+if not sim.enabled():
+    import pyautogui
+    from pyautogui import ImageNotFoundException
+    from pyperclip import paste
+    pyautogui.useImageNotFoundException(True)
+else:
+    pyautogui = sim.FakeScreen()
+    ImageNotFoundException = sim.ImageNotFoundException
+    paste = sim.paste
+
+__all__ = ["pyautogui", "ImageNotFoundException", "paste"]
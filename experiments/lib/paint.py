@@ -0,0 +1,159 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Click-to-paint latency: how long after a synthetic click the app first changes what's on the
+screen near it. locate_center_time only says how long until a whole template matched, which
+mostly measures its own polling (each search takes tens of milliseconds).
+
+For each measured click we move the pointer there first and wait for any hover effect to
+settle, grab the region of interest (by default a box around the click) as a reference, click,
+and then grab the region in a tight loop until enough pixels differ from the reference. Grabs
+go straight through Xlib (GetImage of the root window, a few milliseconds for a small region),
+and frames are compared as arrays of 32-bit pixels. The latency is the time from just before
+the click to the start of the first grab that saw the change. `resolution` is the gap since the
+grab before it, so the paint happened in the `resolution` seconds before that.
+
+Every measurement goes to paint.ndjson in the sample directory, and to results.json as
+paint_latency_<name> (plus paint_latency_max over the sample's clicks).
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any
+import numpy as np
+from . import sim
+
+# (left, top, width, height)
+Box = tuple[int, int, int, int]
+
+# the box around a click that's watched by default
+ROI_SIZE = (480, 240)
+# how many pixels must change for it to count as a paint (a blinking caret is about 20)
+MIN_CHANGED = 64
+# give up waiting for a paint after this many seconds
+TIMEOUT = 5.0
+# how long the region must stay the same before the click (hover effects), and at most how long to wait for that
+HOVER_STABLE = 0.1
+HOVER_TIMEOUT = 1.0
+
+class XGrabber:
+    """
+    Grabs screen regions with python-xlib, which pyautogui already uses on Linux.
+    """
+    def __init__(self) -> None:
+        from Xlib import X, display
+        self.display = display.Display()
+        screen = self.display.screen()
+        self.root = screen.root
+        self.size = (screen.width_in_pixels, screen.height_in_pixels)
+        self.format = X.ZPixmap
+
+    def grab(self, box: Box) -> np.ndarray:
+        x, y, w, h = box
+        image = self.root.get_image(x, y, w, h, self.format, 0xffffffff)
+        data = np.frombuffer(image.data, dtype=np.uint8)
+        # usually 32 bits per pixel; compare whole pixels if we can
+        return data.view(np.uint32) if len(data) % 4 == 0 else data
+
+class SimGrabber:
+    """
+    Grabs regions of the simulated desktop's framebuffer.
+    """
+    def __init__(self) -> None:
+        self.screen = sim.FakeScreen()
+        self.size = (sim.WIDTH, sim.HEIGHT)
+
+    def grab(self, box: Box) -> np.ndarray:
+        x, y, w, h = box
+        screen = self.screen.read()
+        if screen is None:
+            return np.zeros(w * h, dtype=np.uint32)
+        # BGR plus a zero byte, so that pixels compare as 32-bit values like with XGrabber
+        region = np.zeros((h, w, 4), dtype=np.uint8)
+        part = screen[y:y + h, x:x + w]
+        region[:part.shape[0], :part.shape[1], :3] = part
+        return region.reshape(-1).view(np.uint32)
+
+def clip(box: Box, size: tuple[int, int]) -> Box:
+    x, y, w, h = box
+    x, y = max(0, min(x, size[0] - 1)), max(0, min(y, size[1] - 1))
+    return (x, y, max(1, min(w, size[0] - x)), max(1, min(h, size[1] - y)))
+
+def around(point: tuple[int, int]) -> Box:
+    w, h = ROI_SIZE
+    return (point[0] - w // 2, point[1] - h // 2, w, h)
+
+def changed(a: np.ndarray, b: np.ndarray) -> int:
+    return int(np.count_nonzero(a != b))
+
+class PaintProbe:
+    """
+    Measures the clicks of one sample; see Context.click.
+    """
+    def __init__(self, out: Path, results: dict[str, Any]):
+        self.out = out
+        self.results = results
+        self.grabber: XGrabber | SimGrabber = SimGrabber() if sim.enabled() else XGrabber()
+        self.latencies: list[float] = []
+
+    def settle_hover(self, box: Box) -> np.ndarray:
+        """
+        Waits until the region has stopped changing (at most HOVER_TIMEOUT) and returns it.
+        """
+        deadline = time.monotonic() + sim.scaled(HOVER_TIMEOUT)
+        frame = self.grabber.grab(box)
+        stable_since = time.monotonic()
+        while time.monotonic() < deadline and time.monotonic() - stable_since < HOVER_STABLE:
+            time.sleep(0.01)
+            now = self.grabber.grab(box)
+            if changed(frame, now) >= MIN_CHANGED:
+                frame = now
+                stable_since = time.monotonic()
+        return frame
+
+    def click(self, name: str, point: tuple[int, int], roi: Box | None = None, timeout: float = TIMEOUT) -> dict[str, Any]:
+        from .gui import pyautogui
+        box = clip(roi if roi is not None else around(point), self.grabber.size)
+        pyautogui.moveTo(*point)
+        reference = self.settle_hover(box)
+        t_input = time.monotonic()
+        pyautogui.click(*point)
+        t_sent = time.monotonic()
+        deadline = t_input + sim.scaled(timeout)
+        frames = 0
+        previous = t_sent
+        record: dict[str, Any] = {"name": name, "x": point[0], "y": point[1], "roi": list(box), "input_send": t_sent - t_input}
+        while True:
+            start = time.monotonic()
+            frame = self.grabber.grab(box)
+            frames += 1
+            n = changed(reference, frame)
+            if n >= MIN_CHANGED:
+                record.update(painted=True, latency=start - t_input, resolution=start - previous, changed_pixels=n)
+                break
+            if start > deadline:
+                record.update(painted=False, latency=None, resolution=None, changed_pixels=n)
+                break
+            previous = start
+        record["frames"] = frames
+        record["t"] = t_input
+        with open(self.out / "paint.ndjson", 'a') as f:
+            f.write(json.dumps(record) + "\n")
+        if record["painted"]:
+            self.results[f"paint_latency_{name}"] = record["latency"]
+            self.latencies.append(record["latency"])
+            self.results["paint_latency_max"] = max(self.latencies)
+        return record
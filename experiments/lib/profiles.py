@@ -0,0 +1,148 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import configparser
+import hashlib
+import os
+import shutil
+import subprocess
+import uuid
+from pathlib import Path
+from typing import Literal
+
+Browser = Literal["chromium", "firefox"]
+
+FIREFOX_PROFILE_NAME = "Experiments"
+
+def firefox_profile_dir(name: str = FIREFOX_PROFILE_NAME) -> Path:
+    """
+    Looks up the directory of the named profile (the one we pass to `firefox -P`) in profiles.ini.
+    """
+    base = Path.home() / ".mozilla" / "firefox"
+    ini = configparser.ConfigParser()
+    ini.read(base / "profiles.ini")
+    for section in ini.sections():
+        if ini.get(section, "Name", fallback=None) == name:
+            path = Path(ini.get(section, "Path"))
+            return base / path if ini.getboolean(section, "IsRelative", fallback=True) else path
+    raise Exception(f"no firefox profile named {name} in {base / 'profiles.ini'}")
+
+def chromium_profile_dir() -> Path:
+    # the snap keeps its user data dir somewhere else
+    for candidate in [Path.home() / ".config" / "chromium", Path.home() / "snap" / "chromium" / "common" / "chromium"]:
+        if candidate.exists():
+            return candidate
+    raise Exception("couldn't find chromium's user data dir")
+
+def profile_dir(browser: Browser) -> Path:
+    if browser == "chromium":
+        return chromium_profile_dir()
+    else:
+        return firefox_profile_dir()
+
+def profile_hash(browser: Browser) -> str:
+    """
+    Identifies which profile a browser runs with: its location plus its installed extensions.
+    This deliberately ignores everything the browser rewrites on every run (caches, session files,
+    prefs timestamps), otherwise no two samples would ever agree.
+    """
+    try:
+        path = profile_dir(browser)
+    except Exception:
+        return "unknown"
+    extensions = path / "Default" / "Extensions" if browser == "chromium" else path / "extensions"
+    h = hashlib.sha256(str(path.resolve()).encode())
+    if extensions.is_dir():
+        for entry in sorted(extensions.iterdir()):
+            h.update(entry.name.encode())
+    return h.hexdigest()[:12]
+
+def default_snapshot_root() -> Path:
+    return Path.home() / ".cache" / "experiments" / "profiles"
+
+def default_work_root() -> Path:
+    return Path("/dev/shm") / "experiments-profiles"
+
+# lock files a running browser leaves behind; a copy must never carry them
+LOCK_FILES = ["SingletonLock", "SingletonSocket", "SingletonCookie", "lock", ".parentlock"]
+
+# left out of the copy for cold-cache runs
+CACHE_DIRS: dict[Browser, list[str]] = {
+    "chromium": ["Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "GraphiteDawnCache", "DawnCache", "DawnGraphiteCache", "CacheStorage", "ScriptCache"],
+    "firefox": ["cache2", "startupCache", "shader-cache", "thumbnails", "jumpListCache"],
+}
+
+class ProfileManager:
+    """
+    Keeps a pristine snapshot of a logged-in browser profile and gives every sample a fresh copy
+    of it, so that caches, history and session files don't pile up over a sweep.
+
+    The snapshot is taken once (from the profile the browser normally uses) into snapshot_root.
+    restore() copies it into work_root, which defaults to a tmpfs (/dev/shm); anywhere else it
+    uses `cp --reflink=auto` so that copy-on-write filesystems don't copy any data. Copying
+    happens in the harness, so the tmpfs pages are charged to the harness's cgroup, not the app's.
+
+    cache: "warm" copies the snapshot's disk caches too; "cold" leaves them out.
+    """
+    def __init__(self, browser: Browser, source: Path | None = None, snapshot_root: Path = default_snapshot_root(), work_root: Path = default_work_root(), cache: Literal["warm", "cold"] = "warm"):
+        self.browser = browser
+        self.source = source
+        self.snapshot = snapshot_root / browser
+        self.work_root = work_root
+        self.cache = cache
+
+    def ensure_snapshot(self, force: bool = False) -> Path:
+        """
+        Takes the snapshot if there isn't a complete one yet. The browser must not be running.
+        """
+        # the .hash file is written last, so a snapshot without one was interrupted
+        hash_file = self.snapshot.with_suffix(".hash")
+        if self.snapshot.exists() and hash_file.exists() and not force:
+            return self.snapshot
+        source = self.source if self.source is not None else profile_dir(self.browser)
+        hash_file.unlink(missing_ok=True)
+        if self.snapshot.exists():
+            shutil.rmtree(self.snapshot)
+        self.snapshot.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copytree(source, self.snapshot, symlinks=True, ignore=shutil.ignore_patterns(*LOCK_FILES))
+        h = hashlib.sha256()
+        for path in sorted(self.snapshot.rglob("*")):
+            if path.is_file() and not path.is_symlink():
+                h.update(str(path.relative_to(self.snapshot)).encode())
+                h.update(path.read_bytes())
+        partial = hash_file.with_suffix(".hash.tmp")
+        partial.write_text(h.hexdigest()[:12])
+        os.replace(partial, hash_file)
+        return self.snapshot
+
+    def hash(self) -> str:
+        return self.snapshot.with_suffix(".hash").read_text().strip()
+
+    def restore(self) -> Path:
+        dest = self.work_root / f"{self.browser}-{uuid.uuid1()}"
+        self.work_root.mkdir(parents=True, exist_ok=True)
+        if self.cache == "cold":
+            shutil.copytree(self.snapshot, dest, symlinks=True, ignore=shutil.ignore_patterns(*CACHE_DIRS[self.browser]))
+        else:
+            subprocess.run(["cp", "-a", "--reflink=auto", str(self.snapshot), str(dest)], check=True)
+        return dest
+
+    def args(self, path: Path) -> list[str]:
+        if self.browser == "chromium":
+            return [f"--user-data-dir={path}"]
+        else:
+            return ["-profile", str(path)]
+
+    def discard(self, path: Path) -> None:
+        shutil.rmtree(path, ignore_errors=True)
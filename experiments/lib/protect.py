@@ -0,0 +1,221 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Keeping the harness out of the workload's reclaim. Near a low MemoryHigh with swap on, the
+kernel also takes pages from the harness (the interpreter, OpenCV, the screenshots it searches),
+and then locate_center and smaps-profiler slow down along with the app and the sweep stops on an
+ImageNotFoundException that's the harness's fault.
+
+HarnessProtection.enter() re-executes the sweep in a scope in its own slice, both with
+MemoryMin, MemoryLow and CPUWeight set, so the harness, its sampler thread and smaps-profiler
+are one protected cgroup. The protection a cgroup actually gets is capped by its ancestors'
+(user@<uid>.service and user-<uid>.slice usually have none), so warnings() says which
+ancestors need raising (as root: systemctl set-property user@<uid>.service MemoryMin=...).
+
+In the re-executed process it then makes the memory the harness touches on every poll stay put:
+malloc is told to keep one arena, to serve screenshot-sized allocations from the heap, and never
+to give freed heap back; the heap is grown by `reserve` bytes up front and locked along with the
+code of the libraries on the polling path (the interpreter, numpy, OpenCV, Pillow, Xlib's
+libraries). pyautogui and OpenCV allocate a new frame per search, so their buffers can't be
+allocated once; this way they are at least carved out of memory that is already locked. mlock is
+limited by RLIMIT_MEMLOCK (8 MiB by default for users; raise LimitMEMLOCK or limits.conf); the
+heap comes first, then the libraries in HOT_LIBRARIES order, and whatever doesn't fit stays
+unlocked.
+
+Each sample gets the harness's memory.current and (on kernels that can reset it) memory.peak,
+and the memory pressure stall time, major faults, refaults and memory.events "low" breaches of
+the harness's cgroup during the sample, as harness_* in results.json.
+"""
+
+import ctypes
+import json
+import os
+import resource
+import subprocess
+from pathlib import Path
+from typing import IO, Any
+from . import cgroup, sim
+
+# substrings of the mapped files worth locking, most important first
+HOT_LIBRARIES = ["python3", "libpython", "_multiarray_umath", "cv2", "libopencv", "_imaging", "libX11", "libxcb", "libXext", "libjpeg", "libpng", "libz"]
+MEMORY_KEYS = ["pgmajfault", "workingset_refault_anon", "workingset_refault_file"]
+# mallopt parameters (malloc.h)
+M_TRIM_THRESHOLD = -1
+M_MMAP_THRESHOLD = -3
+M_ARENA_MAX = -8
+# the largest mmap threshold glibc accepts on 64-bit; a full-screen RGBA frame is below it
+MMAP_THRESHOLD_MAX = 32 * 1024 * 1024
+
+def mappings() -> list[tuple[int, int, str]]:
+    """
+    (start, end, path or [heap]/[stack]/...) of this process's mappings.
+    """
+    ret: list[tuple[int, int, str]] = []
+    with open("/proc/self/maps", 'r') as f:
+        for line in f:
+            fields = line.split(maxsplit=5)
+            start, end = (int(x, 16) for x in fields[0].split("-"))
+            ret.append((start, end, fields[5].strip() if len(fields) > 5 else ""))
+    return ret
+
+def locked_bytes() -> int:
+    with open("/proc/self/status", 'r') as f:
+        for line in f:
+            if line.startswith("VmLck:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def counters(cg: Path) -> dict[str, float]:
+    """
+    The cumulative counters of a cgroup that sample_results reports the differences of.
+    """
+    memory = cgroup.read_flat_keyed(cg / "memory.stat")
+    events = cgroup.read_flat_keyed(cg / "memory.events")
+    pressure = cgroup.read_pressure(cg / "memory.pressure")
+    ret: dict[str, float] = {k: memory[k] for k in MEMORY_KEYS if k in memory}
+    if "low" in events:
+        ret["memory_events_low"] = events["low"]
+    for kind in ["some", "full"]:
+        if "total" in pressure.get(kind, {}):
+            ret[f"memory_pressure_{kind}_usec"] = pressure[kind]["total"]
+    return ret
+
+class HarnessProtection:
+    """
+    Opt-in protection of the harness against the workload's reclaim; see the module docstring.
+    """
+    def __init__(self, memory_min: int = 256 * 1024 * 1024, memory_low: int = 1024 * 1024 * 1024, cpu_weight: int = 1000, reserve: int = 64 * 1024 * 1024, slice: str = "experiments-harness.slice"):
+        self.memory_min = memory_min
+        self.memory_low = memory_low
+        self.cpu_weight = cpu_weight
+        self.reserve = reserve
+        self.slice = slice
+        # bytes locked per mapped file
+        self.locked: dict[str, int] = {}
+        self.peak_file: IO[str] | None = None
+
+    def properties(self) -> dict[str, str]:
+        return {"MemoryMin": str(self.memory_min), "MemoryLow": str(self.memory_low), "CPUWeight": str(self.cpu_weight)}
+
+    def enter(self) -> None:
+        """
+        Call first thing in a sweep: the first time, re-executes it in the protected scope (and
+        doesn't return); in the re-executed process, locks the hot memory.
+        """
+        if not sim.enabled() and not cgroup.in_harness_scope():
+            command = ["systemctl", "--user", "set-property", "--runtime", self.slice]
+            subprocess.run(command + [f"{k}={v}" for k, v in self.properties().items()], check=True)
+            cgroup.reexec_in_scope("harness", self.properties(), self.slice)
+        self.lock()
+
+    def lock(self) -> None:
+        # loaded now (they would be anyway) so that their code is mapped when we lock it
+        import numpy
+        from . import gui
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.malloc.restype = ctypes.c_void_p
+        libc.free.argtypes = [ctypes.c_void_p]
+        libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        # every thread (the sampler, asyncio.to_thread screenshots) allocates from the locked heap
+        libc.mallopt(M_ARENA_MAX, 1)
+        libc.mallopt(M_MMAP_THRESHOLD, MMAP_THRESHOLD_MAX)
+        libc.mallopt(M_TRIM_THRESHOLD, 2**31 - 1)
+        # grow the heap by `reserve`, then give it back to malloc (but not to the kernel)
+        chunks = [libc.malloc(MMAP_THRESHOLD_MAX // 2) for _ in range(self.reserve // (MMAP_THRESHOLD_MAX // 2))]
+        for chunk in chunks:
+            libc.free(chunk)
+        soft, hard = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+        if soft != hard:
+            resource.setrlimit(resource.RLIMIT_MEMLOCK, (hard, hard))
+        limit = hard if hard != resource.RLIM_INFINITY else None
+        maps = mappings()
+        hot = [m for m in maps if m[2] == "[heap]"]
+        for name in HOT_LIBRARIES:
+            hot += [m for m in maps if name in os.path.basename(m[2]) and m not in hot]
+        for start, end, path in hot:
+            if limit is not None and locked_bytes() + (end - start) > limit:
+                continue
+            if libc.mlock(start, end - start) == 0:
+                self.locked[path] = self.locked.get(path, 0) + end - start
+
+    def warnings(self) -> list[str]:
+        """
+        What keeps the protection from working: ancestors with less protection, and what didn't get locked.
+        """
+        ret: list[str] = []
+        if cgroup.in_harness_scope():
+            cg = cgroup.own_cgroup()
+            for ancestor in cg.parents:
+                if ancestor == cgroup.CGROUP_ROOT or not ancestor.is_relative_to(cgroup.CGROUP_ROOT):
+                    break
+                for name, wanted in [("memory.min", self.memory_min), ("memory.low", self.memory_low)]:
+                    value = cgroup.read_int(ancestor / name)
+                    if value is not None and value < wanted:
+                        ret.append(f"{ancestor / name} is {value}, which caps the harness's {name} of {wanted}")
+        else:
+            ret.append("the harness is not in its own scope, so it has no MemoryMin/MemoryLow/CPUWeight")
+        locked = sum(self.locked.values())
+        if locked < self.reserve:
+            ret.append(f"only {locked} bytes are locked; raise RLIMIT_MEMLOCK (now {resource.getrlimit(resource.RLIMIT_MEMLOCK)[0]}) to lock the heap and libraries")
+        return ret
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "slice": self.slice,
+            "cgroup": str(cgroup.own_cgroup()) if cgroup.in_harness_scope() else None,
+            "properties": self.properties(),
+            "reserve": self.reserve,
+            "locked": self.locked,
+            "warnings": self.warnings(),
+        }
+
+    def write(self, path: Path) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.describe(), f, indent=2)
+
+    def snapshot(self) -> dict[str, float]:
+        """
+        The harness cgroup's counters at the start of a sample; also restarts memory.peak.
+        """
+        cg = cgroup.own_cgroup()
+        if self.peak_file is not None:
+            self.peak_file.close()
+            self.peak_file = None
+        try:
+            # writing to memory.peak resets it for this file descriptor (Linux 6.12+)
+            self.peak_file = open(cg / "memory.peak", 'r+')
+            self.peak_file.write("reset\n")
+            self.peak_file.flush()
+        except OSError:
+            if self.peak_file is not None:
+                self.peak_file.close()
+            self.peak_file = None
+        return counters(cg)
+
+    def sample_results(self, before: dict[str, float]) -> dict[str, Any]:
+        """
+        What goes into a sample's results.json: the harness's memory now, its peak during the
+        sample, and its counters since `before`.
+        """
+        after = counters(cgroup.own_cgroup())
+        ret: dict[str, Any] = {f"harness_{k}": v - before[k] for k, v in after.items() if k in before}
+        ret["harness_memory_current"] = cgroup.read_int(cgroup.own_cgroup() / "memory.current")
+        ret["harness_locked"] = locked_bytes()
+        if self.peak_file is not None:
+            self.peak_file.seek(0)
+            ret["harness_memory_peak"] = int(self.peak_file.read())
+            self.peak_file.close()
+            self.peak_file = None
+        return ret
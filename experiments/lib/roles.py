@@ -0,0 +1,175 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Labels the processes of a multi-process browser by what they do (browser, renderer/content, gpu,
+network, ...) and adds up their memory per label.
+
+The sampler side (RoleCollector) stores the raw per-pid numbers in cgroup.ndjson and every pid's
+command line in cmdlines.json, so the classification can be redone on stored data with
+reclassify() if classify() ever changes.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+from . import cgroup
+from .sampler import Collector
+
+CHROMIUM_UTILITY_SUBTYPES = {
+    "network.mojom.NetworkService": "network",
+    "storage.mojom.StorageService": "storage",
+    "audio.mojom.AudioService": "audio",
+    "video_capture.mojom.VideoCaptureService": "media",
+}
+
+# the last argument of `firefox -contentproc ...` is the process type
+FIREFOX_PROCESS_TYPES = {
+    "tab": "content",
+    "gpu": "gpu",
+    "socket": "network",
+    "rdd": "media",
+    "gmplugin": "media",
+    "utility": "utility",
+    "forkserver": "zygote",
+    "vr": "utility",
+}
+
+# content processes all say "tab"; their thread name tells them apart
+FIREFOX_CONTENT_NAMES = {
+    "WebExtensions": "extension",
+    "Privileged Cont": "privileged",
+}
+
+def _flag(cmdline: list[str], name: str) -> str | None:
+    prefix = f"--{name}="
+    for arg in cmdline:
+        if arg.startswith(prefix):
+            return arg[len(prefix):]
+    return None
+
+def classify(cmdline: list[str], comm: str = "") -> str:
+    if not cmdline:
+        return "other" # zombie or kernel thread
+    exe = os.path.basename(cmdline[0])
+    if "crashpad" in exe:
+        return "crashpad"
+    if "-contentproc" in cmdline:
+        role = FIREFOX_PROCESS_TYPES.get(cmdline[-1], "utility")
+        if role == "content":
+            return FIREFOX_CONTENT_NAMES.get(comm, "content")
+        return role
+    if exe.startswith("firefox"):
+        return "utility" if comm == "glxtest" else "browser"
+    if "chrom" in exe:
+        kind = _flag(cmdline, "type")
+        if kind is None:
+            return "browser"
+        if kind == "renderer":
+            return "extension" if "--extension-process" in cmdline else "renderer"
+        if kind == "gpu-process":
+            return "gpu"
+        if kind == "zygote":
+            return "zygote"
+        if kind == "utility":
+            return CHROMIUM_UTILITY_SUBTYPES.get(_flag(cmdline, "utility-sub-type") or "", "utility")
+        return "utility"
+    return "other"
+
+def read_cmdline(pid: int) -> list[str]:
+    try:
+        with open(f"/proc/{pid}/cmdline", 'rb') as f:
+            return [arg.decode(errors="replace") for arg in f.read().split(b"\0") if arg]
+    except OSError:
+        return []
+
+def read_comm(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/comm", 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def read_rollup(pid: int) -> tuple[int, int, int] | None:
+    """
+    (pss, rss, swap) of a process in bytes, or None if it's gone.
+    """
+    fields = {"Pss:": 0, "Rss:": 0, "Swap:": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            for line in f:
+                key = line.split(maxsplit=1)[0]
+                if key in fields:
+                    fields[key] = int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return fields["Pss:"], fields["Rss:"], fields["Swap:"]
+
+def aggregate(procs: list[list[int]], roles: dict[int, str]) -> dict[str, dict[str, int]]:
+    """
+    procs: [pid, pss, rss, swap] rows of one sample
+    roles: role of each pid
+    """
+    ret: dict[str, dict[str, int]] = {}
+    for pid, pss, rss, swap in procs:
+        totals = ret.setdefault(roles.get(pid, "other"), {"pss": 0, "rss": 0, "swap": 0, "n": 0})
+        totals["pss"] += pss
+        totals["rss"] += rss
+        totals["swap"] += swap
+        totals["n"] += 1
+    return ret
+
+class RoleCollector(Collector):
+    """
+    Adds "procs" ([pid, pss, rss, swap] per process) and "roles" (the same summed per role) to
+    the sampler's records, at most once every `interval` seconds since smaps_rollup is not free.
+    """
+    def __init__(self, out: Path, interval: float = 1):
+        self.out = out
+        self.interval = interval
+        self.last = -float("inf")
+        self.cmdlines: dict[int, list[str]] = {}
+        self.comms: dict[int, str] = {}
+        self.roles: dict[int, str] = {}
+        # the last per-role totals, for anything that wants to watch them live
+        self.latest: dict[str, dict[str, int]] = {}
+
+    def sample(self, cg: Path, t: float) -> dict[str, Any] | None:
+        if t - self.last < self.interval:
+            return None
+        self.last = t
+        procs: list[list[int]] = []
+        for pid in cgroup.procs(cg):
+            if pid not in self.roles:
+                self.cmdlines[pid] = read_cmdline(pid)
+                self.comms[pid] = read_comm(pid)
+                self.roles[pid] = classify(self.cmdlines[pid], self.comms[pid])
+            rollup = read_rollup(pid)
+            if rollup is not None:
+                procs.append([pid, *rollup])
+        self.latest = aggregate(procs, self.roles)
+        return {"procs": procs, "roles": self.latest}
+
+    def finish(self, cg: Path | None) -> None:
+        with open(self.out / "cmdlines.json", 'w') as f:
+            json.dump({str(pid): {"cmdline": cmdline, "comm": self.comms[pid], "role": self.roles[pid]} for pid, cmdline in self.cmdlines.items()}, f, indent=2)
+
+def reclassify(records: list[dict[str, Any]], cmdlines: dict[str, Any]) -> list[tuple[float, dict[str, dict[str, int]]]]:
+    """
+    Per-role totals over time from stored cgroup.ndjson records and cmdlines.json, classified
+    with the current classify().
+    """
+    roles = {int(pid): classify(entry["cmdline"], entry.get("comm", "")) for pid, entry in cmdlines.items()}
+    return [(record["t"], aggregate(record["procs"], roles)) for record in records if "procs" in record]
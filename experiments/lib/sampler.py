@@ -0,0 +1,182 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import IO, TYPE_CHECKING, Any, Literal
+from . import cgroup
+
+if TYPE_CHECKING:
+    from .timeline import Periodic
+
+class SteadyState:
+    """
+    tolerance: the memory series counts as flat when (max - min) / max over the window is at most this
+    window: how long (seconds) the series has to stay flat
+    max_time: give up waiting after this many seconds; None means use the workload's own time budget
+    min_time: never end earlier than this many seconds
+    source: "memory.current" reads the unit's cgroup; "pss" sums smaps_rollup over its processes (slower)
+    """
+    def __init__(self, tolerance: float = 0.02, window: float = 5, max_time: float | None = None, min_time: float = 0, source: Literal["memory.current", "pss"] = "memory.current"):
+        self.tolerance = tolerance
+        self.window = window
+        self.max_time = max_time
+        self.min_time = min_time
+        self.source = source
+
+class Collector:
+    """
+    Something the sampler asks for a reading every interval. sample() returns the fields to add
+    to that interval's record in cgroup.ndjson (or None to add nothing); finish() is called once
+    the sampler stops, with the last cgroup it saw.
+    """
+    def sample(self, cg: Path, t: float) -> dict[str, Any] | None:
+        return None
+
+    def finish(self, cg: Path | None) -> None:
+        pass
+
+def pss(pids: list[int]) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass # process exited
+    return total
+
+class Sampler:
+    """
+    Reads the memory of an app's transient unit every `interval` seconds and appends it to
+    cgroup.ndjson next to the app's other output. The last few minutes of the series are also kept
+    in memory so that the harness can react to them (see Context.settle). Runs as a Periodic on the
+    shared timeline.
+    """
+    def __init__(self, unit: str, out: Path, interval: float = 0.5, collectors: list[Collector] = [], with_pss: bool = False):
+        self.unit = unit
+        self.out = out
+        self.interval = interval
+        self.collectors = list(collectors)
+        self.with_pss = with_pss
+        self.cg: Path | None = None
+        # (monotonic time, memory.current, pss or None)
+        self.series: deque[tuple[float, int, int | None]] = deque(maxlen=int(600 / interval))
+        # ticks append from the timeline's worker threads while the harness and the dashboard read
+        self.lock = threading.Lock()
+        self.f: IO[str] | None = None
+        self.periodic: "Periodic | None" = None
+        # ticks that raised (see Periodic)
+        self.errors = 0
+
+    def read(self, cg: Path) -> dict[str, Any] | None:
+        memory_current = cgroup.read_int(cg / "memory.current")
+        if memory_current is None:
+            return None # unit is gone
+        t = time.monotonic()
+        stat = cgroup.read_flat_keyed(cg / "memory.stat")
+        pressure = cgroup.read_pressure(cg / "memory.pressure")
+        record: dict[str, Any] = {
+            "t": t,
+            "wall": time.time(),
+            "memory_current": memory_current,
+            "anon": stat.get("anon"),
+            "file": stat.get("file"),
+            "swap_current": cgroup.read_int(cg / "memory.swap.current"),
+            # compressed size and uncompressed size of what zswap holds for the cgroup
+            "zswap": stat.get("zswap"),
+            "zswapped": stat.get("zswapped"),
+            "pressure_some_total": pressure.get("some", {}).get("total"),
+            "pressure_full_total": pressure.get("full", {}).get("total"),
+        }
+        if self.with_pss:
+            record["pss"] = pss(cgroup.procs(cg))
+        for collector in self.collectors:
+            fields = collector.sample(cg, t)
+            if fields is not None:
+                record.update(fields)
+        with self.lock:
+            self.series.append((t, memory_current, record.get("pss")))
+        return record
+
+    def tick(self, t: float) -> None:
+        if self.cg is None:
+            self.cg = cgroup.unit_cgroup(f"{self.unit}.service")
+        if self.cg is not None:
+            record = self.read(self.cg)
+            if record is not None:
+                if self.f is None:
+                    self.f = open(self.out / "cgroup.ndjson", 'w')
+                self.f.write(json.dumps(record) + "\n")
+
+    def start(self) -> None:
+        from .timeline import timeline
+        # reading smaps_rollup or pagemap can take a while, so ticks run off the loop
+        self.periodic = timeline.every(self.interval, self.tick, blocking=True)
+
+    def stop(self) -> None:
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.errors = self.periodic.errors
+            self.periodic = None
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        for collector in self.collectors:
+            collector.finish(self.cg)
+
+    def points(self) -> list[tuple[float, int, int | None]]:
+        """
+        A copy of the series, safe to iterate while the sampler keeps going.
+        """
+        with self.lock:
+            return list(self.series)
+
+    def recent(self, seconds: float) -> list[tuple[float, int, int | None]]:
+        now = time.monotonic()
+        return [point for point in self.points() if now - point[0] <= seconds]
+
+    def is_steady(self, steady: SteadyState) -> bool:
+        now = time.monotonic()
+        series = self.points()
+        if steady.source == "pss":
+            points = [(t, p) for (t, _m, p) in series if p is not None]
+        else:
+            points = [(t, m) for (t, m, _p) in series]
+        window = [v for (t, v) in points if now - t <= steady.window]
+        # only judge once the series actually covers the whole window
+        if not points or now - points[0][0] < steady.window or len(window) < 2:
+            return False
+        high = max(window)
+        return high == 0 or (high - min(window)) / high <= steady.tolerance
+
+    def wait_steady(self, steady: SteadyState, timeout: float) -> bool:
+        """
+        Blocks until the series has been flat for steady.window seconds (returns True) or until
+        timeout seconds have passed (returns False).
+        """
+        start = time.monotonic()
+        while True:
+            elapsed = time.monotonic() - start
+            if elapsed >= steady.min_time and self.is_steady(steady):
+                return True
+            if elapsed >= timeout:
+                return False
+            time.sleep(min(self.interval, max(timeout - elapsed, 0)))
@@ -0,0 +1,159 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The order a sweep runs its (experiment, level, sample) cells in. A night-long sweep in the
+usual order (experiment by experiment, loosest level first, all samples of a level in a row)
+runs the tight levels late, so whatever drifts over the night (temperature, background
+daemons, page cache, the accounts' sessions) looks like an effect of the memory limit.
+
+- "sweep": the usual order.
+- "random": every cell in one random order.
+- "blocked": SAMPLES blocks, block j holding sample j of every (experiment, level) in random
+  order, so every level is spread evenly over the whole run.
+
+Early stopping still works in any order: once an app takes too long to exit, the cells of that
+experiment that are at least as constrained are skipped wherever they come up. In a shuffled
+order a few tighter cells may already have run by then; they're kept.
+
+To measure the drift itself, a Schedule can also re-run a reference cell (by default the
+loosest level of the first experiment) every few runs. Reference samples go to their own tree,
+<output-dir>/drift/<experiment>/<level>/<NN>, laid out like out/ so the analysis tools read it
+too; see python -m experiments.analysis.drift.
+"""
+
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Literal
+
+Order = Literal["sweep", "random", "blocked"]
+ORDERS: list[Order] = ["sweep", "random", "blocked"]
+
+# one line per run, at the top of the output directory
+SCHEDULE_FILE = "schedule.ndjson"
+DRIFT_DIR = "drift"
+
+class Run:
+    def __init__(self, experiment: str, level: int, sample: int, reference: bool = False):
+        self.experiment = experiment
+        self.level = level
+        # for reference runs, the number of the reference sample
+        self.sample = sample
+        self.reference = reference
+
+class Schedule:
+    """
+    order: see above
+    seed: for the random orders
+    reference_every: run the reference cell before the first run and then after every this
+        many runs; None: never
+    reference: (experiment, level) of the reference cell; None: level 0 of the first experiment
+    """
+    def __init__(self, order: Order = "sweep", seed: int = 0, reference_every: int | None = None, reference: tuple[str, int] | None = None):
+        assert order in ORDERS, f"order must be one of {ORDERS}"
+        assert reference_every is None or reference_every > 0
+        self.order = order
+        self.seed = seed
+        self.reference_every = reference_every
+        self.reference = reference
+
+    def runs(self, levels: dict[str, int], samples: int) -> list[Run]:
+        """
+        Every cell of a sweep, in this schedule's order. `levels` is the number of levels per
+        experiment, in sweep order. Reference runs aren't included; see References.
+        """
+        rng = random.Random(self.seed)
+        cells = [(experiment, i) for experiment, n in levels.items() for i in range(n)]
+        if self.order == "sweep":
+            return [Run(experiment, i, j) for experiment, i in cells for j in range(samples)]
+        if self.order == "random":
+            runs = [Run(experiment, i, j) for experiment, i in cells for j in range(samples)]
+            rng.shuffle(runs)
+            return runs
+        runs = []
+        for j in range(samples):
+            block = list(cells)
+            rng.shuffle(block)
+            runs += [Run(experiment, i, j) for experiment, i in block]
+        return runs
+
+    def reference_cell(self, levels: dict[str, int]) -> tuple[str, int] | None:
+        if self.reference_every is None or not levels:
+            return None
+        return self.reference if self.reference is not None else (next(iter(levels)), 0)
+
+class References:
+    """
+    Decides when the reference cell is due: call due() before each run of the sweep (and once
+    more at the end, with last=True, to close the sweep with a reference run).
+    """
+    def __init__(self, schedule: Schedule, levels: dict[str, int]):
+        self.cell = schedule.reference_cell(levels)
+        self.every = schedule.reference_every
+        self.runs = 0
+        self.taken = 0
+
+    def due(self, last: bool = False) -> Run | None:
+        if self.cell is None or self.every is None:
+            return None
+        if self.runs % self.every != 0 and not last:
+            self.runs += 1
+            return None
+        self.runs += 1
+        run = Run(self.cell[0], self.cell[1], self.taken, reference=True)
+        self.taken += 1
+        return run
+
+def read_log(root: Path) -> list[dict[str, Any]]:
+    """
+    The lines of root's schedule.ndjson so far (none if there is none), without a cut-off last line.
+    """
+    ret: list[dict[str, Any]] = []
+    try:
+        with open(root / SCHEDULE_FILE, 'r') as f:
+            for line in f:
+                try:
+                    ret.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+    except OSError:
+        pass
+    return ret
+
+class ScheduleLog:
+    """
+    Appends a line per run to schedule.ndjson: what ran, where in the order, and when (wall
+    clock, so runs of different processes and the drift tree line up). A log that is opened
+    again (by experiments.repair) goes on from the last position.
+    """
+    def __init__(self, root: Path):
+        self.path = root / SCHEDULE_FILE
+        self.position = len(read_log(root))
+
+    def write(self, run: Run, start: float, outcome: str) -> None:
+        line: dict[str, Any] = {
+            "position": self.position,
+            "experiment": run.experiment,
+            "level": run.level,
+            "sample": run.sample,
+            "reference": run.reference,
+            "start": start,
+            "end": time.time(),
+            "outcome": outcome,
+        }
+        self.position += 1
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(line) + "\n")
@@ -0,0 +1,249 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+A simulated desktop, for running whole sweeps (gui-apps, browser-bench, jobs, repair) in
+seconds without browsers or a screen. Set EXPERIMENTS_SIM (to 1, or to a scenario JSON file) to
+turn it on:
+
+    EXPERIMENTS_SIM=1 ex run out/sim
+
+The harness then puts shims for the programs the workloads start (chromium-browser, firefox,
+dino, ...) first on its PATH. Each shim runs a fake app (`python -m experiments.lib.fakeapp
+<program>`) that still starts in a real transient unit under the real MemoryHigh. The fake app
+allocates and keeps touching `memory_mb`, and after `ready_after` seconds draws every image
+template of the package onto a framebuffer file (screen.npy in the simulation directory). Its
+own delays grow with how far its memory is above the unit's memory.high, like a real app's would.
+
+lib.gui then hands out a FakeScreen instead of pyautogui: locating matches templates against
+the framebuffer with OpenCV, like pyautogui does against the screen, and clicks and key presses
+do nothing. Workload time budgets (locate timeouts, settle, exit timeouts) are divided by
+`speedup`.
+
+The tabs workloads need a browser that really loads pages, so they don't work here.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+SIM_ENV = "EXPERIMENTS_SIM"
+# set in the shims, for the fake apps
+SIM_DIR_ENV = "EXPERIMENTS_SIM_DIR"
+# programs the workloads start or ask for a version
+PROGRAMS = ["chromium-browser", "firefox", "dino", "gnome-calendar", "evolution"]
+WIDTH = 1280
+HEIGHT = 800
+BACKGROUND = 128
+MEGABYTE = 1000 * 1000
+
+class Behavior:
+    """
+    memory_mb: how much memory the fake app allocates and keeps touching
+    grow_seconds: over how many seconds it allocates it
+    ready_after: seconds until it draws its window
+    exit_seconds: how long it takes to exit after SIGTERM
+    steepness: without enough memory, its delays are multiplied by (memory needed / memory.high) ** steepness
+    """
+    def __init__(self, memory_mb: float = 300, grow_seconds: float = 1, ready_after: float = 0.5, exit_seconds: float = 0.5, steepness: float = 3):
+        self.memory_mb = memory_mb
+        self.grow_seconds = grow_seconds
+        self.ready_after = ready_after
+        self.exit_seconds = exit_seconds
+        self.steepness = steepness
+
+    def slowdown(self, high: int | None) -> float:
+        need = self.memory_mb * MEGABYTE
+        if high is None or high >= need:
+            return 1
+        return float((need / max(high, 1)) ** self.steepness)
+
+class Scenario:
+    """
+    speedup: workload time budgets are divided by this
+    programs: Behavior per program; the others get `default`
+    """
+    def __init__(self, speedup: float = 10, default: Behavior = Behavior(), programs: dict[str, Behavior] = {}):
+        self.speedup = speedup
+        self.default = default
+        self.programs = dict(programs)
+
+    def behavior(self, program: str) -> Behavior:
+        return self.programs.get(program, self.default)
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "Scenario":
+        return Scenario(
+            data.get("speedup", 10),
+            Behavior(**data.get("default", {})),
+            {program: Behavior(**behavior) for program, behavior in data.get("programs", {}).items()},
+        )
+
+def enabled() -> bool:
+    return bool(os.environ.get(SIM_ENV))
+
+# scenarios read so far, by the value of EXPERIMENTS_SIM; scaled() gets called inside polling loops
+scenarios: dict[str, Scenario] = {}
+
+def scenario() -> Scenario:
+    value = os.environ.get(SIM_ENV, "")
+    if value not in scenarios:
+        if value and Path(value).is_file():
+            with open(value, 'r') as f:
+                scenarios[value] = Scenario.from_json(json.load(f))
+        else:
+            scenarios[value] = Scenario()
+    return scenarios[value]
+
+def scaled(seconds: float) -> float:
+    """
+    A workload time budget, shortened by the scenario's speedup if the simulation is on.
+    """
+    return seconds / scenario().speedup if enabled() else seconds
+
+def directory() -> Path:
+    return Path(os.environ.get(SIM_DIR_ENV) or f"/dev/shm/experiments-sim-{os.getuid()}")
+
+def setup() -> None:
+    """
+    Creates the simulation directory and the program shims, and puts the shims first on PATH.
+    The shims carry everything the fake app needs, since units don't get our environment.
+    """
+    sim_dir = directory()
+    bin_dir = sim_dir / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    root = Path(__file__).resolve().parent.parent.parent
+    for program in PROGRAMS:
+        shim = bin_dir / program
+        shim.write_text(
+            "#!/bin/sh\n"
+            f"export {SIM_ENV}='{os.environ.get(SIM_ENV, '1')}' {SIM_DIR_ENV}='{sim_dir}' PYTHONPATH='{root}'\n"
+            f"exec '{sys.executable}' -m experiments.lib.fakeapp {program} \"$@\"\n"
+        )
+        shim.chmod(0o755)
+    if not os.environ.get("PATH", "").startswith(f"{bin_dir}:"):
+        os.environ["PATH"] = f"{bin_dir}:{os.environ.get('PATH', '')}"
+    os.environ[SIM_DIR_ENV] = str(sim_dir)
+    clear_screen()
+
+# framebuffer
+
+def screen_path() -> Path:
+    return directory() / "screen.npy"
+
+def templates() -> list[Path]:
+    return sorted(Path(__file__).resolve().parent.parent.glob("**/*.png"))
+
+def draw_screen() -> None:
+    """
+    Draws every template of the package, row by row, and publishes the result atomically.
+    """
+    import cv2
+    import numpy as np
+    screen = np.full((HEIGHT, WIDTH, 3), BACKGROUND, dtype=np.uint8)
+    x = y = row = 20
+    row_height = 0
+    for path in templates():
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        h, w = image.shape[:2]
+        if x + w > WIDTH - 20:
+            x = row
+            y += row_height + 20
+            row_height = 0
+        if y + h > HEIGHT:
+            break
+        screen[y:y + h, x:x + w] = image
+        x += w + 20
+        row_height = max(row_height, h)
+    # the rest is background; a smaller screen is faster to search
+    screen = screen[:min(HEIGHT, y + row_height + 20)]
+    tmp = screen_path().with_suffix(".tmp.npy")
+    np.save(tmp, screen)
+    os.replace(tmp, screen_path())
+
+def clear_screen() -> None:
+    try:
+        screen_path().unlink()
+    except FileNotFoundError:
+        pass
+
+def clipboard_path() -> Path:
+    return directory() / "clipboard"
+
+class ImageNotFoundException(Exception):
+    pass
+
+class FakeScreen:
+    """
+    The parts of pyautogui the workloads use, against the framebuffer.
+    """
+    def __init__(self) -> None:
+        self.cache: dict[str, Any] = {}
+        self.events = 0
+        # (mtime, screen) of the last framebuffer read
+        self.screen: tuple[int, Any] | None = None
+
+    def read(self) -> Any:
+        import numpy as np
+        try:
+            mtime = screen_path().stat().st_mtime_ns
+            if self.screen is None or self.screen[0] != mtime:
+                self.screen = (mtime, np.load(screen_path()))
+            return self.screen[1]
+        except (OSError, ValueError):
+            return None
+
+    def template(self, path: str) -> Any:
+        import cv2
+        if path not in self.cache:
+            self.cache[path] = cv2.imread(path)
+        return self.cache[path]
+
+    def locateCenterOnScreen(self, image: str, minSearchTime: float = 0, confidence: float = 0.999) -> tuple[int, int]:
+        import cv2
+        template = self.template(image)
+        start = time.monotonic()
+        while True:
+            screen = self.read()
+            if screen is not None and template is not None:
+                scores = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
+                _low, high, _low_at, (x, y) = cv2.minMaxLoc(scores)
+                if high >= confidence:
+                    h, w = template.shape[:2]
+                    return (x + w // 2, y + h // 2)
+            if time.monotonic() - start >= minSearchTime:
+                raise ImageNotFoundException(image)
+            time.sleep(0.05)
+
+    def screenshot(self, path: str | Path) -> None:
+        import cv2
+        screen = self.read()
+        if screen is not None:
+            cv2.imwrite(str(path), screen)
+
+    def click(self, *args: Any, **kwargs: Any) -> None:
+        self.events += 1
+
+    tripleClick = moveTo = write = press = hotkey = click
+
+def paste() -> str:
+    try:
+        return clipboard_path().read_text()
+    except OSError:
+        return ""
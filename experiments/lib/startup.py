@@ -0,0 +1,142 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Cold and warm starts. Without help, the first sample of a level starts an app whose binaries
+and libraries may or may not still be in the page cache, depending on what ran before. Here we
+decide it: "cold" evicts the app's files from the page cache before it starts (vmtouch -e,
+i.e. posix_fadvise(POSIX_FADV_DONTNEED)), "warm" reads them all in first (vmtouch -t).
+
+Which files the app maps is only known once it has run, so every run records the files mapped
+by the processes in its cgroup (MappedFiles), and the next start of the same program uses that
+list. The very first start only covers the executable and the profile.
+
+Eviction only drops clean pages nobody else has mapped, so files that are also mapped by a
+running process (e.g. libc) stay cached. Pages read in by "warm" are charged to the harness's
+cgroup rather than the app's, like pages left over from a previous run would be.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Literal
+
+StartMode = Literal["cold", "warm"]
+
+# read files in chunks of this many bytes when warming them
+CHUNK = 1 << 20
+
+def mapped_files(pids: Iterable[int]) -> set[str]:
+    """
+    Regular files mapped by any of the processes (their executables, libraries, fonts, ...).
+    """
+    ret: set[str] = set()
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/maps", 'r') as f:
+                for line in f:
+                    fields = line.split(maxsplit=5)
+                    if len(fields) == 6:
+                        path = fields[5].rstrip("\n")
+                        if path.startswith("/") and not path.startswith(("/dev/", "/memfd:")) and not path.endswith(" (deleted)"):
+                            ret.add(path)
+        except OSError:
+            pass # process exited
+    return ret
+
+def walk_files(paths: Iterable[Path]) -> Iterator[Path]:
+    for path in paths:
+        if path.is_dir():
+            for dirpath, _dirnames, filenames in os.walk(path):
+                for filename in filenames:
+                    yield Path(dirpath) / filename
+        elif path.is_file():
+            yield path
+
+def evict(paths: Iterable[Path]) -> tuple[int, int]:
+    """
+    Asks the kernel to drop the files' pages from the page cache. Returns (files, bytes).
+    """
+    files = 0
+    size = 0
+    for path in walk_files(paths):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            files += 1
+            size += os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+    return files, size
+
+def pretouch(paths: Iterable[Path]) -> tuple[int, int]:
+    """
+    Reads the files, so that all of their pages are in the page cache. Returns (files, bytes).
+    """
+    files = 0
+    size = 0
+    buf = bytearray(CHUNK)
+    for path in walk_files(paths):
+        try:
+            with open(path, 'rb', buffering=0) as f:
+                while (n := f.readinto(buf)):
+                    size += n
+        except OSError:
+            continue
+        files += 1
+    return files, size
+
+def default_cache_dir() -> Path:
+    return Path.home() / ".cache" / "experiments" / "mapped-files"
+
+class MappedFiles:
+    """
+    The files each program mapped the last time it ran, keyed by its executable.
+    """
+    def __init__(self, root: Path = default_cache_dir()):
+        self.root = root
+
+    def key(self, command: list[str]) -> str:
+        exe = shutil.which(command[0]) or command[0]
+        return f"{Path(exe).name}-{hashlib.sha256(exe.encode()).hexdigest()[:12]}"
+
+    def load(self, command: list[str]) -> set[str]:
+        try:
+            with open(self.root / f"{self.key(command)}.json", 'r') as f:
+                return set(json.load(f))
+        except (OSError, ValueError):
+            return set()
+
+    def save(self, command: list[str], files: set[str]) -> None:
+        # keep what earlier runs mapped too; not every run loads every library
+        files = files | self.load(command)
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / f"{self.key(command)}.json", 'w') as f:
+            json.dump(sorted(files), f, indent=2)
+
+def prepare(mode: StartMode, command: list[str], extra: list[Path], known: MappedFiles) -> dict[str, int | str]:
+    """
+    Evicts or warms the files the program mapped last time, its executable, and `extra` (e.g.
+    its profile). Returns what to record in results.json.
+    """
+    exe = shutil.which(command[0])
+    paths = [Path(p) for p in known.load(command)] + ([Path(exe)] if exe is not None else []) + extra
+    files, size = evict(paths) if mode == "cold" else pretouch(paths)
+    return {"start_mode": mode, "start_files": files, "start_bytes": size}
@@ -0,0 +1,304 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+What reclaim can push memory to: a swapfile on disk, a zram device, or zswap in front of a
+swapfile. A sweep can be run once per backend (SWAP_BACKENDS in experiments/__init__.py), each
+into its own tree, so `ex compare` and `ex knee` show how much compressed swap moves each
+workload's knee.
+
+Setting a backend up needs root for swapon/swapoff, mkswap, zramctl and the zswap module
+parameters. Every command goes through `sudo -n`, so give the user running the sweep a
+passwordless sudoers rule for them; without one, setup fails right away instead of hanging on a
+password prompt. While a backend is active, every other swap area is off and zswap is off (unless
+the backend is zswap). Afterwards the swap areas that were active before come back, and the zswap
+parameters are restored.
+
+Each sample gets the backend's name in results.json, how much was swapped in and out during the
+sample system-wide (/proc/vmstat: pswpin, pswpout and, for zswap, zswpin, zswpout, zswpwb), and
+the compression ratio at the end of the sample: zram's mm_stat, or zswap's pool in debugfs.
+"""
+
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import Any
+from .design import human_value
+
+VMSTAT_KEYS = ["pswpin", "pswpout", "zswpin", "zswpout", "zswpwb"]
+ZSWAP_PARAMETERS = Path("/sys/module/zswap/parameters")
+ZSWAP_DEBUG = Path("/sys/kernel/debug/zswap")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+def privileged(*command: str) -> str:
+    """
+    Runs a command as root without prompting, and returns its output.
+    """
+    res = subprocess.run(["sudo", "-n", *command], capture_output=True, text=True)
+    if res.returncode != 0:
+        raise Exception(f"sudo -n {' '.join(command)} failed: {res.stderr.strip()}")
+    return res.stdout
+
+def write_sysfs(path: Path, value: str) -> None:
+    subprocess.run(["sudo", "-n", "tee", str(path)], input=value, capture_output=True, text=True, check=True)
+
+def active_swaps() -> list[tuple[str, int]]:
+    """
+    (device or file, priority) of every active swap area, from /proc/swaps.
+    """
+    ret: list[tuple[str, int]] = []
+    with open("/proc/swaps", 'r') as f:
+        for line in f.readlines()[1:]:
+            fields = line.split()
+            if fields:
+                # /proc/swaps escapes spaces in paths
+                ret.append((fields[0].replace("\\040", " "), int(fields[4])))
+    return ret
+
+def read_vmstat() -> dict[str, int]:
+    ret: dict[str, int] = {}
+    with open("/proc/vmstat", 'r') as f:
+        for line in f:
+            key, value = line.split()
+            if key in VMSTAT_KEYS:
+                ret[key] = int(value)
+    return ret
+
+def zswap_parameters() -> dict[str, str]:
+    ret: dict[str, str] = {}
+    for name in ["enabled", "max_pool_percent", "compressor"]:
+        try:
+            ret[name] = (ZSWAP_PARAMETERS / name).read_text().strip()
+        except OSError:
+            pass
+    return ret
+
+def set_zswap(parameters: dict[str, str]) -> None:
+    current = zswap_parameters()
+    # the compressor has to be set while zswap is off to apply to the whole pool
+    for name in ["compressor", "max_pool_percent", "enabled"]:
+        if name in parameters and name in current and parameters[name] != current[name]:
+            write_sysfs(ZSWAP_PARAMETERS / name, parameters[name])
+
+class SwapBackend:
+    """
+    One way to swap. name() is used for the backend's tree (swap-<name>) and in results.json.
+    """
+    def name(self) -> str:
+        raise NotImplementedError
+
+    def setup(self) -> None:
+        raise NotImplementedError
+
+    def teardown(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Readings that only make sense at a point in time, like the compression ratio.
+        """
+        return {}
+
+    def to_json(self) -> dict[str, Any]:
+        return {"type": type(self).__name__, "name": self.name()}
+
+class NoSwap(SwapBackend):
+    def name(self) -> str:
+        return "none"
+
+    def setup(self) -> None:
+        pass
+
+    def teardown(self) -> None:
+        pass
+
+class Swapfile(SwapBackend):
+    """
+    A swapfile of `size` bytes at `path`, created for the block of runs and removed after it.
+    """
+    def __init__(self, path: str | Path, size: int, priority: int = 10):
+        self.path = Path(path)
+        self.size = size
+        self.priority = priority
+
+    def name(self) -> str:
+        return f"swapfile-{human_value('MemorySwapMax', self.size)}"
+
+    def setup(self) -> None:
+        privileged("dd", "if=/dev/zero", f"of={self.path}", "bs=1M", f"count={-(-self.size // (1024 * 1024))}", "status=none")
+        privileged("chmod", "600", str(self.path))
+        privileged("mkswap", str(self.path))
+        privileged("swapon", "-p", str(self.priority), str(self.path))
+
+    def teardown(self) -> None:
+        # setup may have failed before swapon
+        if any(Path(path) == self.path for path, _priority in active_swaps()):
+            privileged("swapoff", str(self.path))
+        privileged("rm", "-f", str(self.path))
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(super().to_json(), path=str(self.path), size=self.size, priority=self.priority)
+
+class Zram(SwapBackend):
+    """
+    A zram device of `size` bytes (uncompressed) with `compressor` (lzo-rle, lz4, zstd, ...).
+    """
+    def __init__(self, size: int, compressor: str = "zstd", priority: int = 100):
+        self.size = size
+        self.compressor = compressor
+        self.priority = priority
+        self.device: str | None = None
+
+    def name(self) -> str:
+        return f"zram-{self.compressor}-{human_value('MemorySwapMax', self.size)}"
+
+    def setup(self) -> None:
+        privileged("modprobe", "zram")
+        self.device = privileged("zramctl", "--find", "--size", str(self.size), "--algorithm", self.compressor).strip()
+        privileged("mkswap", self.device)
+        privileged("swapon", "-p", str(self.priority), self.device)
+
+    def teardown(self) -> None:
+        if self.device is None:
+            return
+        try:
+            # setup may have failed before swapon
+            if any(path == self.device for path, _priority in active_swaps()):
+                privileged("swapoff", self.device)
+        finally:
+            # the device was allocated by zramctl --find either way
+            privileged("zramctl", "--reset", self.device)
+            self.device = None
+
+    def stats(self) -> dict[str, Any]:
+        if self.device is None:
+            return {}
+        try:
+            fields = (Path("/sys/block") / Path(self.device).name / "mm_stat").read_text().split()
+        except OSError:
+            return {}
+        # orig_data_size compr_data_size mem_used_total ...
+        orig, compressed, used = int(fields[0]), int(fields[1]), int(fields[2])
+        return {
+            "zram_orig_data_size": orig,
+            "zram_compr_data_size": compressed,
+            "zram_mem_used_total": used,
+            "compression_ratio": orig / compressed if compressed else None,
+        }
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(super().to_json(), size=self.size, compressor=self.compressor, priority=self.priority, device=self.device)
+
+class Zswap(SwapBackend):
+    """
+    zswap on (or off, to compare) in front of a backing swap area, with its pool limited to
+    `max_pool_percent` of RAM.
+    """
+    def __init__(self, backing: SwapBackend, enabled: bool = True, max_pool_percent: int = 20, compressor: str = "zstd"):
+        self.backing = backing
+        self.enabled = enabled
+        self.max_pool_percent = max_pool_percent
+        self.compressor = compressor
+
+    def name(self) -> str:
+        if not self.enabled:
+            return f"zswap-off-{self.backing.name()}"
+        return f"zswap-{self.compressor}-{self.max_pool_percent}pct-{self.backing.name()}"
+
+    def setup(self) -> None:
+        self.backing.setup()
+        set_zswap({"compressor": self.compressor, "max_pool_percent": str(self.max_pool_percent), "enabled": "Y" if self.enabled else "N"})
+
+    def teardown(self) -> None:
+        self.backing.teardown()
+
+    def stats(self) -> dict[str, Any]:
+        ret = self.backing.stats()
+        try:
+            pool = int(privileged("cat", str(ZSWAP_DEBUG / "pool_total_size")))
+            stored = int(privileged("cat", str(ZSWAP_DEBUG / "stored_pages")))
+        except Exception:
+            return ret
+        ret.update({"zswap_pool_total_size": pool, "zswap_stored_pages": stored, "compression_ratio": stored * PAGE_SIZE / pool if pool else None})
+        return ret
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(super().to_json(), backing=self.backing.to_json(), enabled=self.enabled, max_pool_percent=self.max_pool_percent, compressor=self.compressor)
+
+class ActiveSwap:
+    """
+    A backend set up for a block of runs (use as a context manager). Remembers what was there
+    before and puts it back on exit.
+    """
+    def __init__(self, backend: SwapBackend):
+        self.backend = backend
+        self.previous_swaps: list[tuple[str, int]] = []
+        self.previous_zswap: dict[str, str] = {}
+
+    def __enter__(self) -> "ActiveSwap":
+        self.previous_swaps = active_swaps()
+        self.previous_zswap = zswap_parameters()
+        try:
+            for path, _priority in self.previous_swaps:
+                privileged("swapoff", path)
+            if self.previous_zswap.get("enabled") == "Y":
+                set_zswap({"enabled": "N"})
+            self.backend.setup()
+        except BaseException:
+            # whatever part of the backend did get set up (e.g. zswap's backing swapfile)
+            try:
+                self.backend.teardown()
+            except Exception:
+                pass
+            self.restore()
+            raise
+        return self
+
+    def restore(self) -> None:
+        set_zswap(self.previous_zswap)
+        # a failed setup may have left some of them on
+        active = [path for path, _priority in active_swaps()]
+        for path, priority in self.previous_swaps:
+            if path not in active:
+                privileged("swapon", "-p", str(priority), path)
+
+    def __exit__(self, *_exc: Any) -> None:
+        try:
+            self.backend.teardown()
+        finally:
+            self.restore()
+
+    def describe(self) -> dict[str, Any]:
+        """
+        What swap.json records about the block: the backend, the swap areas and zswap settings it ran with.
+        """
+        return {"backend": self.backend.to_json(), "swaps": active_swaps(), "zswap": zswap_parameters()}
+
+    def snapshot(self) -> dict[str, int]:
+        return read_vmstat()
+
+    def sample_results(self, before: dict[str, int]) -> dict[str, Any]:
+        """
+        What goes into a sample's results.json: the backend, vmstat deltas since `before`, and stats.
+        """
+        after = read_vmstat()
+        ret: dict[str, Any] = {"swap_backend": self.backend.name()}
+        ret.update({f"system_{k}": v - before.get(k, 0) for k, v in after.items()})
+        ret.update(self.backend.stats())
+        return ret
+
+    def write(self, path: Path) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.describe(), f, indent=2)
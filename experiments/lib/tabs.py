@@ -0,0 +1,255 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+The tab scaling workload (tabs_chromium, tabs_firefox): open more and more tabs of local pages
+in one browser and see what each extra tab costs, and at how many tabs the browser starts
+discarding tabs or thrashing.
+
+The pages come from PageServer, which serves them from several loopback addresses so that they
+count as different sites (and get their own renderer processes with site isolation). Each page
+allocates and touches some memory and reports back to the server when it has loaded and when
+it is hidden, so that load times and reloads are seen without looking at the screen.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import TYPE_CHECKING, Any
+from .gui import pyautogui
+from . import cgroup
+from .profiles import Browser
+from .sampler import pss
+
+if TYPE_CHECKING:
+    from . import Context
+
+# tab counts to measure at, in order
+TAB_COUNTS = [1, 2, 4, 8, 16, 32, 64]
+# how many different sites (loopback addresses 127.0.0.1, 127.0.0.2, ...) the pages come from
+SITES = 8
+# how much memory each page allocates and touches (MiB), besides its DOM
+PAGE_MB = 16
+# a tab that hasn't loaded after this many seconds means the browser is thrashing
+LOAD_TIMEOUT = 30
+# or memory.pressure "full" avg10 at least this (percent)
+THRASHING_PRESSURE = 10
+# seconds to let the browser settle after reaching each tab count
+SETTLE = 10
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>tab {i}</title></head>
+<body>
+<h1>tab {i}</h1>
+<div id="nodes"></div>
+<script>
+const data = new Uint8Array({mb} * 1048576);
+for (let j = 0; j < data.length; j += 4096) data[j] = j & 255;
+const nodes = document.getElementById("nodes");
+for (let j = 0; j < 2000; j++) {{
+  const div = document.createElement("div");
+  div.textContent = "node " + j;
+  nodes.appendChild(div);
+}}
+window.addEventListener("load", () => {{
+  fetch("/event/{i}/load?discarded=" + (document.wasDiscarded ? 1 : 0));
+}});
+window.addEventListener("pagehide", () => navigator.sendBeacon("/event/{i}/hide"));
+</script>
+</body></html>
+"""
+
+class PageServer:
+    """
+    Serves /page/<i> from `sites` loopback addresses and records the events the pages send back:
+    for every tab, the times (monotonic) it loaded, whether the browser said it had been
+    discarded, and when it was hidden.
+    """
+    def __init__(self, sites: int = SITES, page_mb: int = PAGE_MB):
+        self.page_mb = page_mb
+        self.lock = threading.Condition()
+        self.loads: dict[int, list[tuple[float, bool]]] = {}
+        self.hides: dict[int, list[float]] = {}
+        self.servers: list[ThreadingHTTPServer] = []
+        for k in range(sites):
+            server = ThreadingHTTPServer((f"127.0.0.{k + 1}", 0), self.handler())
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+
+    def handler(self) -> type[BaseHTTPRequestHandler]:
+        pages = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if len(parts) == 2 and parts[0] == "page" and parts[1].isdigit():
+                    body = PAGE.format(i=int(parts[1]), mb=pages.page_mb).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Cache-Control", "no-store")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if len(parts) == 3 and parts[0] == "event" and parts[1].isdigit():
+                    pages.event(int(parts[1]), parts[2], "discarded=1" in self.path)
+                self.send_response(204)
+                self.end_headers()
+
+            def do_POST(self) -> None:
+                # sendBeacon
+                self.do_GET()
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def event(self, i: int, kind: str, discarded: bool) -> None:
+        with self.lock:
+            if kind == "load":
+                self.loads.setdefault(i, []).append((time.monotonic(), discarded))
+            elif kind == "hide":
+                self.hides.setdefault(i, []).append(time.monotonic())
+            self.lock.notify_all()
+
+    def url(self, i: int) -> str:
+        host, port = self.servers[i % len(self.servers)].server_address[:2]
+        return f"http://{host!s}:{port}/page/{i}"
+
+    def wait_loaded(self, i: int, since: float, timeout: float) -> float | None:
+        """
+        Seconds from `since` until tab i loaded (again), or None if it didn't within timeout.
+        """
+        deadline = since + timeout
+        with self.lock:
+            while True:
+                loads = [t for (t, _d) in self.loads.get(i, []) if t >= since]
+                if loads:
+                    return loads[0] - since
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.lock.wait(remaining)
+
+    def reloaded(self, since: float) -> dict[int, bool]:
+        """
+        Tabs that loaded again since `since`, and whether the browser said they had been discarded.
+        """
+        with self.lock:
+            return {i: any(d for (t, d) in loads if t >= since) for i, loads in self.loads.items() if any(t >= since for (t, _d) in loads)}
+
+    def hidden(self, since: float) -> list[int]:
+        """
+        Tabs whose page went away (pagehide) since `since`, e.g. because the browser unloaded them.
+        """
+        with self.lock:
+            return sorted(i for i, hides in self.hides.items() if any(t >= since for t in hides))
+
+    def close(self) -> None:
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+def open_tab(url: str) -> None:
+    pyautogui.hotkey('ctrl', 't')
+    time.sleep(0.5)
+    pyautogui.write(url, interval=0.02)
+    pyautogui.press('enter')
+
+def visit_all(n: int) -> None:
+    """
+    Activates every one of the n open tabs once, which makes discarded tabs load again.
+    """
+    for _ in range(n):
+        pyautogui.hotkey('ctrl', 'tab')
+        time.sleep(0.5)
+
+def measure(ctx: "Context") -> dict[str, Any]:
+    assert ctx.app is not None
+    cg = cgroup.unit_cgroup(f"{ctx.app.unit_name}.service")
+    if cg is None:
+        return {}
+    pressure = cgroup.read_pressure(cg / "memory.pressure")
+    return {
+        "pss": pss(cgroup.procs(cg)),
+        "memory_current": cgroup.read_int(cg / "memory.current"),
+        "swap_current": cgroup.read_int(cg / "memory.swap.current"),
+        "pressure_full_avg10": pressure.get("full", {}).get("avg10"),
+    }
+
+def run(ctx: "Context", browser: Browser, version: str, do_baseline: bool) -> None:
+    """
+    Opens tabs up to each count in TAB_COUNTS and writes one line per count to tabs.ndjson: the
+    app's PSS and memory, the incremental PSS per tab since the previous count, how long each
+    new tab took to load, which tabs the browser unloaded, and which tabs came back discarded
+    when all of them were visited (Chromium only; None for Firefox).
+    Stops early once a tab doesn't load within LOAD_TIMEOUT or memory pressure gets too high.
+    """
+    measure_baseline = ctx.needs_baseline(browser, version, do_baseline)
+    pages = PageServer()
+    try:
+        start = time.monotonic()
+        with ctx.monitor(browser), ctx.start_app(ctx.browser_command(browser, "about:blank" if measure_baseline else pages.url(0))), ctx.open("tabs.ndjson", 'w') as f:
+            if measure_baseline:
+                ctx.measure_baseline(browser, version)
+                ctx.screenshot("blank.png")
+                # the first page goes into the blank tab
+                start = time.monotonic()
+                pyautogui.hotkey('ctrl', 'l')
+                pyautogui.write(pages.url(0), interval=0.02)
+                pyautogui.press('enter')
+            # unless we measured a baseline, this includes starting the browser
+            first_load = pages.wait_loaded(0, start, LOAD_TIMEOUT)
+            opened = 1
+            previous: dict[str, Any] = {}
+            for count in TAB_COUNTS:
+                step_start = time.monotonic()
+                load_times: list[float | None] = [first_load] if count == 1 else []
+                while opened < count:
+                    since = time.monotonic()
+                    open_tab(pages.url(opened))
+                    load_times.append(pages.wait_loaded(opened, since, LOAD_TIMEOUT))
+                    opened += 1
+                    if load_times[-1] is None:
+                        break
+                time.sleep(SETTLE)
+                record: dict[str, Any] = dict(measure(ctx), tabs=opened, load_times=load_times)
+                if previous.get("pss") is not None and record.get("pss") is not None:
+                    record["pss_per_tab"] = (record["pss"] - previous["pss"]) / (opened - previous["tabs"])
+                since = time.monotonic()
+                visit_all(opened)
+                time.sleep(2)
+                reloaded = pages.reloaded(since)
+                record["reloaded"] = sorted(reloaded)
+                # document.wasDiscarded is Chromium-only; Firefox's unloaded tabs just show up as reloaded
+                record["discarded"] = sorted(i for i, d in reloaded.items() if d) if browser == "chromium" else None
+                record["unloaded"] = pages.hidden(step_start)
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                ctx.logger.info(f"{opened} tabs: pss {record.get('pss')}, {len(record['reloaded'])} reloaded")
+                if reloaded and "discarding_at" not in ctx.results:
+                    ctx.record("discarding_at", opened)
+                pressure = record.get("pressure_full_avg10")
+                if None in load_times or (pressure is not None and pressure >= THRASHING_PRESSURE):
+                    ctx.record("thrashing_at", opened)
+                    ctx.logger.warning(f"thrashing at {opened} tabs, not opening any more")
+                    break
+                previous = record
+            ctx.record("tabs_opened", opened)
+            ctx.screenshot("app.png")
+    finally:
+        pages.close()
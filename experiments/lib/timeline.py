@@ -0,0 +1,111 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+One asyncio event loop, on one background thread, for everything the harness does alongside a
+workload: sampling the app's cgroup, the sampler's collectors, and shutting the app down. They
+are tasks on the same loop and share time.monotonic() as their clock, so a new periodic reading
+is a Periodic (or a Collector) rather than another thread with its own sleep loop.
+
+The workloads themselves stay synchronous, since pyautogui blocks and every workload drives it
+step by step. They hand work to the loop with `timeline.run` (wait for the result) or
+`timeline.every` (call something periodically until stopped).
+"""
+
+import asyncio
+import threading
+import time
+from collections.abc import Callable, Coroutine
+from concurrent.futures import Future
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+class Periodic:
+    """
+    Calls tick(t) every `interval` seconds on a fixed grid of monotonic deadlines (a slow tick
+    skips the deadlines it missed instead of drifting). With blocking=True, ticks run in the loop's
+    executor, so that a slow one (e.g. walking every process's pagemap) doesn't hold up the other
+    tasks; a tick never overlaps the previous one. A tick that raises is counted in `errors` (the
+    first one is logged) and the next one runs as usual, so one bad reading doesn't end the series.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float, tick: Callable[[float], Any], blocking: bool):
+        self.loop = loop
+        self.interval = interval
+        self.tick = tick
+        self.blocking = blocking
+        self.stopped = False
+        self.errors = 0
+        self.wake = asyncio.Event()
+        self.future: Future[None] = asyncio.run_coroutine_threadsafe(self.run(), loop)
+
+    async def run(self) -> None:
+        start = time.monotonic()
+        k = 0
+        while not self.stopped:
+            now = time.monotonic()
+            try:
+                if self.blocking:
+                    await asyncio.to_thread(self.tick, now)
+                else:
+                    self.tick(now)
+            except Exception:
+                if self.errors == 0:
+                    # imported here because only a failing tick needs it
+                    import logging
+                    logging.getLogger(__name__).exception(f"{self.tick} failed; counting further failures without logging them")
+                self.errors += 1
+            k = max(k + 1, int((time.monotonic() - start) / self.interval) + 1)
+            try:
+                await asyncio.wait_for(self.wake.wait(), start + k * self.interval - time.monotonic())
+            except TimeoutError:
+                pass
+
+    def stop(self) -> None:
+        """
+        Stops after the tick in progress (if any) and waits for it.
+        """
+        self.stopped = True
+        self.loop.call_soon_threadsafe(self.wake.set)
+        self.future.result()
+
+class Timeline:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        The loop, started on a daemon thread the first time it's needed.
+        """
+        with self.lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="timeline", daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        return asyncio.run_coroutine_threadsafe(coro, self.get_loop())
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """
+        Runs a coroutine on the loop and blocks until it's done.
+        """
+        return self.submit(coro).result()
+
+    def every(self, interval: float, tick: Callable[[float], Any], blocking: bool = False) -> Periodic:
+        return Periodic(self.get_loop(), interval, tick, blocking)
+
+timeline = Timeline()
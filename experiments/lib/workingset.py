@@ -0,0 +1,176 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Working set estimation: how much of its resident memory the app actually touched in each
+interval, as opposed to how much is merely resident (RSS/PSS).
+
+With idle page tracking (https://docs.kernel.org/admin-guide/mm/idle_page_tracking.html, needs
+root) we look up the physical pages of every process in the app's cgroup through
+/proc/<pid>/pagemap, count the ones whose idle bit got cleared since the last interval (those
+were accessed), and then mark them all idle again. Pages shared between processes count once.
+
+Without it we fall back to the cgroup's workingset_* counters, which only tell us how much
+memory had to be faulted back in after being reclaimed. We don't probe with memory.reclaim,
+because that would itself push the app out of memory in the middle of a measurement.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import IO, Any
+import numpy as np
+from . import cgroup
+from .sampler import Collector
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+IDLE_BITMAP = "/sys/kernel/mm/page_idle/bitmap"
+PM_PRESENT = np.uint64(1 << 63)
+PM_PFN_MASK = np.uint64((1 << 55) - 1)
+# read pagemap in chunks of this many pages so a huge mapping doesn't need a huge buffer
+CHUNK_PAGES = 1 << 18
+
+WORKINGSET_COUNTERS = [
+    "workingset_refault_anon",
+    "workingset_refault_file",
+    "workingset_activate_anon",
+    "workingset_activate_file",
+    "workingset_restore_anon",
+    "workingset_restore_file",
+]
+
+def present_pfns(pid: int) -> np.ndarray:
+    """
+    Physical frame numbers of every resident page of a process. Reading them needs CAP_SYS_ADMIN;
+    without it the kernel reports every PFN as 0.
+    """
+    pfns: list[np.ndarray] = []
+    with open(f"/proc/{pid}/maps", 'r') as maps:
+        regions = []
+        for line in maps:
+            fields = line.split()
+            # nothing can be resident in PROT_NONE reservations (V8 and PartitionAlloc make huge ones)
+            if fields[1].startswith("---") or line.rstrip().endswith("[vsyscall]"):
+                continue
+            start, end = (int(x, 16) for x in fields[0].split("-"))
+            regions.append((start // PAGE_SIZE, end // PAGE_SIZE))
+    fd = os.open(f"/proc/{pid}/pagemap", os.O_RDONLY)
+    try:
+        for first, last in regions:
+            for page in range(first, last, CHUNK_PAGES):
+                count = min(CHUNK_PAGES, last - page)
+                entries = np.frombuffer(os.pread(fd, count * 8, page * 8), dtype=np.uint64)
+                pfns.append(entries[(entries & PM_PRESENT) != 0] & PM_PFN_MASK)
+    finally:
+        os.close(fd)
+    return np.concatenate(pfns) if pfns else np.zeros(0, dtype=np.uint64)
+
+class IdleTracker:
+    def __init__(self) -> None:
+        self.fd = os.open(IDLE_BITMAP, os.O_RDWR)
+
+    def accessed_and_mark(self, pfns: np.ndarray) -> int:
+        """
+        Counts the pages among `pfns` that are not idle (were accessed since they were last
+        marked), then marks all of them idle. The bitmap has one bit per PFN in 64-bit words,
+        and can only be read and written in whole words.
+        """
+        if len(pfns) == 0:
+            return 0
+        words = (pfns >> np.uint64(6)).astype(np.int64)
+        bits = (pfns & np.uint64(63))
+        lo, hi = int(words.min()), int(words.max())
+        bitmap = np.frombuffer(os.pread(self.fd, (hi - lo + 1) * 8, lo * 8), dtype=np.uint64)
+        idle = (bitmap[words - lo] >> bits) & np.uint64(1)
+        accessed = int(len(pfns) - np.count_nonzero(idle))
+        # writing a 1 bit marks that page idle; 0 bits are left alone
+        mark = np.zeros(hi - lo + 1, dtype=np.uint64)
+        np.bitwise_or.at(mark, words - lo, np.uint64(1) << bits)
+        os.pwrite(self.fd, mark.tobytes(), lo * 8)
+        return accessed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class WorkingSetCollector(Collector):
+    """
+    Writes one line per `interval` seconds to working_set.ndjson. With idle page tracking:
+    resident bytes, bytes accessed since the previous line ("working_set") and the number of
+    distinct pages; the first line only marks pages and has no working set. Otherwise: deltas of
+    the cgroup's workingset_* counters.
+    """
+    def __init__(self, out: Path, interval: float = 5):
+        self.out = out
+        self.interval = interval
+        self.last = -float("inf")
+        self.f: IO[str] | None = None
+        self.tracker: IdleTracker | None = None
+        try:
+            self.tracker = IdleTracker()
+        except OSError:
+            pass
+        self.marked = False
+        self.counters: dict[str, int] | None = None
+        self.latest: int | None = None
+
+    def idle_tracking(self, cg: Path) -> dict[str, Any] | None:
+        assert self.tracker is not None
+        pfns: list[np.ndarray] = []
+        for pid in cgroup.procs(cg):
+            try:
+                pfns.append(present_pfns(pid))
+            except OSError:
+                pass # process exited
+        unique = np.unique(np.concatenate(pfns)) if pfns else np.zeros(0, dtype=np.uint64)
+        if len(unique) > 0 and unique[-1] == 0:
+            return None # every PFN reads as 0: we aren't allowed to see them
+        accessed = self.tracker.accessed_and_mark(unique)
+        record: dict[str, Any] = {"method": "idle_page", "resident": len(unique) * PAGE_SIZE, "pages": len(unique)}
+        if self.marked:
+            record["working_set"] = accessed * PAGE_SIZE
+            self.latest = record["working_set"]
+        self.marked = True
+        return record
+
+    def workingset_counters(self, cg: Path) -> dict[str, Any]:
+        stat = cgroup.read_flat_keyed(cg / "memory.stat")
+        counters = {k: stat[k] for k in WORKINGSET_COUNTERS if k in stat}
+        record: dict[str, Any] = {"method": "workingset_counters"}
+        if self.counters is not None:
+            record.update({k: v - self.counters.get(k, 0) for k, v in counters.items()})
+        self.counters = counters
+        return record
+
+    def sample(self, cg: Path, t: float) -> dict[str, Any] | None:
+        if t - self.last < self.interval:
+            return None
+        self.last = t
+        record = None
+        if self.tracker is not None:
+            record = self.idle_tracking(cg)
+            if record is None:
+                self.tracker.close()
+                self.tracker = None
+        if record is None:
+            record = self.workingset_counters(cg)
+        if self.f is None:
+            self.f = open(self.out / "working_set.ndjson", 'w')
+        self.f.write(json.dumps(dict(record, t=t)) + "\n")
+        return None
+
+    def finish(self, cg: Path | None) -> None:
+        if self.f is not None:
+            self.f.close()
+        if self.tracker is not None:
+            self.tracker.close()
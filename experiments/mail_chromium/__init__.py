@@ -12,8 +12,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
-import time
-import pyautogui
+from ..lib.gui import pyautogui
 from ..lib import Context
 from .. import lib
 import subprocess
@@ -22,22 +21,27 @@ def get_version() -> str:
     return str(subprocess.run(["chromium-browser", "--version"], capture_output=True).stdout)
 
 def run_experiment(ctx: Context, do_baseline: bool) -> None:
-    init_page =  "about:blank" if do_baseline else "outlook.office365.com"
+    version = get_version()
+    measure_baseline = ctx.needs_baseline("chromium", version, do_baseline)
+    init_page = "about:blank" if measure_baseline else "outlook.office365.com"
     folder = lib.get_resource("experiment_folder.png")
     margin = lib.get_resource("message_margin.png")
     header = lib.get_resource("experiment_folder_header.png")
     nothing_selected = lib.get_resource("nothing_selected.png")
-    with ctx.monitor("chromium"), ctx.start_app(["chromium-browser", "--hide-crash-restore-bubble", "--no-sandbox", init_page]):
-        if do_baseline:
+    with ctx.monitor("chromium"), ctx.start_app(ctx.browser_command("chromium", init_page)):
+        if measure_baseline:
             # wait 30 on the blank page
-            time.sleep(30)
+            ctx.measure_baseline("chromium", version)
             ctx.screenshot("blank.png")
             # navigate to outlook
             lib.load_page("chromium", 'outlook.office365.com')
-        time_remaining = 30
+        time_remaining = 30.0
         point, t = lib.locate_center_time(folder, time_remaining)
         time_remaining -= t
-        pyautogui.click(*point)
+        if not measure_baseline:
+            # otherwise the browser started long ago
+            ctx.mark_interactive()
+        time_remaining -= ctx.click(point, "folder")
 
         _point, t = lib.locate_center_time(header, time_remaining)
         time_remaining -= t
@@ -48,9 +52,9 @@ def run_experiment(ctx: Context, do_baseline: bool) -> None:
         (x, y), t = lib.locate_center_time(margin, time_remaining)
         time_remaining -= t
         pyautogui.moveTo(x+100, y+25)
-        pyautogui.click(x+100, y+25)
+        time_remaining -= ctx.click((x+100, y+25), "message")
 
-        time.sleep(time_remaining)
+        ctx.settle(time_remaining)
         ctx.screenshot("app.png")
 
 def main() -> None:
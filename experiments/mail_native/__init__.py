@@ -13,12 +13,10 @@
 # along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 from pathlib import Path
-import time
 from ..lib import App, Context
 from .. import lib
 import subprocess
 import signal
-import pyautogui
 
 def get_version() -> str:
     return str(subprocess.run(["evolution", "--version"], capture_output=True).stdout)
@@ -42,11 +40,12 @@ def run_experiment(ctx: Context, do_baseline: bool) -> None:
     die_evolution_die()
     with ctx.monitor("evolution"), ctx.start_app(["evolution"], custom_term_routine=custom_term):
         # Run experiment
-        time_remaining = 30
+        time_remaining = 30.0
 
         point, t = lib.locate_center_time(inbox_options, time_remaining)
         time_remaining -= t
-        pyautogui.click(*point)
+        ctx.mark_interactive()
+        time_remaining -= ctx.click(point, "inbox")
 
         # wait until inbox folder is highlighted/green
         _point, t = lib.locate_center_time(inbox_options[1], time_remaining)
@@ -54,11 +53,11 @@ def run_experiment(ctx: Context, do_baseline: bool) -> None:
 
         point, t = lib.locate_center_time(folder_options, time_remaining)
         time_remaining -= t
-        pyautogui.click(*point)
+        time_remaining -= ctx.click(point, "folder")
         
         # Evolution seems to automatically open the message
 
-        time.sleep(time_remaining)
+        ctx.settle(time_remaining)
         ctx.screenshot("app.png")
 
 def main() -> None:
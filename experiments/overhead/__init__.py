@@ -0,0 +1,208 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Measures how much CPU and memory the harness itself uses while a workload runs, with each
+harness component (smaps-profiler, screenshots, screen polling, logging, the cgroup sampler,
+forensic snapshots) switched off and on. Snapshots are only taken when an app gets stuck, so
+theirs is usually nothing unless -m is tight enough to make the app hang.
+
+The harness re-executes itself in its own transient scope so that its cgroup contains only
+the harness and its children (smaps-profiler, scrot); the app still runs in its own service
+like in a normal sweep. Each sample records the deltas of the harness cgroup's cpu.stat and the
+peak anon (RSS) and file (page cache) memory seen while the sample ran.
+
+A workload can't run without its locate_center_time polling, so that component is measured
+by running an extra poller next to the workload (blank_* and calendar_* don't poll at all),
+looking for a noise template that never matches.
+"""
+
+import argparse
+import importlib
+import json
+import resource
+import statistics
+import threading
+import time
+from pathlib import Path
+from typing import Any
+import numpy as np
+import cv2
+from ..lib import Context, cgroup, get_prog
+from ..lib.gui import ImageNotFoundException
+from ..lib.timeline import Periodic, timeline
+from .. import lib
+
+COMPONENTS = ["monitor", "screenshots", "locate", "logging", "sampler", "forensics"]
+
+# (name, components switched on). "none" is the reference every other config is compared to.
+CONFIGS: list[tuple[str, set[str]]] = [("none", set())] + [(c, {c}) for c in COMPONENTS] + [("all", set(COMPONENTS))]
+
+class Usage:
+    """
+    Harness resource usage, read either from our own cgroup or, if we aren't in a scope of our
+    own, from getrusage (which can only tell us about CPU time and peak RSS).
+    """
+    def __init__(self, cg: Path | None):
+        self.cg = cg
+
+    def cpu_usec(self) -> int:
+        if self.cg is not None:
+            return cgroup.read_flat_keyed(self.cg / "cpu.stat").get("usage_usec", 0)
+        usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+        return int(sum(u.ru_utime + u.ru_stime for u in usage) * 1e6)
+
+    def memory(self) -> dict[str, int]:
+        if self.cg is not None:
+            stat = cgroup.read_flat_keyed(self.cg / "memory.stat")
+            return {"anon": stat.get("anon", 0), "file": stat.get("file", 0)}
+        return {"anon": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, "file": 0}
+
+class PeakWatcher:
+    """
+    Polls harness memory twice a second on the timeline and keeps the maximum. This costs the
+    same in every config (and starts the timeline's thread in all of them), so it cancels out of
+    the per-component overheads.
+    """
+    def __init__(self, usage: Usage, interval: float = 0.5):
+        self.usage = usage
+        self.interval = interval
+        self.peak: dict[str, int] = usage.memory()
+        self.periodic: Periodic | None = None
+
+    def tick(self, t: float) -> None:
+        for key, value in self.usage.memory().items():
+            self.peak[key] = max(self.peak.get(key, 0), value)
+
+    def start(self) -> None:
+        self.periodic = timeline.every(self.interval, self.tick)
+
+    def stop(self) -> dict[str, int]:
+        if self.periodic is not None:
+            self.periodic.stop()
+        return self.peak
+
+class LocatePoller(threading.Thread):
+    def __init__(self, template: Path):
+        super().__init__(daemon=True)
+        self.template = template
+        self.stopped = threading.Event()
+        self.polls = 0
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                lib.locate_center_time(self.template, 0)
+            except ImageNotFoundException:
+                pass
+            self.polls += 1
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return self.polls
+
+def make_never_matching_template(path: Path) -> Path:
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, size=(64, 64, 3), dtype=np.uint8)
+    lib.ensure_dir_exists(path.parent)
+    cv2.imwrite(str(path), noise)
+    return path
+
+def set_components(on: set[str]) -> None:
+    """
+    Switches the harness components for a config. Must happen before the sample's Context is
+    created, since that's when its logger is set up (or disabled).
+    """
+    lib.harness.monitor = "monitor" in on
+    lib.harness.screenshots = "screenshots" in on
+    lib.harness.logging = "logging" in on
+    lib.harness.sampler = "sampler" in on
+    lib.harness.forensics = "forensics" in on
+
+def run_sample(ctx: Context, module: Any, usage: Usage, on: set[str], template: Path) -> dict[str, Any]:
+    poller = LocatePoller(template) if "locate" in on else None
+    watcher = PeakWatcher(usage)
+    cpu_before = usage.cpu_usec()
+    start = time.time()
+    watcher.start()
+    if poller is not None:
+        poller.start()
+    try:
+        module.run_experiment(ctx, do_baseline=False)
+        error = None
+    except Exception as e:
+        error = lib.format_exception(e)
+    finally:
+        polls = poller.stop() if poller is not None else 0
+        peak = watcher.stop()
+    return {
+        "cpu_usec": usage.cpu_usec() - cpu_before,
+        "wall_s": time.time() - start,
+        "peak_anon": peak["anon"],
+        "peak_file": peak["file"],
+        "locate_polls": polls,
+        "error": error,
+    }
+
+def summarize(results: dict[str, list[dict[str, Any]]]) -> dict[str, dict[str, float]]:
+    def mean(config: str, key: str) -> float:
+        values = [r[key] for r in results[config] if r["error"] is None]
+        return statistics.mean(values) if values else float("nan")
+    summary: dict[str, dict[str, float]] = {}
+    for config, _on in CONFIGS:
+        summary[config] = {}
+        for key in ["cpu_usec", "peak_anon", "peak_file"]:
+            summary[config][key] = mean(config, key)
+            summary[config][f"{key}_overhead"] = mean(config, key) - mean("none", key)
+    return summary
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog=get_prog())
+    parser.add_argument('output_directory', metavar='output-directory')
+    parser.add_argument('-w', '--workload', default="blank_firefox", help="module in the experiments package to run (default: blank_firefox)")
+    parser.add_argument('-n', '--samples', type=int, default=5, help="samples per config (default: 5)")
+    parser.add_argument('-m', '--memory-limit', type=int, default=None)
+    parser.add_argument('--no-scope', action='store_true', help="don't re-execute in a dedicated scope; only getrusage numbers are available then")
+    ns = parser.parse_args()
+
+    if not ns.no_scope:
+        cgroup.reexec_in_scope("harness-overhead")
+    usage = Usage(cgroup.own_cgroup() if cgroup.in_harness_scope() else None)
+    module = importlib.import_module(f"experiments.{ns.workload}")
+
+    results: dict[str, list[dict[str, Any]]] = {config: [] for config, _on in CONFIGS}
+    with Context.create("overhead", Path(ns.output_directory), ns.memory_limit) as top_ctx, top_ctx.get_child("out") as out_ctx:
+        template = make_never_matching_template(out_ctx.joinpath("never_matches.png"))
+        top_ctx.logger.info(f"harness cgroup: {usage.cg}")
+        config_ctxs = {config: out_ctx.get_child(config) for config, _on in CONFIGS}
+        # interleave the configs so that drift over the run doesn't favor any of them
+        for j in range(ns.samples):
+            for config, on in CONFIGS:
+                set_components(on)
+                try:
+                    with config_ctxs[config].get_child_with_sample(j) as sample_ctx:
+                        result = run_sample(sample_ctx, module, usage, on, template)
+                finally:
+                    lib.harness.set_all(True)
+                results[config].append(result)
+                top_ctx.logger.info(f"{config} {j:02d}: {result}")
+        for config_ctx in config_ctxs.values():
+            config_ctx.cleanup()
+        summary = summarize(results)
+        with top_ctx.open("overhead.json", 'w') as f:
+            json.dump({"workload": ns.workload, "mem": ns.memory_limit, "samples": results, "summary": summary}, f, indent=2)
+        for config, _on in CONFIGS:
+            s = summary[config]
+            top_ctx.logger.info(f"{config}: cpu {s['cpu_usec_overhead'] / 1e6:+.3f}s, anon {s['peak_anon_overhead'] / lib.MEBIBYTE:+.1f}MiB, file {s['peak_file_overhead'] / lib.MEBIBYTE:+.1f}MiB")
@@ -0,0 +1,223 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Packs a finished result tree (tens of thousands of small files) into a single file that copies
+fast and can be read in place: every file can be opened by its path without unpacking anything
+else.
+
+Layout of a .pack file:
+
+    MAGIC
+    blob, blob, ...     every file's bytes, zlib-compressed unless already compressed (PNGs)
+    index               zlib-compressed JSON: {"version": 1, "files": {path: [offset, length, size, method]}}
+    footer              offset and length of the index (little-endian u64 each), then FOOTER_MAGIC
+
+Files are compressed on a thread pool (zlib releases the GIL) and written in tree order, so the
+packer streams: it holds at most a few compressed files in memory at a time.
+
+Pack(path).root() gives a PackPath, which behaves enough like a pathlib.Path (/, name, parent,
+iterdir, is_dir, open, ...) that experiments.analysis reads a pack the same way as a directory.
+"""
+
+import argparse
+import io
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Any, Literal
+
+MAGIC = b"EXPACK1\n"
+FOOTER_MAGIC = b"EXPACKIX"
+FOOTER = struct.Struct("<QQ8s")
+LEVEL = 6
+# compressing these again only costs time
+STORED_SUFFIXES = {".png", ".jpg", ".gz", ".xz", ".zst"}
+
+Method = Literal["zlib", "stored"]
+
+def compress(path: Path) -> tuple[bytes, int, Method]:
+    data = path.read_bytes()
+    if path.suffix in STORED_SUFFIXES:
+        return data, len(data), "stored"
+    return zlib.compress(data, LEVEL), len(data), "zlib"
+
+def files(root: Path) -> Iterator[Path]:
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            if path.is_file() and not path.is_symlink():
+                yield path
+
+def pack(root: Path, dest: Path, threads: int = os.cpu_count() or 1) -> int:
+    """
+    Writes the tree under root to dest. Returns the number of files packed.
+    """
+    # imported here because reading a pack (which every analysis tool does) doesn't need it
+    from concurrent.futures import Future, ThreadPoolExecutor
+    index: dict[str, list[Any]] = {}
+    partial = dest.with_name(dest.name + ".partial")
+    with open(partial, 'wb') as out, ThreadPoolExecutor(threads) as pool:
+        out.write(MAGIC)
+        pending: deque[tuple[str, Future[tuple[bytes, int, Method]]]] = deque()
+
+        def drain(keep: int) -> None:
+            while len(pending) > keep:
+                name, future = pending.popleft()
+                blob, size, method = future.result()
+                index[name] = [out.tell(), len(blob), size, method]
+                out.write(blob)
+
+        for path in files(root):
+            pending.append((path.relative_to(root).as_posix(), pool.submit(compress, path)))
+            drain(4 * threads)
+        drain(0)
+        offset = out.tell()
+        blob = zlib.compress(json.dumps({"version": 1, "files": index}).encode(), LEVEL)
+        out.write(blob)
+        out.write(FOOTER.pack(offset, len(blob), FOOTER_MAGIC))
+    partial.rename(dest)
+    return len(index)
+
+class Pack:
+    """
+    Read access to a .pack file. Safe to read from several threads.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.f = open(path, 'rb')
+        size = os.fstat(self.f.fileno()).st_size
+        if size < len(MAGIC) + FOOTER.size or os.pread(self.f.fileno(), len(MAGIC), 0) != MAGIC:
+            raise ValueError(f"{path} is not a result pack")
+        offset, length, magic = FOOTER.unpack(os.pread(self.f.fileno(), FOOTER.size, size - FOOTER.size))
+        if magic != FOOTER_MAGIC:
+            raise ValueError(f"{path} is truncated")
+        index = json.loads(zlib.decompress(os.pread(self.f.fileno(), length, offset)))
+        self.index: dict[str, list[Any]] = index["files"]
+        # directory -> names of its entries; "" is the root
+        self.dirs: dict[str, list[str]] = {"": []}
+        for name in self.index:
+            child = name
+            while True:
+                parent, _, base = child.rpartition("/")
+                entries = self.dirs.get(parent)
+                new_dir = entries is None
+                if new_dir:
+                    entries = self.dirs[parent] = []
+                assert entries is not None
+                entries.append(base)
+                if not new_dir or parent == "":
+                    break
+                child = parent
+        for entries in self.dirs.values():
+            entries.sort()
+
+    def read(self, name: str) -> bytes:
+        entry = self.index.get(name)
+        if entry is None:
+            raise FileNotFoundError(f"{self.path}:{name}")
+        offset, length, _size, method = entry
+        blob = os.pread(self.f.fileno(), length, offset)
+        return zlib.decompress(blob) if method == "zlib" else blob
+
+    def root(self) -> "PackPath":
+        return PackPath(self, "")
+
+    def close(self) -> None:
+        self.f.close()
+
+    def __enter__(self) -> "Pack":
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> None:
+        self.close()
+
+class PackPath:
+    """
+    A path inside a Pack, with the read-only parts of pathlib.Path that the analysis code uses.
+    """
+    def __init__(self, pack: Pack, name: str):
+        self.pack = pack
+        self._name = name
+
+    def __truediv__(self, other: str) -> "PackPath":
+        return PackPath(self.pack, f"{self._name}/{other}" if self._name else other)
+
+    @property
+    def name(self) -> str:
+        return self._name.rpartition("/")[2]
+
+    @property
+    def parent(self) -> "PackPath":
+        return PackPath(self.pack, self._name.rpartition("/")[0])
+
+    def exists(self) -> bool:
+        return self.is_file() or self.is_dir()
+
+    def is_file(self) -> bool:
+        return self._name in self.pack.index
+
+    def is_dir(self) -> bool:
+        return self._name in self.pack.dirs
+
+    def iterdir(self) -> Iterator["PackPath"]:
+        if not self.is_dir():
+            raise NotADirectoryError(str(self))
+        for entry in self.pack.dirs[self._name]:
+            yield self / entry
+
+    def read_bytes(self) -> bytes:
+        return self.pack.read(self._name)
+
+    def read_text(self, errors: str = "strict") -> str:
+        return self.read_bytes().decode(errors=errors)
+
+    def open(self, mode: str = 'r') -> IO[Any]:
+        if mode in ('r', 'rt'):
+            return io.StringIO(self.read_text())
+        elif mode == 'rb':
+            return io.BytesIO(self.read_bytes())
+        raise ValueError(f"packs are read-only; can't open with mode {mode}")
+
+    def __lt__(self, other: "PackPath") -> bool:
+        return self._name < other._name
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, PackPath) and other.pack is self.pack and other._name == self._name
+
+    def __hash__(self) -> int:
+        return hash(self._name)
+
+    def __str__(self) -> str:
+        return f"{self.pack.path}:{self._name}"
+
+    def __repr__(self) -> str:
+        return f"PackPath({str(self)!r})"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.pack", description="Pack a result tree into one indexed file")
+    parser.add_argument('result_directory', metavar='result-directory')
+    parser.add_argument('output', nargs='?', help="default: <result-directory>.pack")
+    parser.add_argument('-j', '--threads', type=int, default=os.cpu_count() or 1)
+    ns = parser.parse_args()
+    root = Path(ns.result_directory)
+    dest = Path(ns.output) if ns.output is not None else root.with_name(root.name + ".pack")
+    n = pack(root, dest, ns.threads)
+    print(f"packed {n} files into {dest} ({dest.stat().st_size} bytes)")
@@ -0,0 +1,372 @@
+# Copyright 2025 Andrew Riachi
+# This file is part of brasswood/browser-experiments.
+# brasswood/browser-experiments is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 only.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+"""
+Re-runs only the broken cells of an existing gui-apps or browser-bench result tree, into the
+same layout. A sample is broken if its log has a traceback, if it is missing one of the
+artifacts its workload always writes (or that the harness wrote for other samples of the
+experiment), or if one of its ndjson files is empty or ends in a partial line. A sample or level that never got written is broken too, unless the sweep
+deliberately stopped before it (the app got too slow to exit, see "Refusing to reduce memory").
+
+What should exist is worked out from the current ExperimentParams (ALL_MEM, MEMS, SAMPLES, ...),
+so those need to be the same as when the tree was written.
+
+Before a cell is re-run, its previous attempt is moved to <level>/attempts/<NN>_<k> together
+with a repair.json saying why. browser-bench runs a whole level in one browser session, so the
+level's own files (cgroup.ndjson, results.json, ...) of the previous session go to
+<level>/attempts/level_<k>, and all the broken samples of a level are re-run in one new session.
+
+A sweep run with SWAP_BACKENDS has one tree per backend (<result-directory>/swap-<backend>/out);
+those are repaired under the same backend, which has to still be in SWAP_BACKENDS. Reference
+runs in <result-directory>/drift (see lib/schedule.py) are repaired too; every reference sample
+schedule.ndjson says ran should be there. Repaired runs of a gui-apps sweep are added to its
+schedule.ndjson, so the drift analysis uses the time they ran again. A tree whose sweep ran with
+the harness protected (it has a protection.json) is only repaired with PROTECT_HARNESS set, and
+then with the harness protected again.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import re
+import sys
+import time
+from itertools import groupby
+from pathlib import Path
+from typing import TYPE_CHECKING
+from .. import lib
+from ..lib import Context, RelPath
+from .. import ALL_MEM, PROTECT_HARNESS, SWAP_BACKENDS, TABS, ExperimentParams, SAMPLES, configure, run_sample
+
+if TYPE_CHECKING:
+    from .. import browser_bench
+
+STOP_MARKER = "Refusing to reduce memory"
+TRACEBACK = "Traceback (most recent call last)"
+SKIP_RE = re.compile(r"skipping (\d+):")
+
+GUI_ARTIFACTS = ["app.png"]
+BENCH_ARTIFACTS = ["benchmark.json"]
+# written only by some harnesses (older trees have no cgroup.ndjson, simulated runs no
+# smaps_profiler.ndjson), so required only if some sample of the experiment has them
+OPTIONAL_ARTIFACTS = ["cgroup.ndjson", "smaps_profiler.ndjson"]
+
+class Cell:
+    """
+    sweep: where the sweep ran, relative to the result directory ("." or swap-<backend>)
+    reference: whether this is a reference run, in the sweep's drift tree instead of out
+    """
+    def __init__(self, experiment: str, level: int, constraints: lib.Constraints, sample: int, reasons: list[str], sweep: Path = Path("."), reference: bool = False):
+        self.experiment = experiment
+        self.level = level
+        self.constraints = constraints
+        self.sample = sample
+        self.reasons = reasons
+        self.sweep = sweep
+        self.reference = reference
+
+    def tree(self) -> Path:
+        return self.sweep / (lib.DRIFT_DIR if self.reference else "out")
+
+def read_text(path: Path) -> str:
+    try:
+        return path.read_text(errors="replace")
+    except OSError:
+        return ""
+
+def truncated(path: Path) -> bool:
+    """
+    Whether an ndjson file is empty or its last line isn't a whole JSON value. Only the tail of
+    the file is read; smaps_profiler.ndjson can get big.
+    """
+    size = path.stat().st_size
+    if size == 0:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(max(0, size - 64 * 1024))
+        lines = [line for line in f.read().splitlines() if line.strip()]
+    if not lines:
+        return True
+    try:
+        json.loads(lines[-1])
+    except json.JSONDecodeError:
+        return True
+    return False
+
+def problems(sample_dir: Path, artifacts: list[str]) -> list[str]:
+    log = read_text(sample_dir / "log.txt")
+    if STOP_MARKER in log:
+        # the app got too slow here; that's a result, not a failure
+        return []
+    ret: list[str] = []
+    if TRACEBACK in log:
+        ret.append("exception")
+    for artifact in artifacts:
+        if not (sample_dir / artifact).exists():
+            ret.append(f"missing {artifact}")
+    for path in sorted(sample_dir.glob("*.ndjson")):
+        if truncated(path):
+            ret.append(f"truncated {path.name}")
+    return ret
+
+def required_artifacts(ex_dir: Path, artifacts: list[str]) -> list[str]:
+    return artifacts + [name for name in OPTIONAL_ARTIFACTS if next(ex_dir.glob(f"*/[0-9][0-9]/{name}"), None) is not None]
+
+def scan_experiment(ex_dir: Path, levels: list[lib.Constraints], samples: int, artifacts: list[str], stop_ends_sweep: bool, sweep: Path = Path(".")) -> list[Cell]:
+    """
+    stop_ends_sweep: whether a level where the app got too slow was the last level of the sweep
+    (true unless the levels come from a design, where only tighter points are skipped, and those
+    are logged as "skipping NN").
+    """
+    skipped = {int(m.group(1)) for m in SKIP_RE.finditer(read_text(ex_dir / "log.txt"))}
+    artifacts = required_artifacts(ex_dir, artifacts)
+    cells: list[Cell] = []
+    for (i, constraints) in enumerate(levels):
+        if i in skipped:
+            continue
+        level_dir = ex_dir / lib.level_name(i, constraints)
+        stopped_here = STOP_MARKER in read_text(level_dir / "log.txt")
+        for j in range(samples):
+            sample_dir = level_dir / f"{j:02d}"
+            if sample_dir.is_dir():
+                reasons = problems(sample_dir, artifacts)
+            elif stopped_here:
+                continue # the level ended early on purpose
+            else:
+                reasons = ["missing"]
+            if reasons:
+                cells.append(Cell(ex_dir.name, i, constraints, j, reasons, sweep))
+        if stopped_here and stop_ends_sweep:
+            break
+    return cells
+
+def scan_references(root: Path, sweep: Path, experiments: list[ExperimentParams]) -> list[Cell]:
+    """
+    The broken reference runs of a sweep: those schedule.ndjson says ran, and any others in its drift tree.
+    """
+    drift = root / sweep / lib.DRIFT_DIR
+    runs = {(line["experiment"], line["level"], line["sample"]) for line in lib.schedule.read_log(root / sweep) if line["reference"]}
+    # there can be more than 99 reference samples
+    for sample_dir in drift.glob("*/[0-9]*_*/[0-9]*"):
+        if sample_dir.name.isdigit():
+            runs.add((sample_dir.parent.parent.name, int(sample_dir.parent.name.split("_")[0]), int(sample_dir.name)))
+    cells: list[Cell] = []
+    for experiment, level, sample in sorted(runs):
+        params = find_params(experiment, experiments)
+        if not isinstance(params, ExperimentParams) or level >= len(params.levels()):
+            continue
+        constraints = params.levels()[level]
+        sample_dir = drift / experiment / lib.level_name(level, constraints) / f"{sample:02d}"
+        reasons = problems(sample_dir, required_artifacts(drift / experiment, GUI_ARTIFACTS)) if sample_dir.is_dir() else ["missing"]
+        if reasons:
+            cells.append(Cell(experiment, level, constraints, sample, reasons, sweep, reference=True))
+    return cells
+
+def find_params(name: str, experiments: list[ExperimentParams]) -> ExperimentParams | browser_bench.ExperimentParams | None:
+    for params in experiments:
+        if params.name() == name:
+            return params
+    # imported here because it's only needed for browser-bench trees
+    from .. import browser_bench
+    for bench_params in browser_bench.EXPERIMENTS:
+        if bench_params.name == name:
+            return bench_params
+    return None
+
+def sweeps(root: Path) -> list[Path]:
+    """
+    Where sweeps ran in a result directory, relative to it: the directory itself, or one
+    swap-<backend> per backend of SWAP_BACKENDS.
+    """
+    return [Path(".")] + sorted(Path(p.name) for p in root.glob("swap-*") if (p / "out").is_dir())
+
+def scan(root: Path, experiments: list[ExperimentParams] = ALL_MEM + TABS) -> list[Cell]:
+    from .. import browser_bench
+    cells: list[Cell] = []
+    for sweep in sweeps(root):
+        out = root / sweep / "out"
+        for ex_dir in sorted(out.iterdir()) if out.is_dir() else []:
+            if not ex_dir.is_dir():
+                continue
+            params = find_params(ex_dir.name, experiments)
+            if isinstance(params, ExperimentParams):
+                cells += scan_experiment(ex_dir, params.levels(), SAMPLES, GUI_ARTIFACTS, params.design is None, sweep)
+            elif params is not None:
+                cells += scan_experiment(ex_dir, [lib.Constraints(mem) for mem in params.mems], browser_bench.SAMPLES, BENCH_ARTIFACTS, True, sweep)
+        cells += scan_references(root, sweep, experiments)
+    return cells
+
+def swap_backend(sweep: Path) -> lib.SwapBackend | None:
+    """
+    The backend of SWAP_BACKENDS a sweep ran under, None for one that left swap alone.
+    """
+    if sweep == Path("."):
+        return None
+    for backend in SWAP_BACKENDS or []:
+        if f"swap-{backend.name()}" == sweep.name:
+            return backend
+    raise Exception(f"{sweep} ran under a swap backend that isn't in SWAP_BACKENDS (see its swap.json); add it there to repair it")
+
+def harness_protection(root: Path, cells: list[Cell], experiments: list[ExperimentParams]) -> lib.HarnessProtection | None:
+    """
+    PROTECT_HARNESS (of browser_bench, for a browser-bench tree) if the sweep ran with the harness
+    protected, None if it didn't.
+    """
+    from .. import browser_bench
+    if not (root / "protection.json").exists():
+        return None
+    gui = any(isinstance(find_params(cell.experiment, experiments), ExperimentParams) for cell in cells)
+    protection = PROTECT_HARNESS if gui else browser_bench.PROTECT_HARNESS
+    if protection is None:
+        raise Exception(f"{root} ran with the harness protected (see its protection.json); set PROTECT_HARNESS to repair it")
+    return protection
+
+def next_attempt(attempts: Path, prefix: str) -> Path:
+    k = 1
+    while (attempts / f"{prefix}_{k}").exists():
+        k += 1
+    return attempts / f"{prefix}_{k}"
+
+def set_aside(level_dir: Path, cell: Cell) -> None:
+    """
+    Moves a sample's previous attempt out of the way, so the re-run starts from an empty directory.
+    """
+    sample_dir = level_dir / f"{cell.sample:02d}"
+    if not sample_dir.exists():
+        return
+    dest = next_attempt(level_dir / "attempts", f"{cell.sample:02d}")
+    lib.ensure_dir_exists(dest.parent)
+    sample_dir.rename(dest)
+    with open(dest / "repair.json", 'w') as f:
+        json.dump({"reasons": cell.reasons, "time": time.time()}, f, indent=2)
+
+def set_aside_level(level_dir: Path) -> None:
+    """
+    Moves the files a browser session writes into its level directory out of the way.
+    """
+    if not level_dir.exists():
+        return
+    files = [p for p in level_dir.iterdir() if p.is_file() and p.name not in ("log.txt", "constraints.json")]
+    if not files:
+        return
+    dest = next_attempt(level_dir / "attempts", "level")
+    lib.ensure_dir_exists(dest)
+    for path in files:
+        path.rename(dest / path.name)
+
+def by_level(cells: list[Cell]) -> list[tuple[int, lib.Constraints, list[Cell]]]:
+    return [(i, group[0].constraints, group) for i, group in ((i, list(g)) for i, g in groupby(cells, key=lambda c: c.level))]
+
+def repair_gui(tree_ctx: Context, params: ExperimentParams, cells: list[Cell], log: lib.ScheduleLog) -> None:
+    """
+    tree_ctx: the sweep's out or drift directory
+    """
+    lib.metrics.start_experiment(lib.DRIFT_DIR if cells[0].reference else params.name())
+    with tree_ctx.get_child(params.name()) as ex_ctx:
+        too_slow: list[lib.Constraints] = []
+        for (i, constraints, level_cells) in by_level(cells):
+            if any(constraints.at_least_as_tight(c) for c in too_slow):
+                ex_ctx.logger.info(f"not repairing {i:02d}: at least as constrained as a point where the application took too long to exit")
+                continue
+            took_long_time = False
+            with ex_ctx.get_child_with_constraints(i, constraints) as mem_ctx:
+                for cell in level_cells:
+                    set_aside(mem_ctx.base_path, cell)
+                    start = time.time()
+                    with mem_ctx.get_child_with_sample(cell.sample) as sample_ctx:
+                        sample_ctx.logger.info(f"repairing ({', '.join(cell.reasons)})")
+                        took_long_time = run_sample(params, sample_ctx)
+                    log.write(lib.schedule.Run(cell.experiment, cell.level, cell.sample, cell.reference), start, "too_slow" if took_long_time else "done")
+                    if took_long_time:
+                        break
+            if took_long_time:
+                too_slow.append(constraints)
+
+def repair_bench(out_ctx: Context, params: browser_bench.ExperimentParams, cells: list[Cell]) -> None:
+    from .. import browser_bench
+    lib.metrics.start_experiment(params.name)
+    buttons = browser_bench.Buttons(params.name)
+    with out_ctx.get_child(params.name) as browser_ctx:
+        for (i, constraints, level_cells) in by_level(cells):
+            level_dir = browser_ctx.base_path / lib.level_name(i, constraints)
+            set_aside_level(level_dir)
+            for cell in level_cells:
+                set_aside(level_dir, cell)
+            with browser_ctx.get_child_with_mem(i, constraints.mem) as mem_ctx:
+                mem_ctx.logger.info(f"repairing samples {', '.join(f'{c.sample:02d}' for c in level_cells)}")
+                if not browser_bench.run_level(params, mem_ctx, [c.sample for c in level_cells], buttons):
+                    break
+
+def repair_sweep(sweep_ctx: Context, cells: list[Cell], experiments: list[ExperimentParams]) -> None:
+    """
+    Re-runs the cells of one sweep, sweep_ctx being where it ran.
+    """
+    log = lib.ScheduleLog(sweep_ctx.base_path)
+    for (tree, name), group in groupby(cells, key=lambda c: (c.tree(), c.experiment)):
+        params = find_params(name, experiments)
+        with sweep_ctx.get_child(tree.name) as tree_ctx:
+            if isinstance(params, ExperimentParams):
+                repair_gui(tree_ctx, params, list(group), log)
+            elif params is not None:
+                repair_bench(tree_ctx, params, list(group))
+
+def repair(root: Path, cells: list[Cell], experiments: list[ExperimentParams] = ALL_MEM + TABS) -> None:
+    from .. import browser_bench
+    # refuse before anything is moved or re-run
+    backends = {sweep: swap_backend(sweep) for sweep in dict.fromkeys(c.sweep for c in cells)}
+    protection = harness_protection(root, cells, experiments)
+    if protection is not None:
+        protection.enter()
+    logger = lib.get_logger("repair", root, RelPath("repair_log.txt"))
+    logger.addHandler(lib.metrics)
+    planned: dict[str, int] = {}
+    for cell in cells:
+        name = lib.DRIFT_DIR if cell.reference else cell.experiment
+        planned[name] = planned.get(name, 0) + 1
+    lib.metrics.plan(planned)
+    with Context("repair", root, logger, None) as top_ctx:
+        params_list = [find_params(name, experiments) for name in dict.fromkeys(c.experiment for c in cells)]
+        if any(isinstance(params, ExperimentParams) for params in params_list):
+            configure(top_ctx.settings)
+        if any(isinstance(params, browser_bench.ExperimentParams) for params in params_list):
+            browser_bench.configure(top_ctx.settings)
+        if protection is not None:
+            top_ctx.settings.protection = protection
+            for warning in protection.warnings():
+                top_ctx.logger.warning(f"harness protection: {warning}")
+        for sweep, group in groupby(cells, key=lambda c: c.sweep):
+            backend = backends[sweep]
+            if backend is None:
+                repair_sweep(top_ctx, list(group), experiments)
+                continue
+            with lib.ActiveSwap(backend) as swap, top_ctx.get_child(sweep.name) as sweep_ctx:
+                sweep_ctx.logger.info(f"swap backend {backend.name()} set up for repairing")
+                top_ctx.settings.swap = swap
+                try:
+                    repair_sweep(sweep_ctx, list(group), experiments)
+                finally:
+                    top_ctx.settings.swap = None
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m experiments.repair", description="Re-run the failed or missing samples of a result tree")
+    parser.add_argument('result_directory', metavar='result-directory')
+    parser.add_argument('--dry-run', action='store_true', help="only list the samples that would be re-run")
+    ns = parser.parse_args()
+    root = Path(ns.result_directory)
+    cells = scan(root)
+    out = sys.stdout
+    for cell in cells:
+        out.write("\t".join([str(cell.tree()), cell.experiment, lib.level_name(cell.level, cell.constraints), f"{cell.sample:02d}", ", ".join(cell.reasons)]) + "\n")
+    if not ns.dry_run and cells:
+        repair(root, cells)
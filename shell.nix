@@ -23,6 +23,7 @@ python3Packages.buildPythonPackage rec {
   pyproject = true;
   propagatedBuildInputs = with python3Packages; [
     opencv-python
+    numpy
     pyautogui
     tkinter
     humanize